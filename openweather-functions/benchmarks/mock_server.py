@@ -0,0 +1,90 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Self
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.synthetic import RowGenerator, load_templates
+from src.utils.types import AvailableEndpoints, DictRow
+
+
+ENDPOINT_PATHS: dict[str, AvailableEndpoints] = {
+    "/data/2.5/history/city": "weather",
+    "/data/2.5/air_pollution/history": "air_pollution",
+}
+
+# Longest range returned by a single history call
+MAX_SECONDS_PER_CALL = 7 * 86400
+
+
+class MockOpenWeatherServer:
+
+    def __init__(
+        self,
+        hours_per_day: int = 24,
+        templates: dict[AvailableEndpoints, list[DictRow]] | None = None,
+    ) -> None:
+        templates = templates or load_templates()
+        self.generators = {
+            endpoint: RowGenerator(rows, hours_per_day)
+            for endpoint, rows in templates.items()
+        }
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.rows_served = 0
+        self.bytes_served = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._get_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def get_endpoint_urls(self) -> dict[AvailableEndpoints, str]:
+        return {endpoint: self.url + path for path, endpoint in ENDPOINT_PATHS.items()}
+
+    def __enter__(self) -> Self:
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, path: str, query: dict[str, list[str]]) -> bytes | None:
+        if path not in ENDPOINT_PATHS:
+            return None
+
+        start = int(query["start"][0])
+        end = min(int(query["end"][0]), start + MAX_SECONDS_PER_CALL - 1)
+        with self.lock:
+            rows = self.generators[ENDPOINT_PATHS[path]].generate(start, end)
+            body = json.dumps({"list": rows}).encode()
+            self.calls += 1
+            self.rows_served += len(rows)
+            self.bytes_served += len(body)
+        return body
+
+    def _get_handler(self) -> type[BaseHTTPRequestHandler]:
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                body = mock.respond(url.path, parse_qs(url.query))
+                if body is None:
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,533 @@
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Any, Callable, Generator
+
+import duckdb
+
+from benchmarks.mock_server import MockOpenWeatherServer
+from benchmarks.synthetic import ENDPOINTS, load_templates, make_cities, write_raw_layer
+from src.destinations.adls import ADLS
+from src.destinations.base_destination import BaseDestination
+from src.destinations.fake_adls import FakeDataLakeServiceClient
+from src.destinations.local_directory import LocalDirectory
+from src.ingest.openweather import OpenWeather
+from src.transform.flattener import Flattener
+from src.transform.transformer import Transformer
+from src.utils.duckdb_profile import DuckDBProfile
+from src.utils.timestamp import Timestamp
+from src.utils.types import Batch
+
+
+FUNCTIONS_DIR = Path(__file__).parents[1]
+DEFAULT_BASELINE = FUNCTIONS_DIR / "benchmarks" / "baseline.json"
+FAKE_CONTAINER = "benchmark"
+
+# Results are only comparable when obtained with the same configuration
+SCALE_CONFIG = (
+    "cities",
+    "days",
+    "hours",
+    "destination",
+    "latency_ms",
+    "bandwidth_mbps",
+)
+STAGES = ("ingest", "read_tables", "stage", "transform")
+MODELS = [
+    ("sql/silver/weather_parsed.sql", "silver"),
+    ("sql/silver/weather__weather_parsed.sql", "silver"),
+    ("sql/silver/air_pollution_parsed.sql", "silver"),
+    ("sql/silver/weather_rich.sql", "silver"),
+    ("sql/silver/weather_daily.sql", "silver"),
+    ("sql/silver/air_pollution_daily.sql", "silver"),
+    ("sql/gold/daily_general_report.sql", "gold"),
+    ("sql/ml/rain_prediction.sql", "ml"),
+]
+
+
+@dataclass
+class StageResult:
+    stage: str
+    seconds: float
+    min_seconds: float
+    rows: int
+    bytes: int
+    peak_memory_mb: float
+    peak_rss_increase_mb: float | None
+    api_calls: int | None = None
+
+    @property
+    def rows_per_s(self) -> float:
+        return self.rows / self.seconds
+
+    @property
+    def mb_per_s(self) -> float:
+        return self.bytes / 1024**2 / self.seconds
+
+
+class PreloadedDirectory(LocalDirectory):
+    # Serves files read beforehand, to measure flattening without disk reads
+
+    def __init__(self, directory: Path, files: dict[str, list[tuple[str, Batch]]]):
+        super().__init__(directory)
+        self.files = files
+
+    def iterate_data_in_files(
+        self, dir: Path | str = ".", *_: Any, **__: Any
+    ) -> Generator[tuple[str, Batch], None, None]:
+        yield from self.files.pop(str(dir))
+
+
+class RssSampler:
+    # Samples the resident memory of the process, which also accounts for the
+    # memory allocated natively by duckdb and polars (invisible to tracemalloc)
+
+    def __init__(self, interval_s: float = 0.005) -> None:
+        self.interval_s = interval_s
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.start_rss = self.peak_rss = self.get_rss()
+
+    @staticmethod
+    def get_rss() -> int | None:
+        try:
+            with open("/proc/self/statm", "r") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            return None
+
+    def sample(self):
+        while not self.stop.wait(self.interval_s):
+            self.peak_rss = max(self.peak_rss, self.get_rss())
+
+    @property
+    def peak_increase_mb(self) -> float | None:
+        if self.start_rss is None:
+            return None
+        return (self.peak_rss - self.start_rss) / 1024**2
+
+    def __enter__(self) -> "RssSampler":
+        if self.start_rss is not None:
+            self.thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop.set()
+        if self.thread.is_alive():
+            self.thread.join()
+            self.peak_rss = max(self.peak_rss, self.get_rss())
+
+
+def get_dir_size(dir: Path) -> int:
+    return sum(path.stat().st_size for path in dir.rglob("*") if path.is_file())
+
+
+def measure[
+    T
+](
+    stage: str,
+    setup: Callable[[], T],
+    run: Callable[[T], tuple[int, int]],
+    repeat: int,
+) -> StageResult:
+    timings = []
+    rss_increases = []
+    for _ in range(repeat):
+        state = setup()
+        with RssSampler() as sampler:
+            start = time.perf_counter()
+            rows, size = run(state)
+            timings.append(time.perf_counter() - start)
+        rss_increases.append(sampler.peak_increase_mb)
+
+    # Memory is traced in a separate run, as tracing slows down execution
+    state = setup()
+    tracemalloc.start()
+    try:
+        run(state)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return StageResult(
+        stage=stage,
+        seconds=statistics.median(timings),
+        min_seconds=min(timings),
+        rows=rows,
+        bytes=size,
+        peak_memory_mb=peak_memory / 1024**2,
+        peak_rss_increase_mb=None if None in rss_increases else max(rss_increases),
+    )
+
+
+class Benchmark:
+
+    def __init__(
+        self,
+        work_dir: Path,
+        cities: int,
+        days: int,
+        hours_per_day: int,
+        start_date: datetime.date,
+        service_client: FakeDataLakeServiceClient | None = None,
+        duckdb_profile: DuckDBProfile | None = None,
+        async_reads: bool = False,
+    ) -> None:
+        self.work_dir = work_dir
+        self.cities = make_cities(cities)
+        self.days = days
+        self.hours_per_day = hours_per_day
+        self.start_date = start_date
+        self.templates = load_templates()
+        self.raw_rows = len(self.cities) * len(ENDPOINTS) * days * hours_per_day
+        self.duckdb_profile = duckdb_profile or DuckDBProfile.from_host()
+
+        # When given, data is kept in a fake ADLS instead of local directories
+        self.service_client = service_client
+        self.async_reads = async_reads
+        if service_client is not None:
+            self.file_system = service_client.create_file_system(FAKE_CONTAINER)
+
+    def get_destination(self, name: str, reset: bool = False) -> BaseDestination:
+        if self.service_client is None:
+            if reset:
+                shutil.rmtree(self.work_dir / name, ignore_errors=True)
+            return LocalDirectory(self.work_dir / name)
+
+        if reset:
+            self.file_system.delete_paths(name)
+        destination = ADLS(
+            container=FAKE_CONTAINER,
+            directory=name,
+            service_client=self.service_client,
+        )
+        return destination.set_async_reads() if self.async_reads else destination
+
+    def get_size(self, name: str) -> int:
+        if self.service_client is None:
+            return get_dir_size(self.work_dir / name)
+        return sum(
+            len(content)
+            for path, content in self.file_system.files.items()
+            if path.startswith(name + "/")
+        )
+
+    def exists(self, name: str) -> bool:
+        if self.service_client is None:
+            return (self.work_dir / name).exists()
+        return name in self.file_system.directories
+
+    def prepare_raw(self):
+        if not self.exists("raw"):
+            write_raw_layer(
+                self.get_destination("raw"),
+                self.cities,
+                self.start_date,
+                self.days,
+                self.hours_per_day,
+                self.templates,
+            )
+
+    def prepare_bronze(self):
+        self.prepare_raw()
+        if not self.exists("bronze"):
+            self.stage(self.get_destination("bronze"))
+
+    def measure[
+        T
+    ](
+        self,
+        stage: str,
+        setup: Callable[[], T],
+        run: Callable[[T], tuple[int, int]],
+        repeat: int,
+    ) -> StageResult:
+        if self.service_client is None:
+            return measure(stage, setup, run, repeat)
+
+        # Count the API calls of a single run of the stage
+        def counted_setup() -> T:
+            state = setup()
+            self.service_client.reset_stats()
+            return state
+
+        result = measure(stage, counted_setup, run, repeat)
+        result.api_calls = self.service_client.get_stats()["total_calls"]
+        return result
+
+    def ingest(self, repeat: int) -> StageResult:
+        end_date = self.start_date + datetime.timedelta(days=self.days - 1)
+
+        with MockOpenWeatherServer(self.hours_per_day, self.templates) as server:
+
+            def setup() -> OpenWeather:
+                open_weather = (
+                    OpenWeather(secret="benchmark")
+                    .set_destinations([self.get_destination("ingest", reset=True)])
+                    .set_date_range(
+                        Timestamp(self.start_date),
+                        Timestamp(end_date).get_as_end(),
+                    )
+                )
+                for endpoint, url in server.get_endpoint_urls().items():
+                    open_weather.endpoint_config[endpoint]["url"] = url
+                open_weather.locations = self.cities
+                return open_weather
+
+            def run(open_weather: OpenWeather) -> tuple[int, int]:
+                rows, size = server.rows_served, server.bytes_served
+                open_weather.fetch()
+                return server.rows_served - rows, server.bytes_served - size
+
+            return self.measure("ingest", setup, run, repeat)
+
+    def read_tables(self, repeat: int) -> StageResult:
+        self.prepare_raw()
+        source = self.get_destination("raw")
+
+        def setup() -> PreloadedDirectory:
+            return PreloadedDirectory(
+                self.work_dir / "preloaded",
+                {
+                    endpoint: list(source.iterate_data_in_files(endpoint))
+                    for endpoint in ENDPOINTS
+                },
+            )
+
+        def run(preloaded: PreloadedDirectory) -> tuple[int, int]:
+            rows = 0
+            for endpoint in ENDPOINTS:
+                tables = preloaded.read_tables_from_dir(endpoint, endpoint)
+                rows += sum(len(table) for table in tables.values())
+            return rows, self.get_size("raw")
+
+        return self.measure("read_tables", setup, run, repeat)
+
+    def stage(self, target: BaseDestination):
+        (
+            Flattener()
+            .set_source(self.get_destination("raw"))
+            .set_target(target)
+            .set_directories_to_parse(*ENDPOINTS)
+            .set_identifier("benchmark", "staged_id")
+            .set_modified_at_column("staged_at")
+            .flatten()
+        )
+
+    def staging(self, repeat: int) -> StageResult:
+        self.prepare_raw()
+
+        def setup() -> BaseDestination:
+            return self.get_destination("stage", reset=True)
+
+        def run(target: BaseDestination) -> tuple[int, int]:
+            self.stage(target)
+            return self.raw_rows, self.get_size("raw")
+
+        return self.measure("stage", setup, run, repeat)
+
+    def transform(self, repeat: int) -> StageResult:
+        self.prepare_bronze()
+        bronze = self.get_destination("bronze")
+        bronze_rows = sum(
+            relation.shape[0]
+            for _, relation in bronze.iter_dir_as_relations(duckdb.connect())
+        )
+
+        def setup() -> Transformer:
+            targets = {
+                name: self.get_destination(name, reset=True)
+                for name in ("silver", "gold", "ml")
+            }
+            return (
+                Transformer(duckdb.connect())
+                .set_resource_profile(self.duckdb_profile)
+                .set_models(
+                    [(FUNCTIONS_DIR / path, targets[target]) for path, target in MODELS]
+                )
+            )
+
+        def run(transformer: Transformer) -> tuple[int, int]:
+            transformer.import_tables_from_dir(bronze).execute()
+            return bronze_rows, self.get_size("bronze")
+
+        return self.measure("transform", setup, run, repeat)
+
+    def run(self, stages: list[str], repeat: int) -> list[StageResult]:
+        benchmarks = {
+            "ingest": self.ingest,
+            "read_tables": self.read_tables,
+            "stage": self.staging,
+            "transform": self.transform,
+        }
+        return [benchmarks[stage](repeat) for stage in stages]
+
+
+def compare(
+    results: list[StageResult], baseline: dict[str, Any], tolerance: float
+) -> list[str]:
+    regressions = []
+    baseline_stages = {stage["stage"]: stage for stage in baseline["stages"]}
+    for result in results:
+        if result.stage not in baseline_stages:
+            continue
+        for metric in ("seconds", "peak_memory_mb"):
+            old = baseline_stages[result.stage][metric]
+            new = getattr(result, metric)
+            if old and new > old * (1 + tolerance):
+                regressions.append(
+                    f"{result.stage} {metric}: {old:.3f} -> {new:.3f} "
+                    f"(+{(new / old - 1) * 100:.1f}%)"
+                )
+    return regressions
+
+
+def print_results(results: list[StageResult], baseline: dict[str, Any] | None):
+    baseline_stages = (
+        {stage["stage"]: stage for stage in baseline["stages"]} if baseline else {}
+    )
+    print(
+        f"{'stage':<12} {'seconds':>9} {'rows/s':>12} {'MB/s':>9} "
+        f"{'peak MB':>9} {'RSS +MB':>9} {'API calls':>9} {'vs baseline':>12}"
+    )
+    for result in results:
+        change = ""
+        if result.stage in baseline_stages:
+            old = baseline_stages[result.stage]["seconds"]
+            change = f"{(result.seconds / old - 1) * 100:+.1f}%"
+        print(
+            f"{result.stage:<12} {result.seconds:>9.3f} {result.rows_per_s:>12,.0f} "
+            f"{result.mb_per_s:>9.2f} {result.peak_memory_mb:>9.1f} "
+            f"{result.peak_rss_increase_mb or 0:>9.1f} "
+            f"{'-' if result.api_calls is None else result.api_calls:>9} {change:>12}"
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser("OpenWeather Pipeline Benchmarks")
+
+    parser.add_argument("--cities", "-c", type=int, default=17)
+    parser.add_argument("--days", "-d", type=int, default=7)
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--start-date", "-sd", default="2025-12-01")
+    parser.add_argument("--stages", "-s", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--repeat", "-r", type=int, default=3)
+    parser.add_argument("--work-dir", "-w")
+    parser.add_argument("--baseline", "-b", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true")
+    # Measures without comparing, i.e. at other scales than the baseline's
+    parser.add_argument("--no-baseline", action="store_true")
+    parser.add_argument("--tolerance", "-t", type=float, default=0.1)
+    parser.add_argument("--output", "-o")
+    parser.add_argument("--fake-adls", action="store_true")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--bandwidth-mbps", type=float)
+    # Reads data files of the fake ADLS with `AsyncADLS`
+    parser.add_argument("--async-reads", action="store_true")
+    # Transform with a lower memory limit than the host's, to measure spilling
+    parser.add_argument("--duckdb-memory-limit-mb", type=int)
+    args = parser.parse_args()
+
+    duckdb_profile = DuckDBProfile.from_host()
+    if args.duckdb_memory_limit_mb:
+        duckdb_profile = replace(
+            duckdb_profile, memory_limit_mb=args.duckdb_memory_limit_mb
+        )
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    config = {
+        "cities": args.cities,
+        "days": args.days,
+        "hours": args.hours,
+        "start_date": args.start_date,
+        "repeat": args.repeat,
+        "destination": (
+            ("async_fake_adls" if args.async_reads else "fake_adls")
+            if args.fake_adls
+            else "local_directory"
+        ),
+        "latency_ms": args.latency_ms,
+        "bandwidth_mbps": args.bandwidth_mbps,
+        "duckdb": asdict(duckdb_profile),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+    # The baseline is checked before measuring, a run that can not be compared fails
+    baseline_path = Path(args.baseline)
+    baseline = None
+    if not (args.save_baseline or args.no_baseline):
+        if not baseline_path.exists():
+            sys.exit(
+                f"Baseline {baseline_path} not found. Store one with --save-baseline "
+                "or measure without comparing with --no-baseline"
+            )
+        with open(baseline_path, "r") as f:
+            baseline = json.load(f)
+
+        scale = {k: baseline["config"].get(k) for k in SCALE_CONFIG}
+        if scale != {k: config[k] for k in scale}:
+            sys.exit(
+                f"Baseline {baseline_path} has a different config {scale}. Give the "
+                "baseline of this config with --baseline or measure without "
+                "comparing with --no-baseline"
+            )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = Path(args.work_dir) if args.work_dir else Path(tmp_dir)
+        results = Benchmark(
+            work_dir,
+            args.cities,
+            args.days,
+            args.hours,
+            datetime.date.fromisoformat(args.start_date),
+            (
+                FakeDataLakeServiceClient(
+                    latency_s=args.latency_ms / 1000,
+                    bandwidth_mbps=args.bandwidth_mbps,
+                )
+                if args.fake_adls
+                else None
+            ),
+            duckdb_profile,
+            args.async_reads,
+        ).run(list(args.stages), args.repeat)
+
+    report = {
+        "config": config,
+        "stages": [
+            asdict(result)
+            | {"rows_per_s": result.rows_per_s, "mb_per_s": result.mb_per_s}
+            for result in results
+        ],
+    }
+
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(baseline_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {baseline_path}")
+    elif baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,327 @@
+import datetime
+import importlib
+import inspect
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Any, Callable
+
+
+FUNCTIONS_DIR = Path(__file__).parents[1]
+DEFAULT_BASELINE = FUNCTIONS_DIR / "benchmarks" / "startup_baseline.json"
+FAKE_CONTAINER = "benchmark"
+
+# Routes of `function_app`, the queue triggered one named after its function
+ROUTES = (
+    "ingest-openweather",
+    "plan-openweather",
+    "ingest-openweather-item",
+    "stage-openweather",
+    "compact-openweather",
+    "transform-openweather",
+    "pipeline-openweather",
+)
+# Layers of the fake ADLS. Ingestion routes find no locations to fetch and the work
+# item is already completed, so every route runs offline
+LAYERS = ("raw", "bronze", "locations")
+WORK_ITEM = {
+    "item_id": "startup/weather/startup/2025-12-01_2025-12-07",
+    "ingestion_id": "startup",
+    "endpoint": "weather",
+    "location": {"search_name": "startup", "country_code": "ES"},
+    "start_date": 1764547200,
+    "end_date": 1765151999,
+}
+# Loaded by the benchmark to fake ADLS, not by the routes
+HARNESS_MODULES = ("src.destinations.fake_adls",)
+HEAVY_MODULES = ("duckdb", "polars", "pyarrow", "azure.identity")
+# Modules that must not be loaded by a route, whatever the timings
+FORBIDDEN_MODULES = {
+    "ingest-openweather": ("duckdb", "polars", "pyarrow"),
+    "plan-openweather": ("duckdb", "polars", "pyarrow"),
+    "ingest-openweather-item": ("duckdb", "polars", "pyarrow"),
+    "compact-openweather": ("duckdb", "polars", "pyarrow"),
+}
+METRICS = ("import_ms", "route_import_ms", "first_request_ms")
+
+
+def load_fake_adls(work_dir: Path):
+    # Files written beforehand by the parent process, as the fake ADLS only lives
+    # in memory. Loading them imports the ADLS destination before the first request
+    from src.destinations.adls import ADLS
+    from src.destinations.fake_adls import FakeDataLakeServiceClient
+
+    service_client = FakeDataLakeServiceClient()
+    file_system = service_client.create_file_system(FAKE_CONTAINER)
+    for layer in LAYERS:
+        for path in (work_dir / layer).rglob("*"):
+            name = path.relative_to(work_dir).as_posix()
+            if path.is_dir():
+                file_system.add_directory(name)
+            else:
+                file_system.files[name] = path.read_bytes()
+
+    os.environ["AZURE_CONTAINER_NAME"] = FAKE_CONTAINER
+    os.environ.setdefault("AZURE_ACCOUNT_NAME", service_client.account_name)
+    os.environ.setdefault("OPENWEATHER_SECRET_KEY", "startup")
+    ADLS.service_clients[(os.environ["AZURE_ACCOUNT_NAME"], None, None, None)] = (
+        service_client
+    )
+
+
+def get_handler(app: Any, route: str) -> Callable[..., Any]:
+    # Functions are built once per app, building them again fails
+    return next(
+        function.get_user_function()
+        for function in app.get_functions()
+        if getattr(function.get_trigger(), "route", None) == route
+        or function.get_function_name() == route.replace("-", "_")
+    )
+
+
+def call_route(handler: Callable[..., Any], route: str):
+    # Calls the function of the route as the host would, with its bindings
+    import azure.functions as func
+
+    class Out(func.Out):
+        def set(self, val: Any):
+            self.value = val
+
+        def get(self) -> Any:
+            return self.value
+
+    bindings = {
+        "req": func.HttpRequest(
+            "GET", f"/api/{route}", body=b"", headers={"run_id": "startup"}
+        ),
+        "message": func.QueueMessage(body=json.dumps(WORK_ITEM).encode()),
+    }
+    response = handler(
+        **{
+            name: bindings.get(name, Out())
+            for name in inspect.signature(handler).parameters
+        }
+    )
+    if response is not None and response.status_code != 200:
+        raise RuntimeError(f"{route} failed: {response.get_body().decode()}")
+
+
+def discover_route_modules(route: str, work_dir: Path) -> list[str]:
+    # Modules loaded by a call to the route, in the order they were imported. The
+    # modules imported inside the route or lazily by its steps are all found
+    import function_app
+
+    loaded = set(sys.modules)
+    load_fake_adls(work_dir)
+    call_route(get_handler(function_app.app, route), route)
+    return [
+        module
+        for module in sys.modules
+        if module not in loaded and module not in HARNESS_MODULES
+    ]
+
+
+def measure_route(route: str, work_dir: Path) -> dict[str, Any]:
+    # Runs in a fresh interpreter, so every import is a cold one
+    with open(work_dir / "route_modules.json", "r") as f:
+        route_modules: list[str] = json.load(f)[route]
+
+    start = time.perf_counter()
+    import function_app
+
+    result: dict[str, Any] = {
+        "route": route,
+        "import_ms": (time.perf_counter() - start) * 1000,
+        "loaded_at_import": [m for m in HEAVY_MODULES if m in sys.modules],
+    }
+
+    start = time.perf_counter()
+    for module in route_modules:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            # Aliases registered in `sys.modules` under a name of their own
+            pass
+    result["route_import_ms"] = (time.perf_counter() - start) * 1000
+    result["loaded_by_route"] = [m for m in HEAVY_MODULES if m in sys.modules]
+
+    load_fake_adls(work_dir)
+    handler = get_handler(function_app.app, route)
+    for metric in ("first_request_ms", "warm_request_ms"):
+        start = time.perf_counter()
+        call_route(handler, route)
+        result[metric] = (time.perf_counter() - start) * 1000
+
+    return result
+
+
+def prepare_layers(work_dir: Path, cities: int, days: int):
+    from benchmarks.run import Benchmark
+
+    Benchmark(
+        work_dir, cities, days, 24, datetime.date.fromisoformat("2025-12-01")
+    ).prepare_bronze()
+
+    (work_dir / "locations").mkdir(exist_ok=True)
+    (work_dir / "locations" / "locations.json").write_text("[]")
+    marker = work_dir / "raw" / "_work_items" / f"{WORK_ITEM['item_id']}.json"
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    marker.write_text(json.dumps(WORK_ITEM))
+
+
+def run_child(mode: str, route: str, work_dir: Path) -> Any:
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--child", mode, route]
+        + [str(work_dir)],
+        cwd=FUNCTIONS_DIR,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def summarize(runs: list[dict[str, Any]]) -> dict[str, Any]:
+    summary = {k: v for k, v in runs[0].items() if not k.endswith("_ms")}
+    for metric in runs[0]:
+        if metric.endswith("_ms"):
+            summary[metric] = statistics.median(run[metric] for run in runs)
+    return summary
+
+
+def compare(
+    results: list[dict[str, Any]], baseline: dict[str, Any], tolerance: float
+) -> list[str]:
+    regressions = []
+    for result in results:
+        for module in FORBIDDEN_MODULES.get(result["route"], ()):
+            if module in result["loaded_by_route"]:
+                regressions.append(f"{result['route']} loads {module}")
+
+    baseline_routes = {route["route"]: route for route in baseline.get("routes", [])}
+    for result in results:
+        if result["route"] not in baseline_routes:
+            continue
+        for metric in METRICS:
+            old = baseline_routes[result["route"]].get(metric)
+            new = result.get(metric)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(
+                    f"{result['route']} {metric}: {old:.1f} -> {new:.1f} "
+                    f"(+{(new / old - 1) * 100:.1f}%)"
+                )
+    return regressions
+
+
+def print_results(results: list[dict[str, Any]]):
+    print(
+        f"{'route':<24} {'import ms':>10} {'route ms':>10} {'1st req ms':>11} "
+        f"{'warm ms':>9}  loaded by route"
+    )
+    for result in results:
+        print(
+            f"{result['route']:<24} {result['import_ms']:>10.1f} "
+            f"{result['route_import_ms']:>10.1f} "
+            f"{result.get('first_request_ms', float('nan')):>11.1f} "
+            f"{result.get('warm_request_ms', float('nan')):>9.1f}  "
+            f"{', '.join(result['loaded_by_route']) or '-'}"
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser("OpenWeather Function Startup Benchmark")
+
+    parser.add_argument("--routes", nargs="+", choices=ROUTES, default=ROUTES)
+    parser.add_argument("--repeat", "-r", type=int, default=5)
+    parser.add_argument("--cities", "-c", type=int, default=17)
+    parser.add_argument("--days", "-d", type=int, default=7)
+    parser.add_argument("--baseline", "-b", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true")
+    # Measures without comparing, the forbidden modules are still checked
+    parser.add_argument("--no-baseline", action="store_true")
+    parser.add_argument("--tolerance", "-t", type=float, default=0.2)
+    parser.add_argument("--output", "-o")
+    parser.add_argument(
+        "--child", nargs=3, metavar=("discover|measure", "ROUTE", "WORK_DIR")
+    )
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.child:
+        mode, route, work_dir = args.child
+        measure_child = measure_route if mode == "measure" else discover_route_modules
+        # Only the last line is read by the parent, routes may print
+        print(json.dumps(measure_child(route, Path(work_dir))))
+        sys.exit(0)
+
+    # The baseline is checked before measuring, a run that can not be compared fails
+    baseline_path = Path(args.baseline)
+    baseline: dict[str, Any] = {}
+    if not (args.save_baseline or args.no_baseline):
+        if not baseline_path.exists():
+            sys.exit(
+                f"Baseline {baseline_path} not found. Store one with --save-baseline "
+                "or measure without comparing with --no-baseline"
+            )
+        with open(baseline_path, "r") as f:
+            baseline = json.load(f)
+
+        scale = {k: baseline["config"].get(k) for k in ("cities", "days")}
+        if scale != {"cities": args.cities, "days": args.days}:
+            sys.exit(
+                f"Baseline {baseline_path} has a different config {scale}. Give the "
+                "baseline of this config with --baseline or measure without "
+                "comparing with --no-baseline"
+            )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = Path(tmp_dir)
+        prepare_layers(work_dir, args.cities, args.days)
+        # The modules of every route are found first and imported cold by the runs
+        route_modules = {
+            route: run_child("discover", route, work_dir) for route in args.routes
+        }
+        with open(work_dir / "route_modules.json", "w") as f:
+            json.dump(route_modules, f)
+        results = [
+            summarize(
+                [run_child("measure", route, work_dir) for _ in range(args.repeat)]
+            )
+            for route in args.routes
+        ]
+
+    report = {
+        "config": {
+            "cities": args.cities,
+            "days": args.days,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "routes": results,
+    }
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(baseline_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {baseline_path}")
+    else:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,119 @@
+import copy
+import datetime
+import json
+from itertools import cycle
+from pathlib import Path
+
+from src.destinations.base_destination import BaseDestination
+from src.utils.timestamp import Timestamp
+from src.utils.types import AvailableEndpoints, DictRow, Location
+
+
+EXAMPLE_RAW_DIR = Path(__file__).parents[2] / "data_example" / "raw"
+ENDPOINTS: tuple[AvailableEndpoints, ...] = ("weather", "air_pollution")
+
+# Fields added by the ingestion, which are not part of the API responses
+INGESTION_STAMPS = ("source", "ingestion_id", "ingested_at")
+
+
+def get_shape(row: DictRow, prefix: str = "") -> frozenset[str]:
+    keys = set()
+    for key, value in row.items():
+        keys.add(prefix + key)
+        if isinstance(value, dict):
+            keys |= get_shape(value, prefix + key + "__")
+    return frozenset(keys)
+
+
+def load_templates(
+    raw_dir: Path = EXAMPLE_RAW_DIR,
+) -> dict[AvailableEndpoints, list[DictRow]]:
+    # API-shaped rows of every endpoint, taken from the example raw layer
+    templates: dict[AvailableEndpoints, list[DictRow]] = {}
+    for endpoint in ENDPOINTS:
+        first_of_shape: dict[frozenset[str], DictRow] = {}
+        rows = []
+        for file_path in sorted((raw_dir / endpoint).glob("*/*.json")):
+            with open(file_path, "r") as f:
+                for row in json.load(f):
+                    for stamp in INGESTION_STAMPS:
+                        row.pop(stamp, None)
+                    first_of_shape.setdefault(get_shape(row), row)
+                    rows.append(row)
+
+        # Put a row of every shape first, so that even the smallest synthetic
+        # datasets have all the optional fields (rain, snow, gusts...)
+        first_ids = {id(row) for row in first_of_shape.values()}
+        templates[endpoint] = list(first_of_shape.values()) + [
+            row for row in rows if id(row) not in first_ids
+        ]
+    return templates
+
+
+def make_cities(num_cities: int) -> list[Location]:
+    return [
+        Location(
+            search_name=f"City {idx:04d}",
+            name=f"City {idx:04d}",
+            country_code="ES",
+            lat=str(36 + (idx % 80) / 10),
+            lon=str(-9 + (idx // 80) / 10),
+        )
+        for idx in range(num_cities)
+    ]
+
+
+class RowGenerator:
+
+    def __init__(self, template_rows: list[DictRow], hours_per_day: int) -> None:
+        if not 1 <= hours_per_day <= 24:
+            raise ValueError("`hours_per_day` must be between 1 and 24")
+
+        self.templates = cycle(template_rows)
+        self.step = 86400 // hours_per_day
+
+    def generate(self, start: int, end: int) -> list[DictRow]:
+        # Rows every `step` seconds in [start, end], as the API would return them
+        rows = []
+        for dt in range(start, end + 1, self.step):
+            row = copy.deepcopy(next(self.templates))
+            row["dt"] = dt
+            rows.append(row)
+        return rows
+
+
+def write_raw_layer(
+    destination: BaseDestination,
+    cities: list[Location],
+    start_date: datetime.date,
+    days: int,
+    hours_per_day: int,
+    templates: dict[AvailableEndpoints, list[DictRow]] | None = None,
+) -> int:
+    # Writes `endpoint/date/city.json` files as the ingestion does, returns the rows
+    templates = templates or load_templates()
+    ingested_at = datetime.datetime.now().isoformat()
+    stamp = {
+        "source": "OpenWeather",
+        "ingestion_id": "Benchmark-" + ingested_at,
+        "ingested_at": ingested_at,
+    }
+
+    total_rows = 0
+    for endpoint in ENDPOINTS:
+        generator = RowGenerator(templates[endpoint], hours_per_day)
+        for day in range(days):
+            date = start_date + datetime.timedelta(days=day)
+            start = Timestamp(date).unix
+            for city in cities:
+                rows = generator.generate(start, start + 86399)
+                for row in rows:
+                    row.update(stamp)
+                destination.save_batch(
+                    rows,
+                    Path(endpoint)
+                    / date.isoformat()
+                    / (city["search_name"].replace(" ", "_").lower() + ".json"),
+                )
+                total_rows += len(rows)
+    return total_rows
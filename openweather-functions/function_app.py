@@ -1,36 +1,92 @@
+import json
 import logging
+from typing import TYPE_CHECKING
 
 import azure.functions as func
-import duckdb
 
-from src.destinations.adls import ADLS
-from src.ingest.openweather import OpenWeather
-from src.transform.flattener import Flattener
-from src.transform.transformer import Transformer
+from src.utils.instrumentation import run_report
+
+# Each route imports what it uses when called, so a cold start only loads the
+# libraries of the route being run (i.e. ingestion never loads DuckDB nor Polars)
+if TYPE_CHECKING:
+    from src.destinations.base_destination import BaseDestination
 
 
 app = func.FunctionApp(http_auth_level=func.AuthLevel.FUNCTION)
 
+# Work items of the sharded ingestion, see `src/ingest/sharding.py`
+INGESTION_QUEUE = "openweather-ingestion"
+
+
+def get_models() -> list[tuple[str, "BaseDestination"]]:
+    from src.destinations.adls import ADLS
+
+    silver = ADLS(directory="silver")
+    gold = ADLS(directory="gold")
+    ml = ADLS(directory="ml")
+
+    return [
+        ("sql/silver/weather_parsed.sql", silver),
+        ("sql/silver/weather__weather_parsed.sql", silver),
+        ("sql/silver/air_pollution_parsed.sql", silver),
+        ("sql/silver/weather_rich.sql", silver),
+        ("sql/silver/weather_daily.sql", silver),
+        ("sql/silver/air_pollution_daily.sql", silver),
+        ("sql/gold/daily_general_report.sql", gold),
+        ("sql/ml/rain_prediction.sql", ml),
+    ]
+
+
+def save_run_report():
+    # Run reports are kept out of the data layers, so no step lists them as data
+    try:
+        from src.destinations.adls import ADLS
+
+        run_report.save(ADLS(directory="run_reports"))
+    except Exception:
+        logging.exception("The run report could not be saved")
+
+
+def is_profiled(req: func.HttpRequest) -> bool:
+    # Profiles the steps of a run, also enabled for all runs by OPENWEATHER_PROFILE
+    return req.headers.get("profile", "").lower() in ("1", "true")
+
 
 @app.route(route="ingest-openweather")
 def ingest_openweather(req: func.HttpRequest) -> func.HttpResponse:
-
+    run_report.start("ingest-openweather", req.headers.get("run_id"), is_profiled(req))
     try:
+        from src.destinations.adls import ADLS
+        from src.ingest.openweather import OpenWeather
+        from src.ingest.response_cache import ResponseCache
+
+        raw = ADLS(directory="raw")
+        # Re-runs read the pages already fetched from the cache
+        response_cache = None
+        if req.params.get("cache", "").lower() == "true":
+            response_cache = ResponseCache(
+                ADLS(directory="response_cache"),
+                int(req.params.get("cache_open_ttl", 0)),
+            )
         (
             OpenWeather()
             .set_location_directory(ADLS(directory="locations"))
-            .set_destinations([ADLS(directory="raw")])
+            .set_destinations([raw])
             .set_endpoints("all")
             .set_date_range(start_date=None, end_date=None)
             .set_ingestion_id(req.headers.get("run_id"))
+            .set_response_cache(response_cache)
             .fetch()
         )
     except Exception as e:
+        run_report.fail(e)
         logging.exception("There has been an error ingesting data from OpenWeather")
         return func.HttpResponse(
             f"There has been an error ingesting data from OpenWeather:\n{e}",
             status_code=501,
         )
+    finally:
+        save_run_report()
 
     return func.HttpResponse(
         "Ingestion took place without errors.",
@@ -38,57 +94,240 @@ def ingest_openweather(req: func.HttpRequest) -> func.HttpResponse:
     )
 
 
+@app.route(route="plan-openweather")
+@app.queue_output(
+    arg_name="work_items", queue_name=INGESTION_QUEUE, connection="AzureWebJobsStorage"
+)
+def plan_openweather(
+    req: func.HttpRequest, work_items: func.Out[list[str]]
+) -> func.HttpResponse:
+    # Sharded ingestion, the work items are fetched by `ingest_openweather_item` on
+    # as many instances as the queue scales out to
+    run_report.start("plan-openweather", req.headers.get("run_id"), is_profiled(req))
+    try:
+        from src.destinations.adls import ADLS
+        from src.ingest.openweather import OpenWeather
+        from src.ingest.sharding import IngestionPlanner
+
+        raw = ADLS(directory="raw")
+        items = (
+            IngestionPlanner()
+            .set_ingestion(
+                OpenWeather()
+                .set_location_directory(ADLS(directory="locations"))
+                .set_destinations([raw])
+                .set_endpoints("all")
+                .set_date_range(start_date=None, end_date=None)
+                .set_ingestion_id(req.headers.get("run_id"))
+            )
+            .set_days_per_item(int(req.params.get("days_per_item", 7)))
+            .plan()
+        )
+        work_items.set([json.dumps(item) for item in items])
+    except Exception as e:
+        run_report.fail(e)
+        logging.exception("There has been an error planning the ingestion")
+        return func.HttpResponse(
+            f"There has been an error planning the ingestion:\n{e}",
+            status_code=501,
+        )
+    finally:
+        save_run_report()
+
+    return func.HttpResponse(
+        f"Ingestion planned in {len(items)} work items.", status_code=200
+    )
+
+
+@app.queue_trigger(
+    arg_name="message", queue_name=INGESTION_QUEUE, connection="AzureWebJobsStorage"
+)
+def ingest_openweather_item(message: func.QueueMessage):
+    # Failed items raise, so their message is retried and goes to the poison queue
+    # after `maxDequeueCount` attempts. Items already completed are skipped
+    item = json.loads(message.get_body())
+    run_report.start("ingest-openweather-item", item["item_id"])
+    try:
+        from src.destinations.adls import ADLS
+        from src.ingest.openweather import OpenWeather
+        from src.ingest.sharding import IngestionWorker
+
+        raw = ADLS(directory="raw")
+        (
+            IngestionWorker()
+            .set_ingestion(OpenWeather().set_destinations([raw]))
+            .set_completion_destination(raw)
+            .process(item)
+        )
+    except Exception as e:
+        run_report.fail(e)
+        logging.exception("There has been an error ingesting %s", item["item_id"])
+        raise e
+    finally:
+        save_run_report()
+
+
 @app.route(route="stage-openweather")
 def stage_openweather(req: func.HttpRequest) -> func.HttpResponse:
+    run_report.start("stage-openweather", req.headers.get("run_id"), is_profiled(req))
     try:
+        from src.destinations.adls import ADLS
+        from src.transform.flattener import Flattener
+
+        bronze = ADLS(directory="bronze")
+        raw = ADLS(directory="raw")
+        if req.params.get("async_reads", "").lower() == "true":
+            raw.set_async_reads()
         (
             Flattener()
-            .set_source(ADLS(directory="raw"))
-            .set_target(ADLS(directory="bronze"))
+            .set_source(raw)
+            .set_target(bronze)
             .set_directories_to_parse("weather", "air_pollution")
             .set_identifier(req.headers.get("run_id"), "staged_id")
             .set_modified_at_column("staged_at")
+            .set_date_range(req.params.get("start_date"), req.params.get("end_date"))
+            .set_locations(*filter(None, req.params.get("locations", "").split(",")))
             .flatten()
         )
     except Exception as e:
+        run_report.fail(e)
         logging.error(e)
         func.HttpResponse(f"ERROR: {e}", status_code=501)
+    finally:
+        save_run_report()
 
     return func.HttpResponse(f"No erros, nice!", status_code=200)
 
 
+@app.route(route="compact-openweather")
+def compact_openweather(req: func.HttpRequest) -> func.HttpResponse:
+    # Consolidates the raw files of closed days into archives
+    run_report.start("compact-openweather", req.headers.get("run_id"), is_profiled(req))
+    try:
+        from src.destinations.adls import ADLS
+        from src.transform.compactor import Compactor
+
+        raw = ADLS(directory="raw")
+        (
+            Compactor()
+            .set_destination(raw)
+            .set_directories_to_compact("weather", "air_pollution")
+            .set_period(req.params.get("period", "month"))
+            .set_closed_before(req.params.get("closed_before"))
+            .compact()
+        )
+    except Exception as e:
+        run_report.fail(e)
+        logging.exception("There has been an error compacting the raw layer")
+        return func.HttpResponse(
+            f"There has been an error compacting the raw layer:\n{e}",
+            status_code=501,
+        )
+    finally:
+        save_run_report()
+
+    return func.HttpResponse("Compaction took place without errors.", status_code=200)
+
+
 @app.route(route="transform-openweather")
 def transform_openweather(req: func.HttpRequest) -> func.HttpResponse:
+    run_report.start(
+        "transform-openweather", req.headers.get("run_id"), is_profiled(req)
+    )
     try:
-        con = duckdb.connect()
+        import duckdb
 
-        bronze = ADLS(directory="bronze")
-        silver = ADLS(directory="silver")
-        gold = ADLS(directory="gold")
-        ml = ADLS(directory="ml")
+        from src.destinations.adls import ADLS
+        from src.transform.feature_store import RainFeatureStore
+        from src.transform.transformer import Transformer
+        from src.utils.duckdb_profile import DuckDBProfile
+
+        con = duckdb.connect()
 
         (
             Transformer(con)
-            .set_models(
-                [
-                    ("sql/silver/weather_parsed.sql", silver),
-                    ("sql/silver/weather__weather_parsed.sql", silver),
-                    ("sql/silver/air_pollution_parsed.sql", silver),
-                    ("sql/silver/weather_rich.sql", silver),
-                    ("sql/gold/daily_general_report.sql", gold),
-                    ("sql/ml/rain_prediction.sql", ml),
-                ]
-            )
-            .import_tables_from_dir(bronze)
+            .set_resource_profile(DuckDBProfile.from_host())
+            .set_models(get_models())
+            .import_tables_from_dir(ADLS(directory="bronze"))
             .execute()
         )
+        (
+            RainFeatureStore(con)
+            .set_target(ADLS(directory="ml"))
+            .set_full_refresh(req.params.get("full_refresh", "").lower() == "true")
+            .materialize()
+        )
     except Exception as e:
+        run_report.fail(e)
         logging.error(e)
         func.HttpResponse(f"ERROR: {e}", status_code=501)
+    finally:
+        save_run_report()
 
     return func.HttpResponse("No errors, nice!", status_code=200)
 
 
+@app.route(route="pipeline-openweather")
+def pipeline_openweather(req: func.HttpRequest) -> func.HttpResponse:
+    # Ingest, stage and transform in a single pass, for daily runs
+    run_report.start(
+        "pipeline-openweather", req.headers.get("run_id"), is_profiled(req)
+    )
+    try:
+        import duckdb
+
+        from src.destinations.adls import ADLS
+        from src.ingest.openweather import OpenWeather
+        from src.pipeline.fused_pipeline import FusedPipeline
+        from src.transform.feature_store import RainFeatureStore
+        from src.transform.flattener import Flattener
+        from src.transform.transformer import Transformer
+        from src.utils.duckdb_profile import DuckDBProfile
+
+        con = duckdb.connect()
+        raw = ADLS(directory="raw")
+
+        (
+            FusedPipeline(con)
+            .set_ingestion(
+                OpenWeather()
+                .set_location_directory(ADLS(directory="locations"))
+                .set_destinations([raw])
+                .set_endpoints("all")
+                .set_date_range(start_date=None, end_date=None)
+                .set_ingestion_id(req.headers.get("run_id"))
+            )
+            .set_staging(
+                Flattener()
+                .set_target(ADLS(directory="bronze"))
+                .set_directories_to_parse("weather", "air_pollution")
+                .set_identifier(req.headers.get("run_id"), "staged_id")
+                .set_modified_at_column("staged_at")
+            )
+            .set_transformer(
+                Transformer(con)
+                .set_resource_profile(DuckDBProfile.from_host())
+                .set_models(get_models())
+            )
+            .run()
+        )
+        RainFeatureStore(con).set_target(ADLS(directory="ml")).materialize()
+    except Exception as e:
+        run_report.fail(e)
+        logging.exception("There has been an error running the OpenWeather pipeline")
+        return func.HttpResponse(
+            f"There has been an error running the OpenWeather pipeline:\n{e}",
+            status_code=501,
+        )
+    finally:
+        save_run_report()
+
+    return func.HttpResponse(
+        "Pipeline took place without errors.",
+        status_code=200,
+    )
+
+
 # if __name__ == "__main__":
 #     req = func.HttpRequest("get", "smth", body=b"")
 #     # stage_openweather(req)
@@ -0,0 +1,14 @@
+select
+  location,
+  recorded_at::date      as recorded_day,
+  avg(co)                as co,
+  avg(nh3)               as nh3,
+  avg(no)                as no,
+  avg(no2)               as no2,
+  avg(o3)                as o3,
+  avg(pm10)              as pm10,
+  avg(pm2_5)             as pm2_5,
+  avg(so2)               as so2,
+  avg(air_quality_index) as air_quality_index
+from air_pollution_parsed
+group by location, recorded_day
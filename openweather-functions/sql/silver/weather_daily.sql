@@ -0,0 +1,17 @@
+select
+  location,
+  recorded_at::date           as recorded_day,
+  avg(clouds)                 as clouds,
+  avg(temperature_feels_like) as temperature_feels_like,
+  avg(avg_temperature)        as avg_temperature,
+  max(max_temperature)        as max_temperature,
+  min(min_temperature)        as min_temperature,
+  avg(humidity)               as humidity,
+  avg(pressure)               as pressure,
+  avg(degrees)                as degrees,
+  avg(wind_gusts)             as wind_gusts,
+  avg(wind_speed)             as wind_speed,
+  sum(rain)                   as rain,
+  max(rain)                   as max_rain
+from weather_rich
+group by location, recorded_day
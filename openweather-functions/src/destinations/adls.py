@@ -1,26 +1,41 @@
 import logging
-import os
 import io
+import os
 import json
-from multiprocessing.pool import ThreadPool
 
 from collections import defaultdict
 from datetime import date
-from pathlib import Path
-from typing import Any, Generator
+from functools import cached_property
+from pathlib import Path, PurePosixPath
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Generator, Iterable, Self
+
+from azure.storage.filedatalake import (
+    DataLakeDirectoryClient,
+    DataLakeServiceClient,
+    FileSystemClient,
+    PathProperties,
+)
 
-from azure.identity import DefaultAzureCredential, ClientSecretCredential
-from azure.storage.filedatalake import DataLakeServiceClient, PathProperties
+from src.destinations.base_destination import BaseDestination
+from src.utils.instrumentation import run_report
+from src.utils.raw_archive import get_archive_dates
+from src.utils.types import Batch, Relation, StoredPath
 
-from duckdb import DuckDBPyConnection, DuckDBPyRelation
-from polars import DataFrame
+if TYPE_CHECKING:
+    from duckdb import DuckDBPyConnection, DuckDBPyRelation
 
-from src.destinations.base_destination import BaseDestination
+    from src.destinations.async_adls import AsyncADLS
 
 
 class ADLS(BaseDestination):
     name = "ADLS"
 
+    # Service clients by account and credentials, shared by all the destinations of
+    # the process so credentials are only resolved once per worker
+    service_clients: dict[tuple[str | None, ...], DataLakeServiceClient] = {}
+    service_clients_lock = Lock()
+
     def __init__(
         self,
         account_name: str | None = None,
@@ -29,51 +44,123 @@ class ADLS(BaseDestination):
         password: str | None = None,
         tenant_id: str | None = None,
         directory: str | Path | None = None,
+        service_client: DataLakeServiceClient | None = None,
     ) -> None:
         super().__init__()
 
         self.app_id = app_id
         self.password = password
         self.tenant_id = tenant_id
-        self.account_name = account_name or os.environ["AZURE_ACCOUNT_NAME"]
         self.container = container or os.environ["AZURE_CONTAINER_NAME"]
+        self.directory_name = str(directory) if directory else "/"
 
         # Set azure logger to warning to avoid excessive logging
         logging.getLogger("azure").setLevel(logging.WARNING)
 
+        # Data files are read with `AsyncADLS` on an event loop, see `set_async_reads`
+        self.async_reads = False
+
+        # Clients are set up on first use, so creating a destination makes no calls
+        # to Azure
+        if service_client is not None:
+            # Already initialized client, i.e. a FakeDataLakeServiceClient for tests
+            self.print("Using given DataLakeServiceClient")
+            self.account_name = service_client.account_name
+            self.service_client = service_client
+        else:
+            self.account_name = account_name or os.environ["AZURE_ACCOUNT_NAME"]
+
+    @cached_property
+    def service_client(self) -> DataLakeServiceClient:
+        key = (self.account_name, self.tenant_id, self.app_id, self.password)
+        with self.service_clients_lock:
+            if key not in self.service_clients:
+                self.service_clients[key] = self.create_service_client()
+        return self.service_clients[key]
+
+    def create_service_client(self) -> DataLakeServiceClient:
+        # azure.identity is slow to import and only needed to authenticate
+        from azure.identity import DefaultAzureCredential, ClientSecretCredential
+
         if not (self.app_id and self.password and self.tenant_id):
             self.print("Using default envrionment credentials")
-            self.azure_credential = DefaultAzureCredential()
+            azure_credential = DefaultAzureCredential()
         else:
             self.print("Using given credentials")
-            self.azure_credential = ClientSecretCredential(
+            azure_credential = ClientSecretCredential(
                 self.tenant_id, self.app_id, self.password
             )
 
         self.print("Initializing DataLakeServiceClient")
-        self.service_client = DataLakeServiceClient(
-            f"https://{self.account_name}.dfs.core.windows.net", self.azure_credential
+        return DataLakeServiceClient(
+            f"https://{self.account_name}.dfs.core.windows.net", azure_credential
         )
 
-        self.filesystem = self.service_client.get_file_system_client(self.container)
-        if not self.filesystem.exists():
+    @cached_property
+    def filesystem(self) -> FileSystemClient:
+        filesystem = self.service_client.get_file_system_client(self.container)
+        if not filesystem.exists():
             raise ValueError(
                 f"FileSystem with Container name '{self.container}' does not exist "
                 f"in account '{self.account_name}'"
             )
+        return filesystem
+
+    @cached_property
+    def directory(self) -> DataLakeDirectoryClient:
+        directory = self.filesystem.get_directory_client(self.directory_name)
+        if not directory.exists():
+            directory.create_directory()
+        return directory
+
+    def to_async(self) -> "AsyncADLS":
+        # Async variant of the destination, with the same account and directory
+        from src.destinations.async_adls import AsyncADLS
+
+        # Given clients that have an async counterpart (i.e. the fake one) share it,
+        # the others are created from the credentials
+        get_async_client = getattr(self.service_client, "get_async_client", None)
+        return AsyncADLS(
+            account_name=self.account_name,
+            container=self.container,
+            app_id=self.app_id,
+            password=self.password,
+            tenant_id=self.tenant_id,
+            directory=self.directory_name,
+            service_client=get_async_client() if get_async_client else None,
+        ).set_read_concurrency(self.max_files_in_flight, self.max_bytes_in_flight)
+
+    def set_async_reads(
+        self, max_files_in_flight: int = 256, max_bytes_in_flight: int | None = None
+    ) -> Self:
+        # Downloads of data files (i.e. the raw layer read by the staging) run as
+        # coroutines instead of threads, so far more files can be in flight
+        self.async_reads = True
+        return self.set_read_concurrency(max_files_in_flight, max_bytes_in_flight)
 
-        self.directory = self.filesystem.get_directory_client(
-            str(directory) if directory else "/"
-        )
-        if not self.directory.exists():
-            self.directory.create_directory()
-
-    def save_batch(
+    def iterate_data_in_files(
         self,
-        batch: list[dict[str, Any]],
-        out_file_path: Path,
-    ):
-        self.save_json(batch, out_file_path)
+        dir: Path | str = ".",
+        start_date: date | None = None,
+        end_date: date | None = None,
+        locations: Iterable[str] | None = None,
+        ordered: bool = False,
+    ) -> Generator[tuple[str, Batch], None, None]:
+        if not self.async_reads:
+            yield from super().iterate_data_in_files(
+                dir, start_date, end_date, locations, ordered
+            )
+            return
+
+        from src.destinations.async_adls import iterate_in_event_loop
+
+        destination = self.to_async()
+        yield from iterate_in_event_loop(
+            destination,
+            destination.iterate_data_in_files(
+                dir, start_date, end_date, locations, ordered
+            ),
+        )
 
     def get_last_date_saved(self) -> dict[str, date]:
         self.print("Getting last date uploaded")
@@ -82,10 +169,19 @@ class ADLS(BaseDestination):
             print(path)
             path_without_root = path.name[len(self.directory.path_name) :].strip("/")
             print(path_without_root)
-            if path.is_directory and "/" in path_without_root:
+            archive_dates = get_archive_dates(path_without_root)
+            if not path.is_directory and archive_dates and "/" in path_without_root:
+                # Archive of compacted days
+                dir = path_without_root.rsplit("/", 1)[0]
+                max_dates[dir] = max(archive_dates[1], max_dates[dir])
+            elif path.is_directory and "/" in path_without_root:
                 *dir, date_str = path_without_root.split("/")
                 dir = "/".join(dir)
-                new_date = date.fromisoformat(date_str)
+                try:
+                    new_date = date.fromisoformat(date_str)
+                except ValueError:
+                    # Not a date partition, i.e. run reports
+                    continue
                 max_dates[dir] = max(new_date, max_dates[dir])
 
         return max_dates or {}
@@ -106,37 +202,49 @@ class ADLS(BaseDestination):
             file_client = self.filesystem.get_file_client(file_path)
         self.logger.info("Downloading file %s", file_path)
 
-        return file_path, json.loads(file_client.download_file().readall())
+        with run_report.span("read_json", destination=self.name) as span:
+            content = file_client.download_file().readall()
+            data = json.loads(content)
+            span.set(bytes=len(content), rows=len(data))
 
-    def iterate_data_in_files(
-        self, dir: Path | str = "."
-    ) -> Generator[tuple[str, list[dict[str, Any]]], None, None]:
-        def download_file(path: PathProperties):
-            try:
-                return self.read_json_file(path)
-            except Exception as e:
-                self.logger.error("Error found while reading JSON file %s", path)
-                raise e
+        return file_path, data
 
-        dir_client = self.filesystem.get_directory_client(
-            "/".join(p.strip(" /") for p in (self.directory.path_name, str(dir)))
-        )
+    def list_paths(
+        self, dir: Path | str = ".", recursive: bool = True
+    ) -> list[StoredPath]:
+        root = PurePosixPath(self.directory.path_name.strip("/"))
+        dir_client = self.filesystem.get_directory_client(str(root / str(dir)))
 
-        # Multithread downloads
-        with ThreadPool(processes=8) as pool:
-            for res in pool.imap_unordered(
-                download_file,
-                [
-                    path
-                    for path in dir_client.get_paths()
-                    if path.name.endswith(".json")
-                ],
-            ):
-                yield res
-
-    def save_relation_as_parquet(
-        self, dir: Path | str, df: DataFrame | DuckDBPyRelation, table_name: str
-    ):
+        return [
+            StoredPath(
+                name=str(PurePosixPath(path.name).relative_to(root)),
+                is_directory=bool(path.is_directory),
+                size=path.content_length or 0,
+            )
+            for path in dir_client.get_paths(recursive=recursive)
+        ]
+
+    def read_bytes(self, path: str) -> bytes:
+        with run_report.span("download", destination=self.name) as span:
+            content = self.directory.get_file_client(path).download_file().readall()
+            span.set(bytes=len(content))
+        return content
+
+    def delete_path(self, path: str, is_directory: bool = False):
+        with run_report.span("delete", destination=self.name):
+            if is_directory:
+                # Directories are deleted with their content in a single call
+                root = self.directory.path_name.strip("/")
+                self.filesystem.get_directory_client(
+                    f"{root}/{path}" if root else path
+                ).delete_directory()
+            else:
+                self.directory.get_file_client(path).delete_file()
+
+    def exists(self, path: str) -> bool:
+        return self.directory.get_file_client(path).exists()
+
+    def save_relation_as_parquet(self, dir: Path | str, df: Relation, table_name: str):
         if isinstance(dir, str):
             dir = Path(dir)
         file_client = self.directory.get_file_client(
@@ -145,27 +253,23 @@ class ADLS(BaseDestination):
 
         logging.info(f"Cloud location to save parquet file is {file_client.path_name}")
 
-        tmp_file_name = f"/tmp/ingestion_{self.name}_{table_name}.parquet"
-        logging.info(f"Getting tmp file {tmp_file_name}")
-        tmp_file = Path(tmp_file_name)
-        try:
-            logging.info("Writing tmp parquet file")
-
-            if isinstance(df, DuckDBPyRelation):
-                df.to_parquet(tmp_file_name)
-            else:
-                df.write_parquet(tmp_file_name)
+        # Written in memory with the profile of the table and uploaded without a tmp
+        # file
+        with run_report.span(
+            "write_parquet", destination=self.name, table=table_name
+        ) as span:
+            with io.BytesIO() as buffer:
+                span.set(rows=self.write_parquet(df, buffer, table_name))
+                content = buffer.getvalue()
+            span.set(bytes=len(content))
 
-            logging.info("Uploading tmp file")
-            with open(tmp_file, "rb") as f:
-                file_client.upload_data(f, overwrite=True)
-        finally:
-            logging.info("Cleaning tmp file")
-            tmp_file.unlink(missing_ok=True)
+        with run_report.span("upload", destination=self.name, table=table_name) as span:
+            file_client.upload_data(content, overwrite=True)
+            span.set(bytes=len(content))
 
     def iter_dir_as_relations(
-        self, con: DuckDBPyConnection, skip_on_error: bool = False
-    ) -> Generator[tuple[str, DuckDBPyRelation], None, None]:
+        self, con: "DuckDBPyConnection", skip_on_error: bool = False
+    ) -> Generator[tuple[str, "DuckDBPyRelation"], None, None]:
         for path in self.directory.get_paths():
             if not path.name.endswith(".parquet"):
                 continue
@@ -173,12 +277,14 @@ class ADLS(BaseDestination):
             tmp_file_path = Path(f"/tmp/read_parquet__{path.name.replace('/', '_')}")
 
             try:
-                with open(tmp_file_path, "wb") as tmp_file:
-                    tmp_file.write(
-                        self.filesystem.get_file_client(path.name)
-                        .download_file()
-                        .readall()
-                    )
+                with run_report.span("download", destination=self.name) as span:
+                    with open(tmp_file_path, "wb") as tmp_file:
+                        tmp_file.write(
+                            self.filesystem.get_file_client(path.name)
+                            .download_file()
+                            .readall()
+                        )
+                    span.set(bytes=tmp_file_path.stat().st_size)
 
                 yield Path(path.name).stem, con.from_parquet(str(tmp_file_path))
 
@@ -192,11 +298,12 @@ class ADLS(BaseDestination):
             finally:
                 tmp_file_path.unlink(missing_ok=True)
 
-    def save_json(self, data: list[Any], file_name: str | Path):
+    def save_bytes(self, content: bytes, file_name: str | Path):
         file_client = self.directory.get_file_client(str(file_name))
 
-        with io.BytesIO(json.dumps(data, indent=2).encode()) as binary_data:
-            file_client.upload_data(binary_data, overwrite=True)
+        with run_report.span("save_file", destination=self.name) as span:
+            file_client.upload_data(content, overwrite=True)
+            span.set(bytes=len(content))
 
     def download_file(self, out_path: str | Path, file_path: str | Path):
         file_client = self.directory.get_file_client(str(file_path))
@@ -0,0 +1,381 @@
+import asyncio
+import io
+import json
+import logging
+import os
+from asyncio import FIRST_COMPLETED, Semaphore, Task
+from datetime import date
+from pathlib import Path, PurePosixPath
+from threading import Thread
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Generator, Iterable, Self
+
+from azure.storage.filedatalake.aio import (
+    DataLakeDirectoryClient,
+    DataLakeServiceClient,
+    FileSystemClient,
+)
+
+from src.destinations.base_destination import (
+    BaseDestination,
+    DestinationOptions,
+    ReadAhead,
+)
+from src.utils.instrumentation import run_report
+from src.utils.parquet import write_parquet
+from src.utils.types import Batch, Relation, StoredPath
+
+if TYPE_CHECKING:
+    from duckdb import DuckDBPyConnection, DuckDBPyRelation
+
+
+class AsyncADLS(DestinationOptions):
+    # Variant of the `ADLS` destination on the async Azure SDK, for asyncio based
+    # ingestion and staging. Every call is a coroutine on the event loop instead of
+    # a blocked thread, so hundreds of uploads and downloads can be in flight at
+    # once, up to `max_concurrency`. Clients are opened and closed as an async
+    # context manager:
+    #
+    #   async with AsyncADLS(directory="raw") as raw:
+    #       await asyncio.gather(*(raw.save_batch(b, p) for p, b in batches))
+    name = "AsyncADLS"
+    logger = logging.getLogger()
+
+    # Limits of the prefetching done when reading data files
+    max_files_in_flight: int = 256
+    max_bytes_in_flight: int = 256 * 1024**2
+
+    def __init__(
+        self,
+        account_name: str | None = None,
+        container: str | None = None,
+        app_id: str | None = None,
+        password: str | None = None,
+        tenant_id: str | None = None,
+        directory: str | Path | None = None,
+        service_client: DataLakeServiceClient | None = None,
+        max_concurrency: int = 256,
+    ) -> None:
+        self.app_id = app_id
+        self.password = password
+        self.tenant_id = tenant_id
+        self.container = container or os.environ["AZURE_CONTAINER_NAME"]
+        self.directory_name = str(directory) if directory else "/"
+        self.max_concurrency = max_concurrency
+
+        logging.getLogger("azure").setLevel(logging.WARNING)
+
+        # Clients given are owned by the caller and not closed on exit, i.e. a
+        # FakeAsyncDataLakeServiceClient for tests
+        self.given_service_client = service_client
+        self.account_name = (
+            service_client.account_name
+            if service_client is not None
+            else account_name or os.environ["AZURE_ACCOUNT_NAME"]
+        )
+        self.credential: Any = None
+        self.service_client: DataLakeServiceClient
+        self.filesystem: FileSystemClient
+        self.directory: DataLakeDirectoryClient
+        self.semaphore: Semaphore
+
+    async def __aenter__(self) -> Self:
+        if self.given_service_client is not None:
+            self.service_client = self.given_service_client
+        else:
+            # azure.identity is slow to import and only needed to authenticate
+            from azure.identity.aio import (
+                ClientSecretCredential,
+                DefaultAzureCredential,
+            )
+
+            if not (self.app_id and self.password and self.tenant_id):
+                self.credential = DefaultAzureCredential()
+            else:
+                self.credential = ClientSecretCredential(
+                    self.tenant_id, self.app_id, self.password
+                )
+            self.service_client = DataLakeServiceClient(
+                f"https://{self.account_name}.dfs.core.windows.net", self.credential
+            )
+
+        self.semaphore = Semaphore(self.max_concurrency)
+        try:
+            self.filesystem = self.service_client.get_file_system_client(self.container)
+            if not await self.filesystem.exists():
+                raise ValueError(
+                    f"FileSystem with Container name '{self.container}' does not "
+                    f"exist in account '{self.account_name}'"
+                )
+            self.directory = self.filesystem.get_directory_client(self.directory_name)
+            if not await self.directory.exists():
+                await self.directory.create_directory()
+        except Exception as e:
+            await self.close()
+            raise e
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    async def close(self):
+        if self.given_service_client is None:
+            await self.service_client.close()
+            if self.credential is not None:
+                await self.credential.close()
+                self.credential = None
+
+    async def save_bytes(self, content: bytes, file_name: str | Path):
+        file_client = self.directory.get_file_client(str(file_name))
+
+        async with self.semaphore:
+            with run_report.span("save_file", destination=self.name) as span:
+                await file_client.upload_data(content, overwrite=True)
+                span.set(bytes=len(content))
+
+    async def save_batch(
+        self, batch: Batch, out_file_path: Path, content: bytes | None = None
+    ):
+        await self.save_bytes(
+            BaseDestination.encode_json(batch) if content is None else content,
+            out_file_path,
+        )
+
+    async def save_json(self, data: list[Any] | dict[str, Any], file_name: str | Path):
+        await self.save_bytes(BaseDestination.encode_json(data), file_name)
+
+    async def read_bytes(self, path: str) -> bytes:
+        async with self.semaphore:
+            with run_report.span("download", destination=self.name) as span:
+                downloader = await self.directory.get_file_client(path).download_file()
+                content = await downloader.readall()
+                span.set(bytes=len(content))
+        return content
+
+    async def read_json_file(
+        self, path: Path | str, prepend_context: bool = False
+    ) -> tuple[str, Any]:
+        file_path = str(path)
+        if prepend_context:
+            file_client = self.directory.get_file_client(file_path)
+        else:
+            file_client = self.filesystem.get_file_client(file_path)
+        self.logger.info("Downloading file %s", file_path)
+
+        async with self.semaphore:
+            with run_report.span("read_json", destination=self.name) as span:
+                downloader = await file_client.download_file()
+                content = await downloader.readall()
+                data = json.loads(content)
+                span.set(bytes=len(content), rows=len(data))
+
+        return file_path, data
+
+    async def exists(self, path: str) -> bool:
+        async with self.semaphore:
+            return await self.directory.get_file_client(path).exists()
+
+    async def delete_path(self, path: str, is_directory: bool = False):
+        async with self.semaphore:
+            with run_report.span("delete", destination=self.name):
+                if is_directory:
+                    root = self.directory.path_name.strip("/")
+                    await self.filesystem.get_directory_client(
+                        f"{root}/{path}" if root else path
+                    ).delete_directory()
+                else:
+                    await self.directory.get_file_client(path).delete_file()
+
+    async def list_paths(
+        self, dir: Path | str = ".", recursive: bool = True
+    ) -> list[StoredPath]:
+        root = PurePosixPath(self.directory.path_name.strip("/"))
+        dir_client = self.filesystem.get_directory_client(str(root / str(dir)))
+
+        async with self.semaphore:
+            return [
+                StoredPath(
+                    name=str(PurePosixPath(path.name).relative_to(root)),
+                    is_directory=bool(path.is_directory),
+                    size=path.content_length or 0,
+                )
+                async for path in dir_client.get_paths(recursive=recursive)
+            ]
+
+    async def list_data_files(
+        self,
+        dir: Path | str = ".",
+        start_date: date | None = None,
+        end_date: date | None = None,
+        locations: Iterable[str] | None = None,
+    ) -> list[StoredPath]:
+        # See `BaseDestination.list_data_files`, date partitions are listed at once
+        if start_date is None and end_date is None:
+            paths = await self.list_paths(dir)
+        else:
+            partitions, paths = BaseDestination.split_top_listing(
+                await self.list_paths(dir, recursive=False), start_date, end_date
+            )
+            for partition_paths in await asyncio.gather(
+                *(self.list_paths(partition) for partition in partitions)
+            ):
+                paths.extend(partition_paths)
+
+        return BaseDestination.select_data_files(paths, locations)
+
+    async def iterate_data_in_files(
+        self,
+        dir: Path | str = ".",
+        start_date: date | None = None,
+        end_date: date | None = None,
+        locations: Iterable[str] | None = None,
+        ordered: bool = False,
+    ) -> AsyncGenerator[tuple[str, Batch], None]:
+        # Same prefetching as `BaseDestination.iterate_data_in_files`, with the
+        # downloads as tasks of the event loop
+        files = await self.list_data_files(dir, start_date, end_date, locations)
+        self.logger.info("Destination %s reading %s files", self.name, len(files))
+        is_selected_member = BaseDestination.get_member_filter(
+            files, start_date, end_date, locations
+        )
+
+        async def read_file(path: StoredPath) -> list[tuple[str, Batch]]:
+            file_client = self.directory.get_file_client(path["name"])
+            with run_report.span("read_json", destination=self.name) as span:
+                async with self.semaphore:
+                    content = await (await file_client.download_file()).readall()
+                # Decoded in a thread, so the event loop keeps downloading meanwhile
+                batches = await asyncio.to_thread(
+                    BaseDestination.decode_data_file,
+                    path["name"],
+                    content,
+                    is_selected_member,
+                )
+                span.set(
+                    bytes=len(content),
+                    files=len(batches),
+                    rows=sum(len(batch) for _, batch in batches),
+                )
+            return batches
+
+        read_ahead: ReadAhead[Task[list[tuple[str, Batch]]]] = ReadAhead(
+            files, self.max_files_in_flight, self.max_bytes_in_flight, ordered
+        )
+        try:
+            while read_ahead.has_next():
+                await asyncio.wait(
+                    read_ahead.start(lambda path: asyncio.create_task(read_file(path))),
+                    return_when=FIRST_COMPLETED,
+                )
+                _, task = read_ahead.pop()
+                for item in task.result():
+                    yield item
+        finally:
+            read_ahead.cancel()
+
+    async def save_relation_as_parquet(
+        self, dir: Path | str, df: Relation, table_name: str
+    ):
+        file_path = str(Path(dir) / (table_name + ".parquet"))
+
+        # Encoded in a thread, so the uploads in flight keep going meanwhile
+        def write() -> tuple[int, bytes]:
+            with io.BytesIO() as buffer:
+                rows = write_parquet(df, buffer, self.get_parquet_profile(table_name))
+                return rows, buffer.getvalue()
+
+        with run_report.span(
+            "write_parquet", destination=self.name, table=table_name
+        ) as span:
+            rows, content = await asyncio.to_thread(write)
+            span.set(rows=rows, bytes=len(content))
+
+        await self.save_bytes(content, file_path)
+
+    async def iter_dir_as_relations(
+        self, con: "DuckDBPyConnection", skip_on_error: bool = False
+    ) -> AsyncGenerator[tuple[str, "DuckDBPyRelation"], None]:
+        # Parquet files of the directory are downloaded ahead to tmp files, in the
+        # limits of the read concurrency. Each relation reads its file until the next
+        # one is requested
+        files = [
+            path
+            for path in await self.list_paths()
+            if not path["is_directory"] and path["name"].endswith(".parquet")
+        ]
+        root = self.directory.path_name.strip("/")
+
+        async def download(path: StoredPath) -> Path:
+            tmp_file_path = Path(
+                f"/tmp/read_parquet__{f'{root}/{path['name']}'.replace('/', '_')}"
+            )
+            tmp_file_path.write_bytes(await self.read_bytes(path["name"]))
+            return tmp_file_path
+
+        read_ahead: ReadAhead[Task[Path]] = ReadAhead(
+            files, self.max_files_in_flight, self.max_bytes_in_flight, ordered=True
+        )
+        try:
+            while read_ahead.has_next():
+                await asyncio.wait(
+                    read_ahead.start(lambda path: asyncio.create_task(download(path))),
+                    return_when=FIRST_COMPLETED,
+                )
+                path, task = read_ahead.pop()
+                try:
+                    tmp_file_path = task.result()
+                    try:
+                        yield Path(path["name"]).stem, con.from_parquet(
+                            str(tmp_file_path)
+                        )
+                    finally:
+                        tmp_file_path.unlink(missing_ok=True)
+                except Exception as e:
+                    if not skip_on_error:
+                        raise RuntimeError(
+                            f"Found error getting relation from '{path['name']}'"
+                        ) from e
+                    logging.warning(
+                        f"Could not get relation for file '{path['name']}'\n{e}"
+                    )
+        finally:
+            # Files already downloaded by the reads not handed back
+            for result in await asyncio.gather(
+                *read_ahead.cancel(), return_exceptions=True
+            ):
+                if isinstance(result, Path):
+                    result.unlink(missing_ok=True)
+
+
+def iterate_in_event_loop[
+    T
+](destination: AsyncADLS, iterator: AsyncGenerator[T, None]) -> Generator[
+    T, None, None
+]:
+    # Runs an async iterator of the destination on an event loop of its own thread
+    # and yields its items to synchronous code, i.e. the staging of `ADLS`. The
+    # loop keeps downloading while the caller processes the items
+    loop = asyncio.new_event_loop()
+    thread = Thread(target=loop.run_forever, name="async-adls", daemon=True)
+    thread.start()
+
+    async def next_item() -> T:
+        return await anext(iterator)
+
+    async def close():
+        await iterator.aclose()
+        await destination.close()
+
+    try:
+        asyncio.run_coroutine_threadsafe(destination.__aenter__(), loop).result()
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(next_item(), loop).result()
+                except StopAsyncIteration:
+                    break
+        finally:
+            asyncio.run_coroutine_threadsafe(close(), loop).result()
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
@@ -1,22 +1,145 @@
+import io
+import json
 import logging
 from abc import ABC, abstractmethod
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import date
-from pathlib import Path
-from typing import Generator, Any
+from functools import partial
+from pathlib import Path, PurePosixPath
+from typing import IO, TYPE_CHECKING, Callable, Generator, Any, Iterable, Self
 
-from duckdb import DuckDBPyConnection, DuckDBPyRelation
-from polars import DataFrame
-
-from src.utils.types import Batch, NestedKeyPath, DictRow
+from src.utils.types import Batch, NestedKeyPath, DictRow, Relation, StoredPath
 from src.utils.dict_table import DictTable
+from src.utils.key_index import KeyIndex
+from src.utils.keys import (
+    LocationHashes,
+    get_key_column_types,
+    location_from_path,
+    partition_day_from_path,
+    record_key,
+)
+from src.utils.instrumentation import in_run_context, run_report
+from src.utils.parquet import ParquetProfile, write_parquet
+from src.utils.raw_archive import get_archive_dates, is_archive, read_archive
+from src.utils.timestamp import SECONDS_PER_DAY
+
+# DuckDB and Arrow are only loaded by the code paths that use them, so raw data can
+# be saved without importing them
+if TYPE_CHECKING:
+    import asyncio
+
+    import pyarrow as pa
+    from duckdb import DuckDBPyConnection, DuckDBPyRelation
+
+
+class DestinationOptions:
+    # Options of the destinations, shared by `BaseDestination` and `AsyncADLS`
+
+    # Limits of the prefetching done when reading data files
+    max_files_in_flight: int = 8
+    max_bytes_in_flight: int = 64 * 1024**2
+
+    # Layout of the parquet files of every table, unless the table has its own
+    parquet_profile: ParquetProfile = ParquetProfile()
+    table_parquet_profiles: dict[str, ParquetProfile] = {}
+
+    def set_read_concurrency(
+        self, max_files_in_flight: int, max_bytes_in_flight: int | None = None
+    ) -> Self:
+        self.max_files_in_flight = max_files_in_flight
+        if max_bytes_in_flight is not None:
+            self.max_bytes_in_flight = max_bytes_in_flight
+        return self
+
+    def set_parquet_profile(self, profile: ParquetProfile, *table_names: str) -> Self:
+        # Without table names, sets the profile of all the tables
+        if table_names:
+            self.table_parquet_profiles = self.table_parquet_profiles | {
+                table_name: profile for table_name in table_names
+            }
+        else:
+            self.parquet_profile = profile
+        return self
+
+    def get_parquet_profile(self, table_name: str) -> ParquetProfile:
+        return self.table_parquet_profiles.get(table_name, self.parquet_profile)
 
 
-class BaseDestination(ABC):
+class ReadAhead[Handle: "Future[Any] | asyncio.Future[Any]"]:
+    # Files read ahead of their consumer, as thread futures or event loop tasks.
+    # Files are started in order while fewer than `max_files` files and `max_bytes`
+    # bytes are in flight, at least one. With `ordered`, files are sorted by path and
+    # handed back in that order instead of as they complete:
+    #
+    #   while read_ahead.has_next():
+    #       wait(read_ahead.start(read), return_when=FIRST_COMPLETED)
+    #       path, future = read_ahead.pop()
+
+    def __init__(
+        self,
+        files: list[StoredPath],
+        max_files: int,
+        max_bytes: int,
+        ordered: bool = False,
+    ) -> None:
+        self.files = sorted(files, key=lambda path: path["name"]) if ordered else files
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.ordered = ordered
+        self.pending: list[tuple[StoredPath, Handle]] = []
+        self.bytes_in_flight = 0
+        self.next_file = 0
+
+    def has_next(self) -> bool:
+        return bool(self.pending) or self.next_file < len(self.files)
+
+    def start(self, read: Callable[[StoredPath], Handle]) -> list[Handle]:
+        # Starts the reads that fit in the limits, returns the ones to wait for
+        while (
+            self.next_file < len(self.files)
+            and len(self.pending) < self.max_files
+            and (
+                not self.pending
+                or self.bytes_in_flight + self.files[self.next_file]["size"]
+                <= self.max_bytes
+            )
+        ):
+            path = self.files[self.next_file]
+            self.pending.append((path, read(path)))
+            self.bytes_in_flight += path["size"]
+            self.next_file += 1
+        if self.ordered:
+            return [self.pending[0][1]]
+        return [handle for _, handle in self.pending]
+
+    def pop(self) -> tuple[StoredPath, Handle]:
+        # Next read done, once one of the reads to wait for completed
+        idx = next(idx for idx, (_, handle) in enumerate(self.pending) if handle.done())
+        path, handle = self.pending.pop(idx)
+        self.bytes_in_flight -= path["size"]
+        return path, handle
+
+    def cancel(self) -> list[Handle]:
+        # Cancels the reads not handed back, returns them
+        handles = [handle for _, handle in self.pending]
+        for handle in handles:
+            handle.cancel()
+        self.pending = []
+        return handles
+
+
+class BaseDestination(DestinationOptions, ABC):
     logger = logging.getLogger()
     name: str
 
-    @abstractmethod
-    def save_batch(self, batch: Batch, out_file_path: Path): ...
+    def save_batch(
+        self, batch: Batch, out_file_path: Path, content: bytes | None = None
+    ):
+        # `content` is the batch already encoded, shared by all the destinations
+        self.save_bytes(
+            self.encode_json(batch) if content is None else content, out_file_path
+        )
 
     @abstractmethod
     def get_last_date_saved(self) -> dict[str, date]: ...
@@ -27,22 +150,230 @@ class BaseDestination(ABC):
     ) -> tuple[str, Any]: ...
 
     @abstractmethod
+    def list_paths(
+        self, dir: Path | str = ".", recursive: bool = True
+    ) -> list[StoredPath]: ...
+
+    @abstractmethod
+    def read_bytes(self, path: str) -> bytes: ...
+
+    @abstractmethod
+    def delete_path(self, path: str, is_directory: bool = False):
+        # Directories are deleted with all their content
+        ...
+
+    def delete_empty_directory(self, path: str) -> bool:
+        # Only deletes the directory when it holds no files, returns whether it did
+        if any(not stored["is_directory"] for stored in self.list_paths(path)):
+            return False
+        self.delete_path(path, is_directory=True)
+        return True
+
+    @abstractmethod
+    def exists(self, path: str) -> bool: ...
+
+    @staticmethod
+    def in_date_range(
+        date_str: str, start_date: date | None, end_date: date | None
+    ) -> bool:
+        try:
+            partition_date = date.fromisoformat(date_str)
+        except ValueError:
+            return False
+        return (start_date is None or partition_date >= start_date) and (
+            end_date is None or partition_date <= end_date
+        )
+
+    @staticmethod
+    def is_archive_in_range(
+        path: StoredPath, start_date: date | None, end_date: date | None
+    ) -> bool:
+        archive_dates = get_archive_dates(path["name"])
+        return archive_dates is not None and (
+            (start_date is None or archive_dates[1] >= start_date)
+            and (end_date is None or archive_dates[0] <= end_date)
+        )
+
+    @classmethod
+    def split_top_listing(
+        cls, paths: list[StoredPath], start_date: date | None, end_date: date | None
+    ) -> tuple[list[str], list[StoredPath]]:
+        # Date partitions in range of a non recursive listing, still to be listed, and
+        # its archives in range
+        partitions = []
+        archives = []
+        for path in paths:
+            if path["is_directory"] and cls.in_date_range(
+                PurePosixPath(path["name"]).name, start_date, end_date
+            ):
+                partitions.append(path["name"])
+            elif cls.is_archive_in_range(path, start_date, end_date):
+                archives.append(path)
+        return partitions, archives
+
+    @staticmethod
+    def select_data_files(
+        paths: list[StoredPath], locations: Iterable[str] | None = None
+    ) -> list[StoredPath]:
+        location_names = set(locations) if locations is not None else None
+        return [
+            path
+            for path in paths
+            if not path["is_directory"]
+            and (
+                get_archive_dates(path["name"]) is not None
+                or (
+                    path["name"].endswith(".json")
+                    and (
+                        location_names is None
+                        or location_from_path(path["name"]) in location_names
+                    )
+                )
+            )
+        ]
+
+    def list_data_files(
+        self,
+        dir: Path | str = ".",
+        start_date: date | None = None,
+        end_date: date | None = None,
+        locations: Iterable[str] | None = None,
+    ) -> list[StoredPath]:
+        # Data files follow the `endpoint/date/location.json` layout, or are members
+        # of archives of compacted days (see `src/utils/raw_archive.py`). Archives are
+        # returned whole, their members are filtered when read
+        if start_date is None and end_date is None:
+            paths = self.list_paths(dir)
+        else:
+            # Only the date partitions and archives in range are listed
+            partitions, paths = self.split_top_listing(
+                self.list_paths(dir, recursive=False), start_date, end_date
+            )
+            for partition in partitions:
+                paths.extend(self.list_paths(partition))
+
+        return self.select_data_files(paths, locations)
+
+    @classmethod
+    def get_member_filter(
+        cls,
+        files: list[StoredPath],
+        start_date: date | None = None,
+        end_date: date | None = None,
+        locations: Iterable[str] | None = None,
+    ) -> Callable[[str], bool]:
+        # Files ingested again after their day was compacted replace their archived
+        # copy
+        loose_files = {path["name"] for path in files if not is_archive(path["name"])}
+        location_names = set(locations) if locations is not None else None
+
+        def is_selected_member(name: str) -> bool:
+            return (
+                name not in loose_files
+                and cls.in_date_range(
+                    PurePosixPath(name).parent.name, start_date, end_date
+                )
+                and (
+                    location_names is None or location_from_path(name) in location_names
+                )
+            )
+
+        return is_selected_member
+
+    @staticmethod
+    def decode_data_file(
+        name: str, content: bytes, is_selected_member: Callable[[str], bool]
+    ) -> list[tuple[str, Batch]]:
+        # Batches of a data file, or of the selected members of an archive
+        if not is_archive(name):
+            return [(name, json.loads(content))]
+
+        archive_dir = PurePosixPath(name).parent
+        batches = []
+        for member_name, member in read_archive(content):
+            member_path = str(archive_dir / member_name)
+            if is_selected_member(member_path):
+                batches.append((member_path, json.loads(member)))
+        return batches
+
     def iterate_data_in_files(
-        self, dir: Path | str
-    ) -> Generator[tuple[str, list[DictRow]], None, None]: ...
+        self,
+        dir: Path | str = ".",
+        start_date: date | None = None,
+        end_date: date | None = None,
+        locations: Iterable[str] | None = None,
+        ordered: bool = False,
+    ) -> Generator[tuple[str, Batch], None, None]:
+        # Files are downloaded and decoded ahead of time, up to `max_files_in_flight`
+        # files and `max_bytes_in_flight` bytes that have not been consumed yet. With
+        # `ordered`, files are returned sorted by path instead of as they complete
+        files = self.list_data_files(dir, start_date, end_date, locations)
+        self.logger.info("Destination %s reading %s files", self.name, len(files))
+        is_selected_member = self.get_member_filter(
+            files, start_date, end_date, locations
+        )
+
+        @in_run_context
+        def read_file(path: StoredPath) -> list[tuple[str, Batch]]:
+            with run_report.span("read_json", destination=self.name) as span:
+                content = self.read_bytes(path["name"])
+                batches = self.decode_data_file(
+                    path["name"], content, is_selected_member
+                )
+                span.set(
+                    bytes=len(content),
+                    files=len(batches),
+                    rows=sum(len(batch) for _, batch in batches),
+                )
+            return batches
+
+        read_ahead: ReadAhead[Future[list[tuple[str, Batch]]]] = ReadAhead(
+            files, self.max_files_in_flight, self.max_bytes_in_flight, ordered
+        )
+        with ThreadPoolExecutor(self.max_files_in_flight) as executor:
+            try:
+                while read_ahead.has_next():
+                    wait(
+                        read_ahead.start(partial(executor.submit, read_file)),
+                        return_when=FIRST_COMPLETED,
+                    )
+                    _, future = read_ahead.pop()
+                    yield from future.result()
+            finally:
+                read_ahead.cancel()
 
     @abstractmethod
     def save_relation_as_parquet(
-        self, dir: Path | str, df: DataFrame | DuckDBPyRelation, table_name: str
+        self, dir: Path | str, df: Relation, table_name: str
     ): ...
 
     @abstractmethod
     def iter_dir_as_relations(
-        self, con: DuckDBPyConnection, skip_on_error: bool = False
-    ) -> Generator[tuple[str, DuckDBPyRelation], None, None]: ...
+        self, con: "DuckDBPyConnection", skip_on_error: bool = False
+    ) -> Generator[tuple[str, "DuckDBPyRelation"], None, None]: ...
 
     @abstractmethod
-    def save_json(self, data: list[Any], file_name: str | Path): ...
+    def save_bytes(self, content: bytes, file_name: str | Path): ...
+
+    def save_json(self, data: list[Any] | dict[str, Any], file_name: str | Path):
+        self.save_bytes(self.encode_json(data), file_name)
+
+    def read_parquet(self, con: "DuckDBPyConnection", path: str) -> "DuckDBPyRelation":
+        # Read whole in memory, for small files such as the state of incremental
+        # models
+        import pyarrow.parquet as pq
+
+        return con.from_arrow(pq.read_table(io.BytesIO(self.read_bytes(path))))
+
+    def write_parquet(
+        self, df: Relation, where: "str | pa.NativeFile | IO[bytes]", table_name: str
+    ) -> int:
+        # Writes the table with its profile, returns the rows written
+        return write_parquet(df, where, self.get_parquet_profile(table_name))
+
+    @staticmethod
+    def encode_json(data: list[Any] | dict[str, Any]) -> bytes:
+        return json.dumps(data, indent=2).encode()
 
     def clean_up(self):
         pass
@@ -51,8 +382,22 @@ class BaseDestination(ABC):
         print(f"{self.name}: {value}")
 
     def read_tables_from_dir(
-        self, dir: Path | str, root_table_name: str
+        self,
+        dir: Path | str,
+        root_table_name: str,
+        start_date: date | None = None,
+        end_date: date | None = None,
+        locations: Iterable[str] | None = None,
+        canonical_keys: KeyIndex | None = None,
+        staged_keys: KeyIndex | None = None,
     ) -> dict[str, DictTable]:
+        # Readings are staged once per location and `dt`. The copy of a reading in the
+        # partition of its UTC day is its canonical one and is always the one kept.
+        # Copies in other partitions (i.e. legacy files bucketed by local day) are
+        # held until the end and only staged when no canonical copy was read, nor is
+        # held by `canonical_keys`. The canonical readings staged are added to
+        # `staged_keys`. Locations whose record keys would collide with the ones read
+        # or indexed fail the staging
 
         if isinstance(dir, str):
             dir = Path(dir)
@@ -61,18 +406,76 @@ class BaseDestination(ABC):
             "Destination %s reading from directory %s", self.name, str(dir)
         )
         tables: dict[str, DictTable] = {}
-        for path, data in self.iterate_data_in_files(dir):
+
+        def add_rows(path: str, rows: list[DictRow]):
             found_tables = self.flatten_dict_rows(
-                data,
+                rows,
                 root_table_name,
-                {"path": str(path)},
-                [["path"], ["dt"]],
+                {"path": path},
+                [["record_id"]],
             )
             for table_name, table in found_tables.items():
                 if table_name in tables:
                     tables[table_name].merge(table)
                 else:
                     tables[table_name] = table
+
+        location_hashes = LocationHashes(
+            canonical_keys.locations() if canonical_keys is not None else ()
+        )
+        staged: set[tuple[str, int]] = set()
+        # Non canonical copies by key, with the path of their file
+        pending: dict[tuple[str, int], tuple[str, DictRow]] = {}
+        duplicates = 0
+        for path, data in self.iterate_data_in_files(
+            dir, start_date, end_date, locations
+        ):
+            # Stamp typed keys so downstream models do not need to parse the path
+            location = location_from_path(path)
+            location_hashes.add(location)
+            partition_day = partition_day_from_path(path)
+            rows: list[DictRow] = []
+            for row in data:
+                dt = int(row["dt"])
+                key = (location, dt)
+                # Duplicates are dropped before flattening, with their nested rows
+                if key in staged:
+                    duplicates += 1
+                    continue
+                row["dt"] = dt
+                row["location"] = location
+                row["record_id"] = record_key(location, dt)
+
+                if dt // SECONDS_PER_DAY != partition_day:
+                    if key in pending or (
+                        canonical_keys is not None
+                        and canonical_keys.contains(root_table_name, location, dt)
+                    ):
+                        duplicates += 1
+                    else:
+                        pending[key] = (str(path), row)
+                    continue
+
+                if pending.pop(key, None) is not None:
+                    duplicates += 1
+                staged.add(key)
+                if staged_keys is not None:
+                    staged_keys.add(root_table_name, location, dt)
+                rows.append(row)
+
+            add_rows(str(path), rows)
+
+        # Copies without a canonical one, grouped back by file
+        pending_by_path: dict[str, list[DictRow]] = defaultdict(list)
+        for path, row in pending.values():
+            pending_by_path[path].append(row)
+        for path, rows in pending_by_path.items():
+            add_rows(path, rows)
+
+        if duplicates:
+            self.logger.info("Dropped %s duplicated readings in %s", duplicates, dir)
+        for table_name, table in tables.items():
+            table.set_column_types(get_key_column_types(table_name == root_table_name))
         return tables
 
     def extract_keys(
@@ -81,8 +484,16 @@ class BaseDestination(ABC):
         all_paths: list | None = None,
         previous_path: list | None = None,
         row_id: Any = None,
-    ) -> tuple[NestedKeyPath, list[NestedKeyPath], dict[str, DictTable]]:
-        secondary_tables = {}
+        child_rows: dict[str, tuple[list[DictRow], list[Any]]] | None = None,
+    ) -> tuple[
+        NestedKeyPath,
+        list[NestedKeyPath],
+        dict[str, tuple[list[DictRow], list[Any]]],
+    ]:
+        # Rows in nested lists are collected by table, next to the id of their parent
+        if child_rows is None:
+            child_rows = {}
+
         if previous_path is None:
             previous_path = []
 
@@ -92,19 +503,21 @@ class BaseDestination(ABC):
         for k, v in dictionary.items():
             if isinstance(v, dict):
                 _, all_paths, _ = self.extract_keys(
-                    v, all_paths, previous_path + [k], row_id
+                    v, all_paths, previous_path + [k], row_id, child_rows
                 )
             elif isinstance(v, list):
-                secondary_tables = self.flatten_dict_rows(
-                    v, "__".join(previous_path + [k]), {"parent_id": row_id}
+                rows, parent_ids = child_rows.setdefault(
+                    "__".join(previous_path + [k]), ([], [])
                 )
+                rows.extend(v)
+                parent_ids.extend([row_id] * len(v))
             else:
                 full_path = previous_path + [k]
                 if full_path not in all_paths:
                     all_paths.append(full_path)
 
         all_paths.sort()
-        return previous_path, all_paths, secondary_tables
+        return previous_path, all_paths, child_rows
 
     def flatten_dict_rows(
         self,
@@ -112,32 +525,51 @@ class BaseDestination(ABC):
         table_name: str = "root",
         id_stamp: dict[str, str] | None = None,
         id_of_rows: list[list[str]] | None = None,
+        parent_ids: list[Any] | None = None,
     ) -> dict[str, DictTable]:
 
-        def get_compound_id(dictionary: dict, keys: list[list[str]]) -> str:
+        def get_compound_id(dictionary: dict, keys: list[list[str]]) -> Any:
+            # A single key keeps its original type
+            if len(keys) == 1:
+                return DictTable.access_nested_key(dictionary, keys[0], as_string=False)
+
             values = []
             for nested_keys in keys:
                 values.append(str(DictTable.access_nested_key(dictionary, nested_keys)))
             return "-".join(values)
 
-        tables_found = {table_name: DictTable(table_name)}
-        all_paths = []
+        table = DictTable(table_name)
+        tables_found = {table_name: table}
+        all_paths: list[NestedKeyPath] = []
+        if parent_ids is not None:
+            all_paths.append([table_name, "parent_id"])
+
+        child_rows: dict[str, tuple[list[DictRow], list[Any]]] = {}
         for row in rows:
             if id_stamp:
                 row.update(id_stamp)
             row_id = None
             if id_of_rows:
                 row_id = get_compound_id(row, id_of_rows)
-            _, all_paths, secondary_tables = self.extract_keys(
-                row, all_paths, [table_name], row_id
+            _, all_paths, _ = self.extract_keys(
+                row, all_paths, [table_name], row_id, child_rows
             )
-            tables_found[table_name].update_columns(all_paths)
-            for found_table_name, found_table in secondary_tables.items():
+            table.update_columns(all_paths)
+
+        table.set_rows(rows)
+        if parent_ids is not None:
+            table.update_columns(all_paths)
+            table.buffers["parent_id"] = parent_ids
+
+        # Each nested table is flattened once with the rows of all the parents
+        for child_name, (children, children_parent_ids) in child_rows.items():
+            found_tables = self.flatten_dict_rows(
+                children, child_name, parent_ids=children_parent_ids
+            )
+            for found_table_name, found_table in found_tables.items():
                 if found_table_name in tables_found:
                     tables_found[found_table_name].merge(found_table)
                 else:
                     tables_found[found_table_name] = found_table
 
-        tables_found[table_name].set_rows(rows)
-
         return tables_found
@@ -0,0 +1,360 @@
+import asyncio
+import time
+from collections import Counter
+from threading import Lock
+from typing import IO, Any, AsyncGenerator, Generator
+
+from azure.storage.filedatalake import PathProperties
+
+
+# In-process stand-in of `DataLakeServiceClient` implementing the subset of the API used
+# by the `ADLS` destination. Files are kept in memory, every API call waits `latency_s`
+# seconds plus the time needed to move its bytes at `bandwidth_mbps`, and calls and
+# bytes are counted to measure the I/O patterns of the pipeline offline.
+class FakeDataLakeServiceClient:
+
+    def __init__(
+        self,
+        account_name: str = "fakeaccount",
+        latency_s: float = 0.0,
+        bandwidth_mbps: float | None = None,
+    ) -> None:
+        self.account_name = account_name
+        self.latency_s = latency_s
+        self.bandwidth_mbps = bandwidth_mbps
+        self.file_systems: dict[str, "FakeFileSystemClient"] = {}
+        self.calls: Counter[str] = Counter()
+        self.bytes_uploaded = 0
+        self.bytes_downloaded = 0
+        self.lock = Lock()
+
+    def count_call(
+        self, operation: str, uploaded: int = 0, downloaded: int = 0
+    ) -> float:
+        # Returns the seconds the call takes
+        with self.lock:
+            self.calls[operation] += 1
+            self.bytes_uploaded += uploaded
+            self.bytes_downloaded += downloaded
+
+        wait_s = self.latency_s
+        if self.bandwidth_mbps:
+            wait_s += (uploaded + downloaded) * 8 / (self.bandwidth_mbps * 1e6)
+        return wait_s
+
+    def api_call(self, operation: str, uploaded: int = 0, downloaded: int = 0):
+        wait_s = self.count_call(operation, uploaded, downloaded)
+        if wait_s:
+            time.sleep(wait_s)
+
+    async def async_api_call(
+        self, operation: str, uploaded: int = 0, downloaded: int = 0
+    ):
+        wait_s = self.count_call(operation, uploaded, downloaded)
+        if wait_s:
+            await asyncio.sleep(wait_s)
+
+    def get_async_client(self) -> "FakeAsyncDataLakeServiceClient":
+        # Client of the async API sharing the files and the stats of this one
+        return FakeAsyncDataLakeServiceClient(self)
+
+    def get_stats(self) -> dict[str, Any]:
+        return {
+            "calls": dict(self.calls),
+            "total_calls": sum(self.calls.values()),
+            "bytes_uploaded": self.bytes_uploaded,
+            "bytes_downloaded": self.bytes_downloaded,
+        }
+
+    def reset_stats(self):
+        with self.lock:
+            self.calls.clear()
+            self.bytes_uploaded = 0
+            self.bytes_downloaded = 0
+
+    def create_file_system(self, file_system: str) -> "FakeFileSystemClient":
+        self.api_call("create_file_system")
+        return self.file_systems.setdefault(
+            file_system, FakeFileSystemClient(self, file_system)
+        )
+
+    def get_file_system_client(self, file_system: str) -> "FakeFileSystemClient":
+        if file_system in self.file_systems:
+            return self.file_systems[file_system]
+        return FakeFileSystemClient(self, file_system, registered=False)
+
+
+class FakeFileSystemClient:
+
+    def __init__(
+        self,
+        service: FakeDataLakeServiceClient,
+        name: str,
+        registered: bool = True,
+    ) -> None:
+        self.service = service
+        self.file_system_name = name
+        self.registered = registered
+        self.files: dict[str, bytes] = {}
+        self.directories: set[str] = set()
+        self.lock = Lock()
+
+    def exists(self) -> bool:
+        self.service.api_call("get_file_system_properties")
+        return self.registered
+
+    def get_directory_client(self, directory: str) -> "FakeDirectoryClient":
+        return FakeDirectoryClient(self, directory)
+
+    def get_file_client(self, file_path: str) -> "FakeFileClient":
+        return FakeFileClient(self, file_path)
+
+    def add_directory(self, path: str):
+        with self.lock:
+            parts = path.strip("/").split("/")
+            for idx in range(len(parts)):
+                self.directories.add("/".join(parts[: idx + 1]))
+
+    def list_paths(self, path: str, recursive: bool = True) -> list[PathProperties]:
+        prefix = path.strip("/") + "/" if path.strip("/") else ""
+
+        def is_listed(name: str) -> bool:
+            return name.startswith(prefix) and (
+                recursive or "/" not in name[len(prefix) :]
+            )
+
+        with self.lock:
+            paths = [
+                PathProperties(name=name, is_directory=True)
+                for name in self.directories
+                if is_listed(name)
+            ] + [
+                PathProperties(
+                    name=name, is_directory=False, content_length=len(content)
+                )
+                for name, content in self.files.items()
+                if is_listed(name)
+            ]
+        return sorted(paths, key=lambda path: path.name)
+
+    def delete_paths(self, path: str):
+        # Not part of the Azure API, helper to reset directories between tests
+        prefix = path.strip("/") + "/"
+        with self.lock:
+            self.files = {
+                name: content
+                for name, content in self.files.items()
+                if not name.startswith(prefix)
+            }
+            self.directories = {
+                name for name in self.directories if not name.startswith(prefix)
+            }
+
+
+class FakeDirectoryClient:
+
+    def __init__(self, file_system: FakeFileSystemClient, path: str) -> None:
+        self.file_system = file_system
+        self.service = file_system.service
+        self.path_name = path
+
+    def exists(self) -> bool:
+        self.service.api_call("get_path_properties")
+        return (
+            self.path_name.strip("/") == ""
+            or self.path_name.strip("/") in self.file_system.directories
+        )
+
+    def create_directory(self):
+        self.service.api_call("create_directory")
+        self.file_system.add_directory(self.path_name)
+
+    def delete_directory(self):
+        self.service.api_call("delete_directory")
+        if self.path_name.strip("/") not in self.file_system.directories:
+            raise FileNotFoundError(f"'{self.path_name}' not found")
+        self.file_system.delete_paths(self.path_name)
+        with self.file_system.lock:
+            self.file_system.directories.discard(self.path_name.strip("/"))
+
+    def get_paths(
+        self, recursive: bool = True
+    ) -> Generator[PathProperties, None, None]:
+        # The real service returns up to 5000 paths per listing call
+        paths = self.file_system.list_paths(self.path_name, recursive)
+        for page_start in range(0, max(len(paths), 1), 5000):
+            self.service.api_call("list_paths")
+            yield from paths[page_start : page_start + 5000]
+
+    def get_file_client(self, file: str) -> "FakeFileClient":
+        path = self.path_name.strip("/")
+        return FakeFileClient(self.file_system, f"{path}/{file}" if path else file)
+
+
+class FakeDownloader:
+
+    def __init__(self, content: bytes) -> None:
+        self.content = content
+
+    def readall(self) -> bytes:
+        return self.content
+
+
+class FakeFileClient:
+
+    def __init__(self, file_system: FakeFileSystemClient, path: str) -> None:
+        self.file_system = file_system
+        self.service = file_system.service
+        self.path_name = path.strip("/")
+
+    def exists(self) -> bool:
+        self.service.api_call("get_path_properties")
+        return self.path_name in self.file_system.files
+
+    def upload_data(self, data: bytes | IO[bytes], overwrite: bool = False, **_):
+        content = data if isinstance(data, bytes) else data.read()
+        if not overwrite and self.path_name in self.file_system.files:
+            raise FileExistsError(f"'{self.path_name}' already exists")
+
+        self.service.api_call("upload", uploaded=len(content))
+        if "/" in self.path_name:
+            self.file_system.add_directory(self.path_name.rsplit("/", 1)[0])
+        with self.file_system.lock:
+            self.file_system.files[self.path_name] = bytes(content)
+
+    def delete_file(self):
+        self.service.api_call("delete_file")
+        with self.file_system.lock:
+            if self.file_system.files.pop(self.path_name, None) is None:
+                raise FileNotFoundError(f"'{self.path_name}' not found")
+
+    def download_file(self) -> FakeDownloader:
+        if self.path_name not in self.file_system.files:
+            raise FileNotFoundError(f"'{self.path_name}' not found")
+
+        content = self.file_system.files[self.path_name]
+        self.service.api_call("download", downloaded=len(content))
+        return FakeDownloader(content)
+
+
+# Stand-in of `azure.storage.filedatalake.aio.DataLakeServiceClient`, used by the
+# `AsyncADLS` destination. Calls wait with `asyncio.sleep`, so concurrent calls on an
+# event loop overlap like they do against the real service
+class FakeAsyncDataLakeServiceClient:
+
+    def __init__(self, service: FakeDataLakeServiceClient) -> None:
+        self.service = service
+        self.account_name = service.account_name
+
+    def get_file_system_client(self, file_system: str) -> "FakeAsyncFileSystemClient":
+        return FakeAsyncFileSystemClient(
+            self.service.get_file_system_client(file_system)
+        )
+
+    async def close(self):
+        pass
+
+
+class FakeAsyncFileSystemClient:
+
+    def __init__(self, file_system: FakeFileSystemClient) -> None:
+        self.file_system = file_system
+        self.service = file_system.service
+
+    async def exists(self) -> bool:
+        await self.service.async_api_call("get_file_system_properties")
+        return self.file_system.registered
+
+    def get_directory_client(self, directory: str) -> "FakeAsyncDirectoryClient":
+        return FakeAsyncDirectoryClient(
+            self.file_system.get_directory_client(directory)
+        )
+
+    def get_file_client(self, file_path: str) -> "FakeAsyncFileClient":
+        return FakeAsyncFileClient(self.file_system.get_file_client(file_path))
+
+
+class FakeAsyncDirectoryClient:
+
+    def __init__(self, directory: FakeDirectoryClient) -> None:
+        self.directory = directory
+        self.file_system = directory.file_system
+        self.service = directory.service
+        self.path_name = directory.path_name
+
+    async def exists(self) -> bool:
+        await self.service.async_api_call("get_path_properties")
+        return (
+            self.path_name.strip("/") == ""
+            or self.path_name.strip("/") in self.file_system.directories
+        )
+
+    async def create_directory(self):
+        await self.service.async_api_call("create_directory")
+        self.file_system.add_directory(self.path_name)
+
+    async def delete_directory(self):
+        await self.service.async_api_call("delete_directory")
+        if self.path_name.strip("/") not in self.file_system.directories:
+            raise FileNotFoundError(f"'{self.path_name}' not found")
+        self.file_system.delete_paths(self.path_name)
+        with self.file_system.lock:
+            self.file_system.directories.discard(self.path_name.strip("/"))
+
+    async def get_paths(
+        self, recursive: bool = True
+    ) -> AsyncGenerator[PathProperties, None]:
+        paths = self.file_system.list_paths(self.path_name, recursive)
+        for page_start in range(0, max(len(paths), 1), 5000):
+            await self.service.async_api_call("list_paths")
+            for path in paths[page_start : page_start + 5000]:
+                yield path
+
+    def get_file_client(self, file: str) -> "FakeAsyncFileClient":
+        return FakeAsyncFileClient(self.directory.get_file_client(file))
+
+
+class FakeAsyncDownloader:
+
+    def __init__(self, content: bytes) -> None:
+        self.content = content
+
+    async def readall(self) -> bytes:
+        return self.content
+
+
+class FakeAsyncFileClient:
+
+    def __init__(self, file: FakeFileClient) -> None:
+        self.file_system = file.file_system
+        self.service = file.service
+        self.path_name = file.path_name
+
+    async def exists(self) -> bool:
+        await self.service.async_api_call("get_path_properties")
+        return self.path_name in self.file_system.files
+
+    async def upload_data(self, data: bytes | IO[bytes], overwrite: bool = False, **_):
+        content = data if isinstance(data, bytes) else data.read()
+        if not overwrite and self.path_name in self.file_system.files:
+            raise FileExistsError(f"'{self.path_name}' already exists")
+
+        await self.service.async_api_call("upload", uploaded=len(content))
+        if "/" in self.path_name:
+            self.file_system.add_directory(self.path_name.rsplit("/", 1)[0])
+        with self.file_system.lock:
+            self.file_system.files[self.path_name] = bytes(content)
+
+    async def delete_file(self):
+        await self.service.async_api_call("delete_file")
+        with self.file_system.lock:
+            if self.file_system.files.pop(self.path_name, None) is None:
+                raise FileNotFoundError(f"'{self.path_name}' not found")
+
+    async def download_file(self) -> FakeAsyncDownloader:
+        if self.path_name not in self.file_system.files:
+            raise FileNotFoundError(f"'{self.path_name}' not found")
+
+        content = self.file_system.files[self.path_name]
+        await self.service.async_api_call("download", downloaded=len(content))
+        return FakeAsyncDownloader(content)
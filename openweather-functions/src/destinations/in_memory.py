@@ -0,0 +1,130 @@
+import json
+from collections import defaultdict
+from datetime import date
+from pathlib import Path
+from typing import Any, Generator, Iterable
+
+import pyarrow as pa
+from duckdb import DuckDBPyConnection, DuckDBPyRelation
+from polars import DataFrame
+
+from src.destinations.base_destination import BaseDestination
+from src.utils.types import Batch, Relation, StoredPath
+
+
+class InMemoryDestination(BaseDestination):
+    # Keeps saved data in memory, used to chain pipeline steps without storage round
+    # trips. Data is stored as given, so readers may modify saved batches, while
+    # `contents` keeps saved batches encoded as they were saved
+
+    def __init__(self, name: str = "memory") -> None:
+        super().__init__()
+        self.name = f"In Memory ({name})"
+        self.files: dict[str, Any] = {}
+        self.contents: dict[str, bytes] = {}
+        self.tables: dict[str, DataFrame | pa.Table] = {}
+
+    @staticmethod
+    def _key(path: Path | str) -> str:
+        return Path(path).as_posix().strip("/")
+
+    def save_batch(
+        self, batch: Batch, out_file_path: Path, content: bytes | None = None
+    ):
+        key = self._key(out_file_path)
+        self.files[key] = batch
+        self.contents[key] = self.encode_json(batch) if content is None else content
+
+    def get_last_date_saved(self) -> dict[str, date]:
+        max_dates: dict[str, date] = defaultdict(lambda: date(1, 1, 1))
+        for key in self.files:
+            *dir, date_str, _ = key.split("/")
+            try:
+                new_date = date.fromisoformat(date_str)
+            except ValueError:
+                continue
+            max_dates["/".join(dir)] = max(new_date, max_dates["/".join(dir)])
+        return dict(max_dates)
+
+    def read_json_file(
+        self, path: Path | str, prepend_context: bool = False
+    ) -> tuple[str, Any]:
+        key = self._key(path)
+        return key, self.files[key]
+
+    def list_paths(
+        self, dir: Path | str = ".", recursive: bool = True
+    ) -> list[StoredPath]:
+        prefix = "" if self._key(dir) in ("", ".") else self._key(dir) + "/"
+        paths: dict[str, StoredPath] = {}
+        for key in self.files:
+            if not key.startswith(prefix):
+                continue
+            parts = key[len(prefix) :].split("/")
+            # Directories are implied by the keys of the files
+            for idx in range(1, len(parts) if recursive else min(len(parts), 2)):
+                name = prefix + "/".join(parts[:idx])
+                paths[name] = StoredPath(name=name, is_directory=True, size=0)
+            if recursive or len(parts) == 1:
+                paths[key] = StoredPath(
+                    name=key, is_directory=False, size=len(self.contents.get(key, b""))
+                )
+        return list(paths.values())
+
+    def read_bytes(self, path: str) -> bytes:
+        key = self._key(path)
+        return self.contents.get(key) or self.encode_json(self.files[key])
+
+    def delete_path(self, path: str, is_directory: bool = False):
+        key = self._key(path)
+        for stored in [self.files, self.contents]:
+            for name in list(stored):
+                if name == key or (is_directory and name.startswith(key + "/")):
+                    del stored[name]
+
+    def exists(self, path: str) -> bool:
+        key = self._key(path)
+        return key in self.files or key.removesuffix(".parquet") in self.tables
+
+    def read_parquet(self, con: DuckDBPyConnection, path: str) -> DuckDBPyRelation:
+        df = self.tables[self._key(path).removesuffix(".parquet")]
+        return con.from_arrow(df.to_arrow() if isinstance(df, DataFrame) else df)
+
+    def iterate_data_in_files(
+        self,
+        dir: Path | str = ".",
+        start_date: date | None = None,
+        end_date: date | None = None,
+        locations: Iterable[str] | None = None,
+        ordered: bool = False,
+    ) -> Generator[tuple[str, Batch], None, None]:
+        # Saved batches are returned as they are, without decoding their content
+        paths = self.list_data_files(dir, start_date, end_date, locations)
+        if ordered:
+            paths.sort(key=lambda path: path["name"])
+        for path in paths:
+            yield path["name"], self.files[path["name"]]
+
+    def save_relation_as_parquet(self, dir: Path | str, df: Relation, table_name: str):
+        if isinstance(df, DuckDBPyRelation):
+            df = df.pl()
+        elif isinstance(df, pa.RecordBatchReader):
+            df = df.read_all()
+        self.tables[self._key(Path(dir) / table_name)] = df
+
+    def iter_dir_as_relations(
+        self, con: DuckDBPyConnection, skip_on_error: bool = False
+    ) -> Generator[tuple[str, DuckDBPyRelation], None, None]:
+        for key, df in self.tables.items():
+            if "/" not in key:
+                yield key, con.from_arrow(
+                    df.to_arrow() if isinstance(df, DataFrame) else df
+                )
+
+    def save_bytes(self, content: bytes, file_name: str | Path):
+        key = self._key(file_name)
+        self.files[key] = json.loads(content) if key.endswith(".json") else content
+        self.contents[key] = content
+
+    def save_json(self, data: list[Any] | dict[str, Any], file_name: str | Path):
+        self.files[self._key(file_name)] = data
@@ -1,14 +1,15 @@
 import json
 import logging
+import shutil
 from datetime import date
 from pathlib import Path
 from typing import Generator
 
 from duckdb import DuckDBPyConnection, DuckDBPyRelation
-from polars import DataFrame
 
 from src.destinations.base_destination import BaseDestination
-from src.utils.types import Batch, Any
+from src.utils.instrumentation import run_report
+from src.utils.types import Any, Relation, StoredPath
 
 
 class LocalDirectory(BaseDestination):
@@ -26,14 +27,6 @@ class LocalDirectory(BaseDestination):
             self.print("Creating out directory")
             self.dir.mkdir(parents=True)
 
-    def save_batch(self, batch: Batch, out_file_path: Path):
-        full_local_path = self.dir / out_file_path
-        local_parent = full_local_path.parent
-        if not local_parent.exists():
-            local_parent.mkdir(exist_ok=True, parents=True)
-
-        self.save_json(batch, out_file_path)
-
     def get_last_date_saved(self) -> dict[str, date]:
         self.print(
             "`get_last_date_saved` is not implemented, returning a placeholder value"
@@ -49,21 +42,54 @@ class LocalDirectory(BaseDestination):
             path = self.dir / path
 
         path = path.resolve()
-        with open(path, "r") as f:
-            return str(path), json.load(f)
+        with run_report.span("read_json", destination=self.name) as span:
+            with open(path, "r") as f:
+                data = json.load(f)
+            span.set(bytes=path.stat().st_size, rows=len(data))
+        return str(path), data
+
+    def list_paths(
+        self, dir: Path | str = ".", recursive: bool = True
+    ) -> list[StoredPath]:
+        paths = (self.dir / dir).rglob("*") if recursive else (self.dir / dir).iterdir()
+        return [
+            StoredPath(
+                name=path.relative_to(self.dir).as_posix(),
+                is_directory=path.is_dir(),
+                size=0 if path.is_dir() else path.stat().st_size,
+            )
+            for path in paths
+        ]
+
+    def read_bytes(self, path: str) -> bytes:
+        return (self.dir / path).read_bytes()
+
+    def delete_path(self, path: str, is_directory: bool = False):
+        if is_directory:
+            shutil.rmtree(self.dir / path)
+        else:
+            (self.dir / path).unlink()
+
+    def delete_empty_directory(self, path: str) -> bool:
+        # Fails on a directory with content, no file written meanwhile is lost
+        try:
+            (self.dir / path).rmdir()
+        except OSError:
+            return False
+        return True
 
-    def iterate_data_in_files(
-        self, dir: Path | str = "."
-    ) -> Generator[tuple[str, list[dict[str, Any]]], None, None]:
-        for date_dir in (self.dir / dir).iterdir():
-            for data_file in date_dir.iterdir():
-                yield self.read_json_file(data_file)
+    def exists(self, path: str) -> bool:
+        return (self.dir / path).exists()
 
     def clean_up(self):
+        # Directories may be removed meanwhile by the clean up of concurrent workers
         if self.dir.exists():
             for dir in self.dir.iterdir():
-                for nested_dir in dir.iterdir():
-                    self._safe_rmdir(nested_dir)
+                try:
+                    for nested_dir in dir.iterdir():
+                        self._safe_rmdir(nested_dir)
+                except (FileNotFoundError, NotADirectoryError):
+                    continue
                 self._safe_rmdir(dir)
             self._safe_rmdir(self.dir)
 
@@ -74,17 +100,14 @@ class LocalDirectory(BaseDestination):
         except OSError:
             pass
 
-    def save_relation_as_parquet(
-        self, dir: Path | str, df: DataFrame | DuckDBPyRelation, table_name: str
-    ):
-        # Different method for different df types
-        fun = "write_parquet" if isinstance(df, DataFrame) else "to_parquet"
-
-        # Add overwrite arg to duckdb df
-        kwargs = {"overwrite": True} if isinstance(df, DuckDBPyRelation) else {}
-
-        # Call method with dynamically generated vars
-        getattr(df, fun)(str(self.dir / dir / (table_name + ".parquet")), **kwargs)
+    def save_relation_as_parquet(self, dir: Path | str, df: Relation, table_name: str):
+        out_path = self.dir / dir / (table_name + ".parquet")
+        out_path.parent.mkdir(exist_ok=True, parents=True)
+        with run_report.span(
+            "write_parquet", destination=self.name, table=table_name
+        ) as span:
+            span.set(rows=self.write_parquet(df, str(out_path), table_name))
+            span.set(bytes=out_path.stat().st_size)
 
     def iter_dir_as_relations(
         self, con: DuckDBPyConnection, skip_on_error: bool = False
@@ -103,6 +126,15 @@ class LocalDirectory(BaseDestination):
                     ) from e
                 logging.warning(f"Could not get relation for file '{path.name}'\n{e}")
 
-    def save_json(self, data: list[Any], file_name: str | Path):
-        with open(self.dir / file_name, "w") as f:
-            json.dump(data, f, indent=2)
+    def save_bytes(self, content: bytes, file_name: str | Path):
+        full_local_path = self.dir / file_name
+        full_local_path.parent.mkdir(exist_ok=True, parents=True)
+
+        with run_report.span("save_file", destination=self.name) as span:
+            try:
+                full_local_path.write_bytes(content)
+            except FileNotFoundError:
+                # Its directory was empty and removed by a concurrent clean up
+                full_local_path.parent.mkdir(exist_ok=True, parents=True)
+                full_local_path.write_bytes(content)
+            span.set(bytes=len(content))
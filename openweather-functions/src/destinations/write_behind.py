@@ -0,0 +1,82 @@
+import logging
+from pathlib import Path
+from queue import Full, Queue
+from threading import Thread
+
+from src.destinations.base_destination import BaseDestination
+from src.utils.instrumentation import in_run_context, run_report
+from src.utils.types import Batch
+
+
+class WriteBehindWriter:
+    # Saves batches to a destination in background threads. Once `max_pending`
+    # batches are waiting, `submit` blocks until a writer frees a slot, so a slow
+    # destination slows the producer down instead of piling batches in memory.
+    # Each path is pinned to one writer, with a queue of its own, so the saves of
+    # the same path happen in the order they were submitted and the last one wins
+
+    def __init__(
+        self, destination: BaseDestination, max_pending: int = 16, workers: int = 2
+    ) -> None:
+        self.destination = destination
+        self.queues: list[Queue[tuple[Batch, Path, bytes | None] | None]] = [
+            Queue(max(1, max_pending // workers)) for _ in range(workers)
+        ]
+        self.error: Exception | None = None
+        self.logger = logging.getLogger()
+        self.threads = [
+            Thread(
+                target=in_run_context(self._write),
+                args=(queue,),
+                name=f"write-behind-{destination.name}-{idx}",
+                daemon=True,
+            )
+            for idx, queue in enumerate(self.queues)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def _write(self, queue: Queue[tuple[Batch, Path, bytes | None] | None]):
+        while True:
+            item = queue.get()
+            try:
+                if item is None:
+                    return
+                if self.error is None:
+                    self.destination.save_batch(*item)
+            except Exception as e:
+                self.logger.exception("Error saving batch to %s", self.destination.name)
+                self.error = self.error or e
+            finally:
+                queue.task_done()
+
+    def raise_error(self):
+        if self.error is not None:
+            raise RuntimeError(
+                f"Could not save batches to {self.destination.name}"
+            ) from self.error
+
+    def submit(self, batch: Batch, out_file_path: Path, content: bytes | None = None):
+        self.raise_error()
+        queue = self.queues[hash(Path(out_file_path).as_posix()) % len(self.queues)]
+        try:
+            queue.put_nowait((batch, out_file_path, content))
+        except Full:
+            with run_report.span(
+                "write_backpressure", destination=self.destination.name
+            ):
+                queue.put((batch, out_file_path, content))
+
+    def flush(self):
+        for queue in self.queues:
+            queue.join()
+        self.raise_error()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            for queue in self.queues:
+                queue.put(None)
+            for thread in self.threads:
+                thread.join()
@@ -1,13 +1,74 @@
+import multiprocessing
 from pathlib import Path
-from argparse import ArgumentParser
+from argparse import ArgumentParser, Namespace
 
 from src.ingest.openweather import OpenWeather
+from src.ingest.response_cache import ResponseCache
+from src.ingest.sharding import IngestionPlanner, IngestionWorker
+from src.ingest.work_queue import SqliteWorkQueue
 from src.destinations.adls import ADLS
 from src.destinations.local_directory import LocalDirectory
 from src.destinations.base_destination import BaseDestination
+from src.utils.instrumentation import run_report
 from src.utils.timestamp import Timestamp
 
 
+def get_destinations(args: Namespace) -> list[BaseDestination]:
+    destinations: list[BaseDestination] = []
+    if args.upload_to_adls:
+        destinations.append(ADLS(directory=args.out_directory))
+
+    if args.save_local:
+        destinations.append(LocalDirectory(args.out_directory or Path(".")))
+
+    if not destinations:
+        raise ValueError(
+            "Either data is uploaded to adls (-adls), an output directory is given (-o "
+            "<out_dir>) or both."
+        )
+    return destinations
+
+
+def get_report_destination(args: Namespace) -> BaseDestination:
+    # Run reports are kept out of the directory of the ingested data
+    if args.upload_to_adls:
+        return ADLS(directory=args.reports_directory)
+    return LocalDirectory(args.reports_directory)
+
+
+def get_response_cache(args: Namespace) -> ResponseCache | None:
+    if not args.cache_dir:
+        return None
+    return ResponseCache(LocalDirectory(args.cache_dir), args.cache_open_ttl)
+
+
+def run_worker(args: Namespace, worker_number: int):
+    # Local worker process of the sharded ingestion, builds its own destinations
+    worker_id = f"{args.ingestion_id or 'ingest-cli'}-worker-{worker_number}"
+    run_report.start("ingest-cli-worker", worker_id, args.profile)
+    destinations = get_destinations(args)
+    queue = SqliteWorkQueue(args.queue)
+    try:
+        claimed = (
+            IngestionWorker()
+            .set_ingestion(
+                OpenWeather()
+                .set_destinations(destinations)
+                .set_response_cache(get_response_cache(args))
+            )
+            .set_completion_destination(destinations[0])
+            .set_worker_id(worker_id)
+            .run(queue)
+        )
+        print(f"{worker_id} claimed {claimed} work items")
+    except Exception as e:
+        run_report.fail(e)
+        raise e
+    finally:
+        queue.close()
+        run_report.save(get_report_destination(args))
+
+
 if __name__ == "__main__":
     parser = ArgumentParser("OpenWeather Ingestion CLI")
 
@@ -20,52 +81,91 @@ if __name__ == "__main__":
     parser.add_argument("--endpoints", "-e", action="extend", nargs="+", type=str)
     parser.add_argument("--out-directory", "-o")
     parser.add_argument("--ingestion-id", "-id")
+    parser.add_argument("--otel-endpoint")
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--reports-directory", default="run_reports")
+    parser.add_argument("--cache-dir", "-c")
+    parser.add_argument("--cache-open-ttl", type=int, default=0)
+    # Sharded ingestion, through a SQLite file standing in for the storage queue
+    parser.add_argument("--queue", "-q")
+    parser.add_argument("--workers", "-w", type=int, default=4)
+    parser.add_argument("--days-per-item", type=int, default=7)
+    parser.add_argument("--skip-planning", action="store_true")
     args = parser.parse_args()
 
     locations_dir = args.locations_dir
     locations_local = args.locations_local
     start_date = args.start_date
     end_date = args.end_date
-    upload_to_adls = args.upload_to_adls
-    save_local = args.save_local
     endpoints = args.endpoints or "all"
-    out_directory = args.out_directory
     ingestion_id = args.ingestion_id
+    otel_endpoint = args.otel_endpoint
+
+    # Instrumentation
+    if otel_endpoint:
+        run_report.enable_opentelemetry(otel_endpoint)
+    run_report.start("ingest-cli", ingestion_id, args.profile)
 
     # Handle destinations
-    destinations: list[BaseDestination] = []
-    if upload_to_adls:
-        destinations.append(ADLS(directory=out_directory))
+    destinations = get_destinations(args)
 
-    if save_local:
-        if not out_directory:
-            out_directory = Path(".")
-        destinations.append(LocalDirectory(out_directory))
+    # Date range
+    start_date = Timestamp(start_date) if start_date else None
+    end_date = Timestamp(end_date) if end_date else None
 
-    if not destinations:
-        raise ValueError(
-            "Either data is uploaded to adls (-adls), an output directory is given (-o "
-            "<out_dir>) or both."
-        )
+    try:
+        if not (args.queue and args.skip_planning):
+            # Handle locations source
+            if locations_local:
+                locations = LocalDirectory(locations_dir)
+            else:
+                locations = ADLS(directory=locations_dir)
 
-    # Date range
-    start_date = Timestamp(start_date)
-    end_date = Timestamp(end_date)
-
-    # Handle locations source
-    if locations_local:
-        locations = LocalDirectory(locations_dir)
-    else:
-        locations = ADLS(directory=locations_dir)
-
-    open_weather = (
-        OpenWeather()
-        .set_date_range(start_date=start_date, end_date=end_date)
-        .set_location_directory(locations)
-        .set_endpoints(endpoints)
-        .set_destinations(destinations)
-    )
-    if ingestion_id:
-        open_weather.set_ingestion_id(ingestion_id)
-
-    open_weather.fetch()
+            open_weather = (
+                OpenWeather()
+                .set_destinations(destinations)
+                .set_date_range(start_date=start_date, end_date=end_date)
+                .set_location_directory(locations)
+                .set_endpoints(endpoints)
+                .set_response_cache(get_response_cache(args))
+            )
+            if ingestion_id:
+                open_weather.set_ingestion_id(ingestion_id)
+
+            if args.queue:
+                queue = SqliteWorkQueue(args.queue)
+                items = (
+                    IngestionPlanner()
+                    .set_ingestion(open_weather)
+                    .set_days_per_item(args.days_per_item)
+                    .plan()
+                )
+                with run_report.span("enqueue", items=len(items)) as span:
+                    span.set(added=queue.enqueue(items))
+                queue.close()
+            else:
+                open_weather.fetch()
+
+        if args.queue:
+            # Spawned, so workers do not share the clients of the destinations
+            context = multiprocessing.get_context("spawn")
+            workers = [
+                context.Process(target=run_worker, args=(args, number))
+                for number in range(args.workers)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+            queue = SqliteWorkQueue(args.queue)
+            counts = queue.get_counts()
+            queue.close()
+            print(f"Work items: {counts}")
+            if counts.get("pending") or counts.get("failed"):
+                raise RuntimeError(f"Work items were not completed: {counts}")
+    except Exception as e:
+        run_report.fail(e)
+        raise e
+    finally:
+        run_report.save(get_report_destination(args))
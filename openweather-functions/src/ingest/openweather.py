@@ -1,5 +1,6 @@
 import os
 import datetime
+import json
 import requests
 import logging
 from collections import defaultdict
@@ -7,7 +8,12 @@ from pathlib import Path
 from typing import Any, Iterable, Literal, Self
 
 from src.destinations.base_destination import BaseDestination
-from src.utils.timestamp import Timestamp
+from src.destinations.write_behind import WriteBehindWriter
+from src.ingest.response_cache import ResponseCache
+from src.utils.instrumentation import profiled, run_report
+from src.utils.key_index import KeyIndex
+from src.utils.keys import LocationHashes
+from src.utils.timestamp import SECONDS_PER_DAY, Timestamp, epoch_day_to_date
 from src.utils.types import (
     Batch,
     EndpointConfig,
@@ -46,6 +52,10 @@ class OpenWeather:
             ),
         }
         self.destinations: list[BaseDestination] = []
+        self.max_pending_batches: int = 16
+        self.writers_per_destination: int = 2
+        self.writers: list[WriteBehindWriter] = []
+        self.response_cache: ResponseCache | None = None
         self.logger = logging.getLogger()
 
     @property
@@ -132,10 +142,12 @@ class OpenWeather:
                     "q": f'{location["search_name"]},{location["country_code"]}',
                     "limit": 1,
                 }
-                response = requests.get(
-                    f"http://api.openweathermap.org/geo/1.0/direct", params=params
-                )
-                response.raise_for_status()
+                with run_report.span("http_request", endpoint="geocoding") as span:
+                    response = requests.get(
+                        f"http://api.openweathermap.org/geo/1.0/direct", params=params
+                    )
+                    response.raise_for_status()
+                    span.set(bytes=len(response.content))
                 data: dict[str, str] = response.json()[0]
                 if "local_names" in data:
                     data.pop("local_names")
@@ -156,8 +168,19 @@ class OpenWeather:
         if fetched_new_data:
             directory.save_json(self.locations, "locations.json")
 
+        self.check_location_keys()
+        return self
+
+    def set_locations(self, locations: list[Location]) -> Self:
+        # Locations already geocoded, i.e. the location of a work item
+        self.locations = locations
+        self.check_location_keys()
         return self
 
+    def check_location_keys(self):
+        # Fails before fetching if the record keys of two locations would collide
+        LocationHashes(self.get_location_key(location) for location in self.locations)
+
     def set_endpoints(
         self, endpoints: Iterable[AvailableEndpoints] | Literal["all"]
     ) -> Self:
@@ -186,12 +209,37 @@ class OpenWeather:
     def add_destination(self, destination: BaseDestination):
         self.destinations.append(destination)
 
+    def set_write_behind(
+        self, max_pending_batches: int, writers_per_destination: int = 2
+    ) -> Self:
+        # Batches are saved in the background while the next pages are fetched. A
+        # `max_pending_batches` of 0 saves them synchronously
+        self.max_pending_batches = max_pending_batches
+        self.writers_per_destination = writers_per_destination
+        return self
+
+    def set_response_cache(self, response_cache: ResponseCache | None) -> Self:
+        # Responses already fetched are read from the cache instead of the API
+        self.response_cache = response_cache
+        return self
+
+    @profiled("fetch")
     def fetch(self):
 
         if not hasattr(self, "destinations"):
             raise RuntimeError("Output location must be set before fetching data")
 
         self.logger.info("Starting fetch process for %s location.", len(self.locations))
+        if self.max_pending_batches > 0:
+            self.writers = [
+                WriteBehindWriter(
+                    destination,
+                    self.max_pending_batches,
+                    self.writers_per_destination,
+                )
+                for destination in self.destinations
+            ]
+
         try:
             num_locs = len(self.locations)
             for idx, location in enumerate(self.locations):
@@ -207,53 +255,121 @@ class OpenWeather:
         except Exception as e:
             raise e
         finally:
-            for destination in self.destinations:
-                destination.clean_up()
+            try:
+                # Wait for the pending batches before cleaning up destinations
+                for writer in self.writers:
+                    writer.close()
+            finally:
+                self.writers = []
+                for destination in self.destinations:
+                    destination.clean_up()
 
     def fetch_endpoint(self, endpoint: AvailableEndpoints, location: Location):
         finished_fetch = False
         max_date = self.start_date
+        end_day = self.end_date.epoch_day
+        # Readings are saved once, even if pages overlap. A day shared with the
+        # previous page is saved again with the rows of both. Only the days of the last
+        # page are kept, and writes of a path are done in order by one write-behind
+        # worker, so the last one wins
+        saved_keys = KeyIndex()
+        saved_batches: dict[str, Batch] = {}
+        location_key = self.get_location_key(location)
         while not finished_fetch:
             start_date = max_date.get_as_start()
             params = self.get_params(location, start_date=start_date)
             params.update(self.endpoint_config[endpoint]["extra_params"])
 
-            response = requests.get(
-                self.endpoint_config[endpoint]["url"], params=params
-            )
-            response.raise_for_status()
+            content = self.get_response(endpoint, location, params)
 
-            data = response.json()["list"]
+            with run_report.span("json_decode", endpoint=endpoint) as span:
+                data = json.loads(content)["list"]
+                span.set(rows=len(data))
+            max_dt = max_date.unix
             for row in data:
-                row_date = Timestamp(int(row["dt"]))
-                if row_date.datetime.date() == self.end_date.datetime.date():
+                dt = int(row["dt"])
+                if dt // SECONDS_PER_DAY == end_day:
                     finished_fetch = True
                     break
-                elif row_date > max_date:
-                    max_date = row_date
-
-            self.save_raw_data(location, data, endpoint)
+                elif dt > max_dt:
+                    max_dt = dt
+            max_date = Timestamp(max_dt)
+
+            data = [
+                row
+                for row in data
+                if saved_keys.add(endpoint, location_key, int(row["dt"]))
+            ]
+            saved_batches = self.save_raw_data(location, data, endpoint, saved_batches)
             max_date = max_date + datetime.timedelta(days=1)
 
+    def get_response(
+        self, endpoint: AvailableEndpoints, location: Location, params: dict[str, Any]
+    ) -> bytes:
+        url = self.endpoint_config[endpoint]["url"]
+        if self.response_cache is not None:
+            content = self.response_cache.get(url, params)
+            if content is not None:
+                return content
+
+        with run_report.span(
+            "http_request", endpoint=endpoint, location=location["search_name"]
+        ) as span:
+            response = requests.get(url, params=params)
+            response.raise_for_status()
+            span.set(bytes=len(response.content))
+
+        if self.response_cache is not None:
+            self.response_cache.put(url, params, response.content)
+        return response.content
+
     def save_raw_data(
-        self, location: Location, data: list[dict[str, Any]], endpoint_name: str
-    ):
-        for date, batch in self.batch_raw_data(data).items():
+        self,
+        location: Location,
+        data: list[dict[str, Any]],
+        endpoint_name: str,
+        saved_batches: dict[str, Batch] | None = None,
+    ) -> dict[str, Batch]:
+        # Returns the batches saved by date, `saved_batches` are the ones saved before
+        batches = self.batch_raw_data(data)
+        for date, batch in batches.items():
+            if saved_batches and date in saved_batches:
+                batch = batches[date] = saved_batches[date] + batch
             out_file_path = (
-                Path(endpoint_name)
-                / date
-                / (location["search_name"].replace(" ", "_").lower() + ".json")
+                Path(endpoint_name) / date / (self.get_location_key(location) + ".json")
             )
-            for destination in self.destinations:
-                destination.save_batch(batch, out_file_path)
+
+            # Encoded once and shared by all the destinations
+            with run_report.span("json_encode", rows=len(batch)) as span:
+                content = BaseDestination.encode_json(batch)
+                span.set(bytes=len(content))
+
+            if self.writers:
+                for writer in self.writers:
+                    writer.submit(batch, out_file_path, content)
+            else:
+                for destination in self.destinations:
+                    destination.save_batch(batch, out_file_path, content)
+        return batches
+
+    @staticmethod
+    def get_location_key(location: Location) -> str:
+        return location["search_name"].replace(" ", "_").lower()
 
     def batch_raw_data(self, data: list[dict[str, Any]]) -> dict[str, Batch]:
-        batched_data = defaultdict(list)
-        stamp = {"source": self.name, "ingestion_id": self.ingestion_id}
+        # Rows of a response share the ingestion stamp and are bucketed by UTC day
+        # with integer arithmetic instead of building a `Timestamp` per row
+        stamp = {
+            "source": self.name,
+            "ingestion_id": self.ingestion_id,
+            "ingested_at": datetime.datetime.now().isoformat(),
+        }
+        batched_data: dict[int, Batch] = defaultdict(list)
         for row in data:
             row.update(stamp)
-            row["ingested_at"] = datetime.datetime.now().isoformat()
-            dt = Timestamp(row["dt"]).date
-            batched_data[dt].append(row)
+            batched_data[int(row["dt"]) // SECONDS_PER_DAY].append(row)
 
-        return batched_data
+        return {
+            epoch_day_to_date(epoch_day): batch
+            for epoch_day, batch in batched_data.items()
+        }
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import logging
+import time
+from typing import Any
+
+from src.destinations.base_destination import BaseDestination
+from src.utils.instrumentation import run_report
+
+
+class ResponseCache:
+    # Responses of the API saved in a destination, keyed by a hash of the url and the
+    # params without the secret. Entries are stored as their fetch time (unix) in the
+    # first line followed by the response body. Responses fetched after the `end` of
+    # their range only hold closed days and are kept for good, the others expire
+    # after `open_ttl` seconds, with 0 not caching them at all
+
+    def __init__(
+        self,
+        destination: BaseDestination,
+        open_ttl: int = 0,
+        dir: str = "_response_cache",
+    ) -> None:
+        self.destination = destination
+        self.open_ttl = open_ttl
+        self.dir = dir
+        self.hits = 0
+        self.misses = 0
+        self.logger = logging.getLogger()
+
+    @staticmethod
+    def get_key(url: str, params: dict[str, Any]) -> str:
+        # Values are compared as strings, so `40.4` and "40.4" share an entry
+        normalized = {k: str(v) for k, v in params.items() if k != "appid"}
+        return hashlib.sha256(
+            json.dumps([url, normalized], sort_keys=True).encode()
+        ).hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return f"{self.dir}/{key[:2]}/{key}.json"
+
+    def is_fresh(self, cached_at: int, params: dict[str, Any]) -> bool:
+        if "end" in params and cached_at > int(params["end"]):
+            return True
+        return time.time() - cached_at < self.open_ttl
+
+    def get(self, url: str, params: dict[str, Any]) -> bytes | None:
+        path = self.get_path(self.get_key(url, params))
+        if self.destination.exists(path):
+            with run_report.span(
+                "cache_read", destination=self.destination.name
+            ) as span:
+                header, content = self.destination.read_bytes(path).split(b"\n", 1)
+                span.set(bytes=len(content))
+            if self.is_fresh(int(header), params):
+                self.hits += 1
+                return content
+        self.misses += 1
+        return None
+
+    def put(self, url: str, params: dict[str, Any], content: bytes):
+        cached_at = int(time.time())
+        if self.open_ttl <= 0 and not self.is_fresh(cached_at, params):
+            # Still open, cached only with a TTL
+            return
+        self.destination.save_bytes(
+            str(cached_at).encode() + b"\n" + content,
+            self.get_path(self.get_key(url, params)),
+        )
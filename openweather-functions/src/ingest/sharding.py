@@ -0,0 +1,155 @@
+import datetime
+import logging
+import os
+import socket
+from typing import Self
+
+from src.destinations.base_destination import BaseDestination
+from src.ingest.openweather import OpenWeather
+from src.ingest.work_queue import SqliteWorkQueue
+from src.utils.instrumentation import run_report
+from src.utils.timestamp import Timestamp
+from src.utils.types import WorkItem
+
+
+class IngestionPlanner:
+    # Splits an ingestion into work items of one location, endpoint and date range,
+    # fetched by independent workers (see `IngestionWorker`). Item ids only depend on
+    # the ingestion id and the item, so planning the same ingestion again gives the
+    # same items and the ones already completed are skipped
+
+    def __init__(self) -> None:
+        self.name: str = "ingestion-planner"
+        self.ingestion: OpenWeather
+        self.days_per_item: int = 7
+        self.logger = logging.getLogger()
+
+    def set_ingestion(self, ingestion: OpenWeather) -> Self:
+        # With its locations, endpoints and date range set
+        self.ingestion = ingestion
+        return self
+
+    def set_days_per_item(self, days_per_item: int) -> Self:
+        if days_per_item < 1:
+            raise ValueError(f"Days per item must be positive, got {days_per_item}")
+        self.days_per_item = days_per_item
+        return self
+
+    def plan(self) -> list[WorkItem]:
+        items: list[WorkItem] = []
+        for location in self.ingestion.locations:
+            for endpoint in self.ingestion.endpoints:
+                start_date = self.ingestion.start_date
+                while start_date < self.ingestion.end_date:
+                    end_date = min(
+                        (
+                            start_date + datetime.timedelta(days=self.days_per_item - 1)
+                        ).get_as_end(),
+                        self.ingestion.end_date,
+                    )
+                    items.append(
+                        WorkItem(
+                            item_id="/".join(
+                                [
+                                    self.ingestion.ingestion_id,
+                                    endpoint,
+                                    OpenWeather.get_location_key(location),
+                                    f"{start_date.date}_{end_date.date}",
+                                ]
+                            ),
+                            ingestion_id=self.ingestion.ingestion_id,
+                            endpoint=endpoint,
+                            location=location,
+                            start_date=start_date.unix,
+                            end_date=end_date.unix,
+                        )
+                    )
+                    start_date = end_date.get_as_start() + datetime.timedelta(days=1)
+
+        self.logger.info(
+            "Planned %s work items for %s locations",
+            len(items),
+            len(self.ingestion.locations),
+        )
+        return items
+
+
+class IngestionWorker:
+    # Fetches work items into the destinations of its ingestion. Completed items are
+    # marked in a destination shared by all the workers, so items delivered more than
+    # once (queue retries, an ingestion planned twice) are only fetched once. Raw
+    # files are overwritten, so an item that failed halfway is fetched again whole
+
+    def __init__(self) -> None:
+        self.name: str = "ingestion-worker"
+        self.ingestion: OpenWeather
+        self.completed: BaseDestination
+        self.worker_id: str = f"{socket.gethostname()}-{os.getpid()}"
+        self.logger = logging.getLogger()
+
+    def set_ingestion(self, ingestion: OpenWeather) -> Self:
+        # With its destinations set, locations and dates are taken from the items
+        self.ingestion = ingestion
+        return self
+
+    def set_completion_destination(self, destination: BaseDestination) -> Self:
+        self.completed = destination
+        return self
+
+    def set_worker_id(self, worker_id: str | None) -> Self:
+        if worker_id:
+            self.worker_id = worker_id
+        return self
+
+    @staticmethod
+    def get_marker_path(item: WorkItem) -> str:
+        return f"_work_items/{item['item_id']}.json"
+
+    def is_completed(self, item: WorkItem) -> bool:
+        return self.completed.exists(self.get_marker_path(item))
+
+    def process(self, item: WorkItem) -> bool:
+        # Returns whether the item was fetched, False if it was already completed
+        if self.is_completed(item):
+            self.logger.info("Skipping completed work item %s", item["item_id"])
+            return False
+
+        self.logger.info("Processing work item %s", item["item_id"])
+        with run_report.span("work_item", item_id=item["item_id"]):
+            (
+                self.ingestion.set_locations([item["location"]])
+                .set_endpoints([item["endpoint"]])
+                .set_ingestion_id(item["ingestion_id"])
+                .set_date_range(
+                    Timestamp(item["start_date"]), Timestamp(item["end_date"])
+                )
+                .fetch()
+            )
+
+        # Only marked once all its batches are saved
+        self.completed.save_json(
+            {
+                **item,
+                "worker_id": self.worker_id,
+                "completed_at": datetime.datetime.now().isoformat(),
+            },
+            self.get_marker_path(item),
+        )
+        return True
+
+    def run(self, queue: SqliteWorkQueue, max_items: int | None = None) -> int:
+        # Claims items until the queue is empty, returns the items claimed
+        claimed = 0
+        while max_items is None or claimed < max_items:
+            item = queue.claim(self.worker_id)
+            if item is None:
+                break
+            claimed += 1
+            try:
+                self.process(item)
+            except Exception as e:
+                self.logger.exception("Work item %s failed", item["item_id"])
+                queue.fail(item["item_id"], repr(e))
+            else:
+                queue.complete(item["item_id"])
+        return claimed
@@ -0,0 +1,130 @@
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable
+
+from src.utils.types import WorkItem
+
+
+class SqliteWorkQueue:
+    # Local stand-in of the storage queue of the sharded ingestion, shared by the
+    # worker processes through a SQLite file. Claimed items are leased to their
+    # worker, so the items of a worker that died are claimed again once the lease
+    # expires, and failed items are retried up to `max_attempts` times like queue
+    # messages are before going to the poison queue
+
+    def __init__(
+        self, path: str | Path, lease_seconds: int = 600, max_attempts: int = 5
+    ) -> None:
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        # Transactions are opened explicitly, see `claim`
+        self.con = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.con.execute("pragma journal_mode = wal")
+        self.con.execute(
+            """
+            create table if not exists work_items (
+                item_id text primary key,
+                payload text not null,
+                status text not null default 'pending',
+                attempts integer not null default 0,
+                worker_id text,
+                leased_until real,
+                error text,
+                enqueued_at real not null,
+                completed_at real
+            )
+            """
+        )
+
+    def enqueue(self, items: Iterable[WorkItem]) -> int:
+        # Items already in the queue are kept as they are, so planning twice does not
+        # fetch completed items again. Returns the items added
+        now = time.time()
+        changes = self.con.total_changes
+        self.con.execute("begin immediate")
+        try:
+            self.con.executemany(
+                "insert or ignore into work_items (item_id, payload, enqueued_at) "
+                "values (?, ?, ?)",
+                [(item["item_id"], json.dumps(item), now) for item in items],
+            )
+        except Exception as e:
+            self.con.execute("rollback")
+            raise e
+        self.con.execute("commit")
+        return self.con.total_changes - changes
+
+    def claim(self, worker_id: str) -> WorkItem | None:
+        # Next pending item, or item whose lease expired, None if there are none
+        now = time.time()
+        self.con.execute("begin immediate")
+        try:
+            self.con.execute(
+                """
+                update work_items
+                set status = 'failed', error = 'Lease expired'
+                where status = 'running' and leased_until < ? and attempts >= ?
+                """,
+                (now, self.max_attempts),
+            )
+            row = self.con.execute(
+                """
+                update work_items
+                set
+                    status = 'running',
+                    attempts = attempts + 1,
+                    worker_id = ?,
+                    leased_until = ?
+                where item_id = (
+                    select item_id
+                    from work_items
+                    where
+                        status = 'pending'
+                        or (status = 'running' and leased_until < ?)
+                    order by enqueued_at, item_id
+                    limit 1
+                )
+                returning payload
+                """,
+                (worker_id, now + self.lease_seconds, now),
+            ).fetchone()
+        except Exception as e:
+            self.con.execute("rollback")
+            raise e
+        self.con.execute("commit")
+        return json.loads(row[0]) if row else None
+
+    def complete(self, item_id: str):
+        self.con.execute(
+            "update work_items set status = 'done', error = null, completed_at = ? "
+            "where item_id = ?",
+            (time.time(), item_id),
+        )
+
+    def fail(self, item_id: str, error: str):
+        # Released to be claimed again, unless it ran out of attempts
+        self.con.execute(
+            """
+            update work_items
+            set
+                status = case when attempts >= ? then 'failed' else 'pending' end,
+                leased_until = null,
+                error = ?
+            where item_id = ?
+            """,
+            (self.max_attempts, error, item_id),
+        )
+
+    def get_counts(self) -> dict[str, int]:
+        return dict(
+            self.con.execute(
+                "select status, count(*) from work_items group by status"
+            ).fetchall()
+        )
+
+    def close(self):
+        self.con.close()
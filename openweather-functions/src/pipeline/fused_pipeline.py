@@ -0,0 +1,142 @@
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Self
+
+from duckdb import DuckDBPyConnection
+
+from src.destinations.base_destination import BaseDestination
+from src.destinations.in_memory import InMemoryDestination
+from src.ingest.openweather import OpenWeather
+from src.transform.flattener import Flattener
+from src.transform.transformer import Transformer
+from src.utils.instrumentation import in_run_context, run_report
+
+
+class FusedPipeline:
+    # Runs ingestion, staging and transformation in a single pass. Fetched batches are
+    # flattened in memory and loaded into DuckDB next to the stored bronze tables, while
+    # raw and bronze are persisted in the background for lineage
+
+    def __init__(self, con: DuckDBPyConnection, max_writers: int = 4) -> None:
+        self.name = "fused_pipeline"
+        self.con = con
+        self.open_weather: OpenWeather
+        self.flattener: Flattener
+        self.transformer: Transformer
+        self.max_writers = max_writers
+        self.logger = logging.getLogger()
+
+    def set_ingestion(self, open_weather: OpenWeather) -> Self:
+        # Its destinations are the raw layer, persisted asynchronously
+        self.open_weather = open_weather
+        return self
+
+    def set_staging(self, flattener: Flattener) -> Self:
+        # Its target is the bronze layer, persisted asynchronously
+        self.flattener = flattener
+        return self
+
+    def set_transformer(self, transformer: Transformer) -> Self:
+        self.transformer = transformer
+        return self
+
+    def run(self):
+        raw_destinations = self.open_weather.destinations
+        bronze = self.flattener.target
+        raw_in_memory = InMemoryDestination("raw")
+        bronze_in_memory = InMemoryDestination("bronze")
+
+        with ThreadPoolExecutor(self.max_writers, "persist") as executor:
+            pending: list[Future] = []
+            try:
+                with run_report.span("fetch"):
+                    self.open_weather.set_destinations([raw_in_memory]).fetch()
+                self.open_weather.set_destinations(raw_destinations)
+
+                # Staging stamps keys in the fetched rows, raw is saved as encoded
+                # when fetched
+                for destination in raw_destinations:
+                    pending.append(
+                        executor.submit(
+                            in_run_context(self.persist_raw),
+                            destination,
+                            raw_in_memory.contents,
+                        )
+                    )
+
+                # Readings already in bronze are deduplicated against its key index,
+                # which the new readings are added to
+                self.load_key_indexes(bronze, bronze_in_memory)
+                with run_report.span("stage"):
+                    (
+                        self.flattener.set_source(raw_in_memory)
+                        .set_target(bronze_in_memory)
+                        .set_appending()
+                        .flatten()
+                    )
+                self.flattener.set_target(bronze).set_appending(False)
+
+                with run_report.span("load"):
+                    (
+                        self.transformer.import_tables_from_dir(
+                            bronze
+                        ).upsert_tables_from_dir(bronze_in_memory)
+                    )
+
+                bronze_pending = [
+                    executor.submit(
+                        in_run_context(self.persist_bronze), bronze, table_name
+                    )
+                    for table_name in bronze_in_memory.tables
+                ]
+                pending.extend(bronze_pending)
+
+                with run_report.span("transform"):
+                    self.transformer.execute()
+
+                # Saved once the tables are, so the index never holds readings
+                # missing in bronze
+                for future in bronze_pending:
+                    future.result()
+                self.persist_key_indexes(bronze, bronze_in_memory)
+            finally:
+                # Fail if any layer could not be persisted
+                for future in pending:
+                    future.result()
+                for destination in raw_destinations:
+                    destination.clean_up()
+
+    def load_key_indexes(self, bronze: BaseDestination, target: BaseDestination):
+        for dir in self.flattener.directories:
+            path = self.flattener.get_key_index_path(dir)
+            if bronze.exists(path):
+                target.save_bytes(bronze.read_bytes(path), path)
+
+    def persist_key_indexes(self, bronze: BaseDestination, source: BaseDestination):
+        with run_report.span("persist_key_index", destination=bronze.name):
+            for dir in self.flattener.directories:
+                path = self.flattener.get_key_index_path(dir)
+                bronze.save_bytes(source.read_bytes(path), path)
+
+    def persist_raw(self, destination: BaseDestination, contents: dict[str, bytes]):
+        self.logger.info(
+            "Persisting %s raw files to %s", len(contents), destination.name
+        )
+        with run_report.span("persist_raw", destination=destination.name):
+            for path, content in contents.items():
+                destination.save_bytes(content, Path(path))
+
+    def persist_bronze(self, destination: BaseDestination, table_name: str):
+        self.logger.info(
+            "Persisting bronze table %s to %s", table_name, destination.name
+        )
+        # DuckDB connections are not thread safe, each writer uses its own cursor
+        cursor = self.con.cursor()
+        try:
+            with run_report.span("persist_bronze", table=table_name):
+                destination.save_relation_as_parquet(
+                    ".", cursor.table(table_name), table_name
+                )
+        finally:
+            cursor.close()
@@ -0,0 +1,176 @@
+import datetime
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+from typing import Literal, Self
+
+from src.destinations.base_destination import BaseDestination
+from src.utils.instrumentation import in_run_context, profiled, run_report
+from src.utils.raw_archive import (
+    get_archive_dates,
+    get_archive_name,
+    is_monthly_archive,
+    pack_archive,
+    read_archive,
+)
+from src.utils.timestamp import UTC
+from src.utils.types import StoredPath
+
+
+class Compactor:
+    # Consolidates the small raw files of closed days into one archive per endpoint and
+    # day or month (see `src/utils/raw_archive.py`). A day is always added to the
+    # archive that already holds it, so files ingested again after a compaction
+    # replace their archived copy instead of being duplicated
+
+    def __init__(self) -> None:
+        self.name: str = "compactor"
+        self.destination: BaseDestination
+        self.directories: list[str]
+        self.period: Literal["day", "month"] = "month"
+        # Days before this one are closed, the ingestion only fetches up to yesterday
+        self.closed_before: datetime.date = datetime.datetime.now(UTC).date()
+        self.logger = logging.getLogger()
+
+    def set_destination(self, destination: BaseDestination) -> Self:
+        self.destination = destination
+        return self
+
+    def set_directories_to_compact(self, *dirs: str) -> Self:
+        self.directories = list(dirs)
+        return self
+
+    def set_period(self, period: str) -> Self:
+        if period == "day" or period == "month":
+            self.period = period
+            return self
+        raise ValueError(f"Period must be 'day' or 'month', got '{period}'")
+
+    def set_closed_before(self, closed_before: datetime.date | str | None) -> Self:
+        if closed_before:
+            self.closed_before = (
+                datetime.date.fromisoformat(closed_before)
+                if isinstance(closed_before, str)
+                else closed_before
+            )
+        return self
+
+    @profiled("compact")
+    def compact(self):
+        for dir in self.directories:
+            self.logger.info("Compacting files in dir %s", dir)
+            with run_report.span("compact", dir=dir) as span:
+                archives = self.compact_dir(dir)
+                span.set(archives=archives)
+
+    def compact_dir(self, dir: str) -> int:
+        # A single recursive listing finds the loose files and the archives
+        loose_files: dict[datetime.date, list[StoredPath]] = defaultdict(list)
+        archives: dict[str, StoredPath] = {}
+        for path in self.destination.list_paths(dir):
+            relative_path = PurePosixPath(path["name"]).relative_to(dir)
+            if path["is_directory"]:
+                continue
+            if len(relative_path.parts) == 1:
+                if get_archive_dates(relative_path) is not None:
+                    archives[relative_path.name] = path
+                continue
+            try:
+                day = datetime.date.fromisoformat(relative_path.parts[0])
+            except ValueError:
+                continue
+            if day < self.closed_before and path["name"].endswith(".json"):
+                loose_files[day].append(path)
+
+        # Days are grouped by the archive they go to
+        groups: dict[str, list[datetime.date]] = defaultdict(list)
+        for day in sorted(loose_files):
+            groups[self.get_archive_of_day(day, archives)].append(day)
+
+        for archive_key, days in groups.items():
+            self.compact_days(
+                dir, archive_key, archives.get(archive_key), days, loose_files
+            )
+        return len(groups)
+
+    def get_archive_of_day(
+        self, day: datetime.date, archives: dict[str, StoredPath]
+    ) -> str:
+        # Existing archive holding the day, else the key of a new one
+        if get_archive_name(day, day, monthly=False) in archives:
+            return get_archive_name(day, day, monthly=False)
+        for name in archives:
+            archive_dates = get_archive_dates(name)
+            if (
+                archive_dates is not None
+                and is_monthly_archive(name)
+                and archive_dates[0].strftime("%Y-%m") == day.strftime("%Y-%m")
+            ):
+                return name
+        if self.period == "day":
+            return get_archive_name(day, day, monthly=False)
+        return day.strftime("%Y-%m")
+
+    def compact_days(
+        self,
+        dir: str,
+        archive_key: str,
+        archive: StoredPath | None,
+        days: list[datetime.date],
+        loose_files: dict[datetime.date, list[StoredPath]],
+    ):
+        members: dict[str, bytes] = {}
+        if archive is not None:
+            members.update(read_archive(self.destination.read_bytes(archive["name"])))
+
+        files = [path for day in days for path in loose_files[day]]
+        with ThreadPoolExecutor(self.destination.max_files_in_flight) as executor:
+            for path, content in zip(
+                files,
+                executor.map(
+                    in_run_context(
+                        lambda path: self.destination.read_bytes(path["name"])
+                    ),
+                    files,
+                ),
+            ):
+                members[str(PurePosixPath(path["name"]).relative_to(dir))] = content
+
+        member_dates = sorted(
+            datetime.date.fromisoformat(PurePosixPath(name).parts[0])
+            for name in members
+        )
+        # Keys of new monthly archives are their month, i.e. `2025-12`
+        name = get_archive_name(
+            member_dates[0],
+            member_dates[-1],
+            monthly=is_monthly_archive(archive_key)
+            or get_archive_dates(archive_key) is None,
+        )
+
+        with run_report.span("write_archive", dir=dir, archive=name) as span:
+            content = pack_archive(members)
+            self.destination.save_bytes(content, f"{dir}/{name}")
+            span.set(files=len(members), bytes=len(content))
+        self.logger.info(
+            "Compacted %s files of %s days into %s/%s", len(files), len(days), dir, name
+        )
+
+        # Only removed once their archive is saved. Monthly archives are renamed
+        # when they hold new days
+        if archive is not None and PurePosixPath(archive["name"]).name != name:
+            self.destination.delete_path(archive["name"])
+        # Files written after the listing are not in the archive, they are kept along
+        # with their day directory
+        with ThreadPoolExecutor(self.destination.max_files_in_flight) as executor:
+            list(
+                executor.map(
+                    in_run_context(
+                        lambda path: self.destination.delete_path(path["name"])
+                    ),
+                    files,
+                )
+            )
+        for day in days:
+            self.destination.delete_empty_directory(f"{dir}/{day.isoformat()}")
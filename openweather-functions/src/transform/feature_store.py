@@ -0,0 +1,360 @@
+import datetime
+import logging
+from pathlib import PurePosixPath
+from typing import Self
+
+from duckdb import DuckDBPyConnection
+
+from src.destinations.base_destination import BaseDestination
+from src.utils.instrumentation import run_report
+
+# Daily inputs of the rolling features, the ones kept as window state
+WINDOW_COLUMNS = ("rain", "max_rain", "avg_temperature", "pressure")
+WINDOW_DAYS = (3, 7, 30)
+LAG_DAYS = (1, 2, 3)
+# Days of every location kept as state, the longest window plus the day relabeled
+STATE_DAYS = max(WINDOW_DAYS) + 1
+# Rain (mm) of a rainy day, as in `sql/ml/rain_prediction.sql`
+RAINY_DAY_MM = 0.5
+
+
+class RainFeatureStore:
+    # Lag and rolling window features of `daily_general_report` for the rain prediction
+    # model, saved as one parquet file per day in `rain_features/recorded_day=<day>/`.
+    # Features are materialized incrementally: the inputs of the last `STATE_DAYS`
+    # days of every location are stored next to the partitions as window state, so a
+    # run only computes, for every location, the days from its first one new or
+    # changed since the last run, taking the days before it from the state. The day
+    # before is rewritten too, as its label is the rain of the next day. Partitions
+    # written keep the rows of the locations not computed
+
+    def __init__(self, con: DuckDBPyConnection) -> None:
+        self.name: str = "rain-feature-store"
+        self.con: DuckDBPyConnection = con
+        self.source_table: str = "daily_general_report"
+        self.target: BaseDestination
+        self.dir: str = "rain_features"
+        self.full_refresh: bool = False
+        self.logger = logging.getLogger()
+
+    def set_source_table(self, table_name: str) -> Self:
+        self.source_table = table_name
+        return self
+
+    def set_target(self, target: BaseDestination) -> Self:
+        self.target = target
+        return self
+
+    def set_dir(self, dir: str) -> Self:
+        self.dir = dir
+        return self
+
+    def set_full_refresh(self, full_refresh: bool = True) -> Self:
+        # Ignores the stored state and partitions, and computes every day of the
+        # source. Partitions of days not in the source are deleted
+        self.full_refresh = full_refresh
+        return self
+
+    def get_state_path(self) -> str:
+        return f"{self.dir}/_window_state.parquet"
+
+    def get_partition_dir(self, day: datetime.date) -> str:
+        return f"{self.dir}/recorded_day={day.isoformat()}"
+
+    def load_state(self):
+        columns = ", ".join(WINDOW_COLUMNS)
+        if not self.full_refresh and self.target.exists(self.get_state_path()):
+            self.target.read_parquet(self.con, self.get_state_path()).select(
+                f"location, recorded_day::date as recorded_day, {columns}"
+            ).to_table("__rain_features_state")
+        else:
+            self.con.execute(
+                f"""
+                create or replace temp table __rain_features_state as
+                select location, recorded_day, {columns}
+                from {self.source_table}
+                limit 0
+                """
+            )
+
+    def load_start_days(self) -> int:
+        # First day of every location that is not in the state or whose inputs
+        # changed, for the locations with one. Days before the state of their location
+        # are taken as done. Returns the number of locations to compute
+        changed = " or ".join(
+            f"round(source.{column}, 6) is distinct from round(state.{column}, 6)"
+            for column in WINDOW_COLUMNS
+        )
+        self.con.sql(
+            f"""
+            with bounds as (
+                select
+                    location,
+                    min(recorded_day) as first_state_day,
+                    max(recorded_day) as last_state_day
+                from __rain_features_state
+                group by location
+            )
+
+            select source.location, min(source.recorded_day) as start_day
+            from {self.source_table} as source
+            left join bounds
+                on source.location = bounds.location
+            left join __rain_features_state as state
+                on
+                    source.location = state.location
+                    and source.recorded_day = state.recorded_day
+            where
+                bounds.location is null
+                or source.recorded_day > bounds.last_state_day
+                or (
+                    source.recorded_day >= bounds.first_state_day
+                    and (state.location is null or {changed})
+                )
+            group by source.location
+            """
+        ).to_table("__rain_features_start_days")
+        return self.con.table("__rain_features_start_days").shape[0]
+
+    def get_features_query(self) -> str:
+        # Windows are ranges of calendar days, so days missing in the source do not
+        # shift them
+        def at_day(aggregate: str, offset: int) -> str:
+            bound = (
+                f"interval {abs(offset)} days "
+                f"{'preceding' if offset < 0 else 'following'}"
+            )
+            return (
+                f"{aggregate} over (partition by location order by "
+                f"recorded_day range between {bound} and {bound})"
+            )
+
+        def rolling(aggregate: str, days: int) -> str:
+            return (
+                f"{aggregate} over (partition by location order by recorded_day "
+                f"range between interval {days - 1} days preceding and current row)"
+            )
+
+        # Slopes are per day, NaN with a single day in the window
+        def slope(column: str, days: int) -> str:
+            epoch_day = "date_diff('day', date '1970-01-01', recorded_day)"
+            return (
+                f"nullif({rolling(f'regr_slope({column}, {epoch_day})', days)}, "
+                "'nan'::double)"
+            )
+
+        features = [
+            f"{at_day('any_value(rain)', -lag)} as rain_lag_{lag}d" for lag in LAG_DAYS
+        ]
+        for column in ("avg_temperature", "pressure"):
+            features += [
+                f"{column} - {at_day(f'any_value({column})', -days)} as {column}_change_{days}d"
+                for days in (1, 3)
+            ]
+        for days in WINDOW_DAYS:
+            features += [
+                f"{rolling('sum(rain)', days)} as rain_sum_{days}d",
+                f"{rolling(f'count(*) filter (where rain > {RAINY_DAY_MM})', days)} "
+                f"as rainy_days_{days}d",
+                f"{rolling('max(max_rain)', days)} as max_rain_max_{days}d",
+                f"{rolling('avg(avg_temperature)', days)} "
+                f"as avg_temperature_mean_{days}d",
+                f"{slope('avg_temperature', days)} as avg_temperature_slope_{days}d",
+                f"{rolling('avg(pressure)', days)} as pressure_mean_{days}d",
+                f"{slope('pressure', days)} as pressure_slope_{days}d",
+                f"{rolling('count(*)', days)} as observed_days_{days}d",
+            ]
+        source_columns = ", ".join(f"source.{column}" for column in WINDOW_COLUMNS)
+        state_columns = ", ".join(f"state.{column}" for column in WINDOW_COLUMNS)
+        feature_columns = ",\n                    ".join(features)
+
+        # Only the locations with a start day are computed, from the start day of
+        # each one. Days before it are taken from the source when it has them, from
+        # the state otherwise. Days without rain have none reported. The label is
+        # unknown until the next day is available
+        return f"""
+            with stored_inputs as (
+                select source.location, source.recorded_day, {source_columns}
+                from {self.source_table} as source
+                inner join __rain_features_start_days as start_days
+                    on source.location = start_days.location
+                where
+                    source.recorded_day
+                    >= start_days.start_day - {max(WINDOW_DAYS)}
+
+                union all
+
+                select state.location, state.recorded_day, {state_columns}
+                from __rain_features_state as state
+                inner join __rain_features_start_days as start_days
+                    on state.location = start_days.location
+                anti join {self.source_table} as source
+                    on
+                        state.location = source.location
+                        and state.recorded_day = source.recorded_day
+                where
+                    state.recorded_day >= start_days.start_day - {max(WINDOW_DAYS)}
+                    and state.recorded_day < start_days.start_day
+            ),
+
+            window_inputs as (
+                select * replace (
+                    coalesce(rain, 0) as rain, coalesce(max_rain, 0) as max_rain
+                )
+                from stored_inputs
+            ),
+
+            features as (
+                select
+                    location,
+                    recorded_day,
+                    {feature_columns},
+                    {at_day("count(*)", 1)} as next_days,
+                    {at_day("any_value(rain)", 1)} as next_day_rain,
+                    {at_day("any_value(max_rain)", 1)} as next_day_max_rain
+                from window_inputs
+            )
+
+            select
+                source.*,
+                features.* exclude (
+                    location,
+                    recorded_day,
+                    next_days,
+                    next_day_rain,
+                    next_day_max_rain
+                ),
+                case
+                    when next_days = 0 then null
+                    when next_day_rain > {RAINY_DAY_MM}
+                        then
+                            case
+                                when next_day_max_rain between 0.0 and 2.5
+                                    then 'light'
+                                when next_day_max_rain between 2.5 and 7.5
+                                    then 'moderate'
+                                when next_day_max_rain > 7.5 then 'intense'
+                            end
+                    else 'dry'
+                end as rain_prediction
+            from {self.source_table} as source
+            inner join __rain_features_start_days as start_days
+                on source.location = start_days.location
+            inner join features
+                on
+                    source.location = features.location
+                    and source.recorded_day = features.recorded_day
+            where source.recorded_day >= start_days.start_day - 1
+        """
+
+    def save_partition(self, day: datetime.date):
+        # Rows of the day computed, along with the stored ones of the other locations
+        features = self.con.table("__rain_features").filter(f"recorded_day = '{day}'")
+        path = f"{self.get_partition_dir(day)}/rain_features.parquet"
+        if not self.full_refresh and self.target.exists(path):
+            self.target.read_parquet(self.con, path).to_table("__rain_features_stored")
+            features = self.con.sql(
+                f"""
+                select * from __rain_features where recorded_day = '{day}'
+
+                union all by name
+
+                select stored.*
+                from __rain_features_stored as stored
+                anti join __rain_features as computed
+                    on stored.location = computed.location
+                    and computed.recorded_day = '{day}'
+                """
+            )
+        try:
+            self.target.save_relation_as_parquet(
+                self.get_partition_dir(day), features, "rain_features"
+            )
+        finally:
+            self.con.execute("drop table if exists __rain_features_stored")
+
+    def delete_stale_partitions(self, days: list[datetime.date]):
+        # Partitions of days other than the ones written
+        written = {self.get_partition_dir(day) for day in days}
+        for path in self.target.list_paths(self.dir, recursive=False):
+            if (
+                path["is_directory"]
+                and PurePosixPath(path["name"]).name.startswith("recorded_day=")
+                and path["name"] not in written
+            ):
+                self.logger.info("Deleting stale rain features of %s", path["name"])
+                self.target.delete_path(path["name"], is_directory=True)
+
+    def save_state(self):
+        # Inputs of the last `STATE_DAYS` days of every location, from the source
+        # from the start day of the location on
+        state_columns = ", ".join(f"state.{column}" for column in WINDOW_COLUMNS)
+        source_columns = ", ".join(f"source.{column}" for column in WINDOW_COLUMNS)
+        state = self.con.sql(
+            f"""
+            with inputs as (
+                select state.location, state.recorded_day, {state_columns}
+                from __rain_features_state as state
+                left join __rain_features_start_days as start_days
+                    on state.location = start_days.location
+                where
+                    start_days.location is null
+                    or state.recorded_day < start_days.start_day
+
+                union all
+
+                select source.location, source.recorded_day, {source_columns}
+                from {self.source_table} as source
+                inner join __rain_features_start_days as start_days
+                    on source.location = start_days.location
+                where source.recorded_day >= start_days.start_day
+            )
+
+            select *
+            from inputs
+            qualify
+                recorded_day > max(recorded_day) over (partition by location)
+                - {STATE_DAYS}
+            """
+        )
+        self.target.save_relation_as_parquet(self.dir, state, "_window_state")
+
+    def materialize(self) -> list[datetime.date]:
+        # Returns the days written
+        with run_report.span("rain_features", full_refresh=self.full_refresh) as span:
+            try:
+                self.load_state()
+                locations = self.load_start_days()
+                if not locations:
+                    self.logger.info("Rain features are up to date")
+                    span.set(days=0)
+                    return []
+
+                self.con.sql(self.get_features_query()).to_table("__rain_features")
+                features = self.con.table("__rain_features")
+                days: list[datetime.date] = [
+                    row[0]
+                    for row in features.select("recorded_day")
+                    .distinct()
+                    .order("recorded_day")
+                    .fetchall()
+                ]
+                self.logger.info(
+                    "Writing rain features of %s locations in %s days from %s",
+                    locations,
+                    len(days),
+                    days[0],
+                )
+                for day in days:
+                    self.save_partition(day)
+                if self.full_refresh:
+                    self.delete_stale_partitions(days)
+
+                # Saved last, so a failed run is computed again from the same state
+                self.save_state()
+                span.set(days=len(days), locations=locations, rows=features.shape[0])
+                return days
+            finally:
+                self.con.execute("drop table if exists __rain_features")
+                self.con.execute("drop table if exists __rain_features_state")
+                self.con.execute("drop table if exists __rain_features_start_days")
@@ -1,11 +1,15 @@
 import logging
 import datetime
 
-from typing import Self
+from typing import Any, Self
 
+import duckdb
 import polars as pl
 
 from src.destinations.base_destination import BaseDestination
+from src.utils.instrumentation import profiled, run_report
+from src.utils.key_index import KeyIndex
+from src.utils.timestamp import EPOCH_ORDINAL
 
 
 class Flattener:
@@ -18,6 +22,10 @@ class Flattener:
         self.id: str = datetime.datetime.now().isoformat()
         self.column_id: str = "flattener_id"
         self.at_column_name: str
+        self.start_date: datetime.date | None = None
+        self.end_date: datetime.date | None = None
+        self.locations: list[str] | None = None
+        self.appending: bool = False
         self.logger = logging.getLogger()
 
     def set_source(self, source: BaseDestination) -> Self:
@@ -43,12 +51,161 @@ class Flattener:
         self.at_column_name = column_name
         return self
 
+    def set_date_range(
+        self,
+        start_date: datetime.date | str | None = None,
+        end_date: datetime.date | str | None = None,
+    ) -> Self:
+        # Only the raw date partitions in range are staged, and the rows of those
+        # dates are replaced in the target tables
+        self.start_date = (
+            datetime.date.fromisoformat(start_date)
+            if isinstance(start_date, str)
+            else start_date
+        )
+        self.end_date = (
+            datetime.date.fromisoformat(end_date)
+            if isinstance(end_date, str)
+            else end_date
+        )
+        return self
+
+    def set_locations(self, *locations: str) -> Self:
+        # Location names as in the raw file names, i.e. "vitoria-gasteiz"
+        self.locations = list(locations) or None
+        return self
+
+    def set_appending(self, appending: bool = True) -> Self:
+        # The target only receives the readings of this run, which are added to the
+        # ones staged by previous runs (i.e. by `FusedPipeline`, upserting them). The
+        # key index of the target is updated instead of replaced
+        self.appending = appending
+        return self
+
+    @property
+    def is_partial(self) -> bool:
+        return bool(self.start_date or self.end_date or self.locations)
+
+    def get_slice_filter(self) -> str:
+        # Rows of the root tables read from the staged partitions, matched on the
+        # `endpoint/date/location.json` path they were read from
+        conditions = ["true"]
+        partition_date = "try_cast(string_split(path, '/')[-2] as date)"
+        if self.start_date:
+            conditions.append(f"{partition_date} >= $start_date")
+        if self.end_date:
+            conditions.append(f"{partition_date} <= $end_date")
+        if self.locations:
+            conditions.append("list_contains($locations, location)")
+        return " and ".join(conditions)
+
+    def get_slice_params(self) -> dict[str, Any]:
+        params: dict[str, Any] = {}
+        if self.start_date:
+            params["start_date"] = self.start_date
+        if self.end_date:
+            params["end_date"] = self.end_date
+        if self.locations:
+            params["locations"] = self.locations
+        return params
+
+    def replace_slice(
+        self,
+        con: duckdb.DuckDBPyConnection,
+        root_table_name: str,
+        table_name: str,
+        df: pl.DataFrame,
+    ) -> duckdb.DuckDBPyRelation | pl.DataFrame:
+        # Replaces the staged partitions of a table imported from the target
+        existing_tables = {row[0] for row in con.sql("show tables").fetchall()}
+        if table_name not in existing_tables:
+            return df
+
+        # Staged readings already kept from other partitions are dropped
+        kept_ids = f"""(
+            select record_id
+            from {root_table_name}
+            where not ({self.get_slice_filter()})
+        )"""
+        if table_name == root_table_name:
+            kept_rows = f"not ({self.get_slice_filter()})"
+            staged_rows = f"record_id not in {kept_ids}"
+        else:
+            kept_rows = f"""parent_id not in (
+                select record_id from {root_table_name} where {self.get_slice_filter()}
+            )"""
+            staged_rows = f"parent_id not in {kept_ids}"
+
+        con.register("staged_rows", df.to_arrow())
+        con.execute(
+            f"""
+            create or replace table {table_name}__staged as
+            select * from {table_name} where {kept_rows}
+            union all by name
+            select * from staged_rows where {staged_rows}
+            """,
+            self.get_slice_params(),
+        )
+        con.unregister("staged_rows")
+        return con.table(f"{table_name}__staged")
+
+    def get_key_index_path(self, dir: str) -> str:
+        return f"_key_index/{dir}.json"
+
+    def read_key_index(self, dir: str) -> KeyIndex | None:
+        # Canonical readings staged in the target by previous runs, if any
+        path = self.get_key_index_path(dir)
+        if not self.target.exists(path):
+            return None
+        return KeyIndex.from_bytes(self.target.read_bytes(path))
+
+    def save_key_index(
+        self, dir: str, canonical_keys: KeyIndex | None, staged_keys: KeyIndex
+    ):
+        if self.appending and canonical_keys is not None:
+            canonical_keys.update(staged_keys)
+            staged_keys = canonical_keys
+        # A slice only replaces the readings of its days and locations
+        elif self.is_partial and canonical_keys is not None:
+            start_day, end_day = [
+                date.toordinal() - EPOCH_ORDINAL if date else None
+                for date in (self.start_date, self.end_date)
+            ]
+            canonical_keys.replace(staged_keys, start_day, end_day, self.locations)
+            staged_keys = canonical_keys
+        self.target.save_bytes(staged_keys.to_bytes(), self.get_key_index_path(dir))
+
+    @profiled("flatten")
     def flatten(self):
 
+        # Staging a slice of the raw layer updates the target tables instead of
+        # replacing them
+        con = duckdb.connect()
+        if self.is_partial:
+            for table_name, relation in self.target.iter_dir_as_relations(
+                con, skip_on_error=True
+            ):
+                relation.to_table(table_name)
+
         for dir in self.directories:
             # Parse tables from directory
             self.logger.info("Flattening files in dir %s", str(dir))
-            tables = self.source.read_tables_from_dir(dir, dir)
+            canonical_keys = self.read_key_index(dir)
+            staged_keys = KeyIndex()
+            with run_report.span("read_tables", dir=dir) as span:
+                tables = self.source.read_tables_from_dir(
+                    dir,
+                    dir,
+                    self.start_date,
+                    self.end_date,
+                    self.locations,
+                    canonical_keys,
+                    staged_keys,
+                )
+                span.set(
+                    tables=len(tables),
+                    rows=sum(len(table) for table in tables.values()),
+                )
 
             for table in tables.values():
                 self.logger.info("Found table %s", table.name)
@@ -56,14 +213,22 @@ class Flattener:
                 # Add data to table
                 ingestion_time = datetime.datetime.now().isoformat()
 
-                df = pl.DataFrame(
-                    table.get_data(),
-                    {x["name"]: x["type"] for x in table.get_schema()},
-                )
-                df = df.with_columns(
-                    pl.lit(self.id).alias(self.column_id),
-                    pl.lit(ingestion_time).alias(self.at_column_name),
-                )
+                with run_report.span("build_dataframe", table=table.name) as span:
+                    df = table.to_polars().with_columns(
+                        pl.lit(self.id).alias(self.column_id),
+                        pl.lit(ingestion_time).alias(self.at_column_name),
+                    )
+                    span.set(rows=df.height)
 
                 self.logger.info("Saving as parquet...")
-                self.target.save_relation_as_parquet(".", df, table.name)
+                self.target.save_relation_as_parquet(
+                    ".",
+                    (
+                        self.replace_slice(con, dir, table.name, df)
+                        if self.is_partial
+                        else df
+                    ),
+                    table.name,
+                )
+
+            self.save_key_index(dir, canonical_keys, staged_keys)
@@ -1,10 +1,13 @@
 import logging
+from dataclasses import asdict
 from pathlib import Path
 from typing import Iterable, Self
 from duckdb import DuckDBPyConnection
 
 from src.destinations.base_destination import BaseDestination
 from src.utils.db_model import DBModel
+from src.utils.duckdb_profile import DuckDBProfile
+from src.utils.instrumentation import profiled, run_report
 
 
 class Transformer:
@@ -13,14 +16,65 @@ class Transformer:
         self.models: list[DBModel] = []
         self.con: DuckDBPyConnection = con
 
+    def set_resource_profile(self, profile: DuckDBProfile) -> Self:
+        # Applied to the connection, so it also holds for the tables imported after
+        with run_report.span("duckdb_profile", **asdict(profile)):
+            profile.apply(self.con)
+        return self
+
     def import_tables_from_dir(self, destination: BaseDestination) -> Self:
         for table_name, relation in destination.iter_dir_as_relations(
             self.con, skip_on_error=True
         ):
-            relation.to_table(table_name)
+            with run_report.span("import_table", table=table_name) as span:
+                relation.to_table(table_name)
+                span.set(rows=self.con.table(table_name).shape[0])
             logging.info(f"Read table '{table_name}' from {destination.name}")
         return self
 
+    def upsert_tables_from_dir(
+        self,
+        destination: BaseDestination,
+        key_columns: Iterable[str] = ("record_id", "parent_id"),
+    ) -> Self:
+        # Adds the tables of the destination to the already imported ones. Existing
+        # rows sharing a key with the new ones are replaced
+        existing_tables = {row[0] for row in self.con.sql("show tables").fetchall()}
+        for table_name, relation in destination.iter_dir_as_relations(
+            self.con, skip_on_error=True
+        ):
+            if table_name not in existing_tables:
+                with run_report.span("import_table", table=table_name) as span:
+                    relation.to_table(table_name)
+                    span.set(rows=self.con.table(table_name).shape[0])
+                continue
+
+            with run_report.span("upsert_table", table=table_name) as span:
+                new_table_name = f"{table_name}__new"
+                relation.to_table(new_table_name)
+
+                key_filter = ""
+                old_columns = self.con.table(table_name).columns
+                for key in key_columns:
+                    if key in relation.columns and key in old_columns:
+                        key_filter = (
+                            f"where {key} not in (select {key} from {new_table_name})"
+                        )
+                        break
+
+                self.con.execute(
+                    f"""
+                    create or replace table {table_name} as
+                    select * from {table_name} {key_filter}
+                    union all by name
+                    select * from {new_table_name}
+                    """
+                )
+                self.con.execute(f"drop table {new_table_name}")
+                span.set(rows=self.con.table(table_name).shape[0])
+            logging.info(f"Upserted table '{table_name}' from {destination.name}")
+        return self
+
     def set_models(
         self, transformations: Iterable[tuple[str | Path, BaseDestination]]
     ) -> Self:
@@ -29,6 +83,7 @@ class Transformer:
             self.models.append(DBModel(self.con, path, path.stem, target_location))
         return self
 
+    @profiled("execute")
     def execute(self, write_to_tables: bool = True):
         for model in self.models:
             model.execute(write_to_tables)
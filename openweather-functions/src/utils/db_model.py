@@ -2,6 +2,7 @@ from pathlib import Path
 
 from duckdb import DuckDBPyConnection, DuckDBPyRelation
 from src.destinations.base_destination import BaseDestination
+from src.utils.instrumentation import run_report
 
 
 class DBModel:
@@ -20,18 +21,20 @@ class DBModel:
         self.relation: DuckDBPyRelation
 
     def execute(self, write_to_file: bool = True):
-
-        # Read and execute sql transformation
-        with open(self.sql_path, "r") as sql_file:
-            self.relation = self.con.sql(sql_file.read())
-
-        # Save to duckdb database
-        self.relation.to_table(self.table_name)
-
-        if write_to_file:
-            # Save to target destination
-            self.destination.save_relation_as_parquet(
-                ".", self.relation, self.table_name
-            )
-        else:
-            self.relation.show()
+        with run_report.span("model", model=self.table_name) as span:
+
+            # Read and execute sql transformation
+            with open(self.sql_path, "r") as sql_file:
+                self.relation = self.con.sql(sql_file.read())
+
+            # Save to duckdb database
+            self.relation.to_table(self.table_name)
+            span.set(rows=self.con.table(self.table_name).shape[0])
+
+            if write_to_file:
+                # Save to target destination
+                self.destination.save_relation_as_parquet(
+                    ".", self.relation, self.table_name
+                )
+            else:
+                self.relation.show()
@@ -1,79 +1,151 @@
 import json
-from typing import Any, Generator, Literal, overload
+from typing import TYPE_CHECKING, Any, Generator, Literal, overload
 
-import polars as pl
+from src.utils.types import (
+    ColumnDefinition,
+    ColumnName,
+    ColumnType,
+    NestedKeyPath,
+    DictRow,
+)
 
-from src.utils.types import ColumnDefinition, NestedKeyPath, DictRow
+if TYPE_CHECKING:
+    import polars as pl
 
 
 class DictTable:
+    # Values are stored by column, one buffer per column with a value for every row,
+    # so rows can be handed to Polars without building them back
+    __slots__ = ("name", "columns", "buffers", "num_rows", "column_types")
 
-    def __init__(self, name, rows=None) -> None:
+    def __init__(self, name: str, rows: list[DictRow] | None = None) -> None:
         self.name = name
-        self.columns: list[NestedKeyPath] = []
-        self.rows: list[DictRow] = []
+        # Ordered index of the columns by name, with their key path in the rows
+        self.columns: dict[ColumnName, NestedKeyPath] = {}
+        self.buffers: dict[ColumnName, list[Any]] = {}
+        self.num_rows = 0
+        self.column_types: dict[ColumnName, ColumnType] = {}
         if rows:
-            self.rows = rows
+            self.set_rows(rows)
+
+    def __len__(self) -> int:
+        return self.num_rows
 
     def update_columns(self, columns: list[NestedKeyPath]):
         for column in columns:
-            if column not in self.columns:
-                self.columns.append(column)
+            name = self.get_column_name(column)
+            if name not in self.columns:
+                self.columns[name] = column
+                self.buffers[name] = [None] * self.num_rows
+
+    def set_rows(self, rows: list[DictRow]):
+        self.buffers = {
+            name: [self.access_nested_key(row, column, True, False) for row in rows]
+            for name, column in self.columns.items()
+        }
+        self.num_rows = len(rows)
 
-    def set_rows(self, rows):
-        self.rows = rows.copy()
+    def set_column_types(self, column_types: dict[ColumnName, ColumnType]):
+        self.column_types.update(column_types)
+
+    @staticmethod
+    def get_column_name(column: NestedKeyPath) -> ColumnName:
+        return "__".join(column[1:])
 
     def __repr__(self) -> str:
         value = f"\nTable name: {self.name}\n"
 
         value += "\nColumns\n"
-        for column in self.columns:
-            value += "- " + "__".join(column[1:]) + "\n"
+        for name in self.columns:
+            value += "- " + name + "\n"
 
-        value += f"\nNumber of rows: {len(self.rows)}\n"
-        if self.rows:
+        value += f"\nNumber of rows: {self.num_rows}\n"
+        if self.num_rows:
             value += "\nRow example:\n"
-            value += json.dumps(self.rows[0], indent=4)
+            value += json.dumps(
+                {name: buffer[0] for name, buffer in self.buffers.items()}, indent=4
+            )
 
         value += "\n\n"
 
         return value
 
     def merge(self, other: "DictTable"):
-        self.update_columns(other.columns)
-        self.rows.extend(other.rows)
+        self.update_columns(list(other.columns.values()))
+        for name, buffer in self.buffers.items():
+            if name in other.buffers:
+                buffer.extend(other.buffers[name])
+            else:
+                buffer.extend([None] * other.num_rows)
+        self.num_rows += other.num_rows
+
+    def get_columns(self) -> dict[ColumnName, list[Any]]:
+        # Typed columns keep their python value, the rest are returned as strings
+        return {
+            name: (
+                buffer
+                if name in self.column_types
+                else [None if value is None else str(value) for value in buffer]
+            )
+            for name, buffer in self.buffers.items()
+        }
 
     def get_data(self) -> Generator[list[Any], None, None]:
-        for row in self.rows:
-            new_row = []
-            for column in self.columns:
-                # print(f"Accessing {row=} {column=}")
-                new_row.append(self.access_nested_key(row, column, True))
-
-            yield new_row
+        for row in zip(*self.get_columns().values()):
+            yield list(row)
+
+    def to_polars(self) -> "pl.DataFrame":
+        # Polars is loaded on first use, as destinations import this module
+        import polars as pl
+
+        # Buffers are handed over as they are. Untyped columns are converted to
+        # strings by Polars value by value, so ints mixed with floats keep their text
+        return pl.DataFrame(
+            [
+                pl.Series(
+                    column["name"],
+                    self.buffers[column["name"]],
+                    column["type"],
+                    strict=column["name"] in self.column_types,
+                )
+                for column in self.get_schema()
+            ]
+        )
 
     def get_schema(self) -> list[ColumnDefinition]:
-        column_type: pl.DataType = pl.String()
-        columns: list[ColumnDefinition] = []
-        for keys in self.columns:
+        import polars as pl
 
+        default_type: pl.DataType = pl.String()
+        columns: list[ColumnDefinition] = []
+        for name in self.columns:
             # TODO: This can be extended to identify the datatype of the columns by
             # iterating over their values, instead of always returning pl.String()
+            # for the columns without an explicit type
 
-            columns.append(ColumnDefinition(name="__".join(keys[1:]), type=column_type))
+            columns.append(
+                ColumnDefinition(
+                    name=name, type=self.column_types.get(name, default_type)
+                )
+            )
 
         return columns
 
     @staticmethod
     @overload
     def access_nested_key(
-        dictionary: dict, nested_keys: NestedKeyPath, safe_return: Literal[True]
+        dictionary: dict,
+        nested_keys: NestedKeyPath,
+        safe_return: Literal[True],
+        as_string: bool = True,
     ) -> Any | None: ...
 
     @staticmethod
     @overload
     def access_nested_key(
-        dictionary: dict, nested_keys: NestedKeyPath, safe_return: Literal[False]
+        dictionary: dict,
+        nested_keys: NestedKeyPath,
+        safe_return: Literal[False],
+        as_string: bool = True,
     ) -> Any: ...
 
     @staticmethod
@@ -82,7 +154,10 @@ class DictTable:
 
     @staticmethod
     def access_nested_key(
-        dictionary: dict, nested_keys: NestedKeyPath, safe_return: bool = False
+        dictionary: dict,
+        nested_keys: NestedKeyPath,
+        safe_return: bool = False,
+        as_string: bool = True,
     ) -> Any | None:
         value = dictionary
 
@@ -99,4 +174,4 @@ class DictTable:
                 value = new_value
 
         if not isinstance(value, dict):
-            return str(value)
+            return str(value) if as_string else value
@@ -0,0 +1,108 @@
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+from duckdb import DuckDBPyConnection
+
+MIB = 1024**2
+
+
+def read_cgroup_value(*paths: str) -> str | None:
+    # First readable file of the cgroup v2 and v1 paths given
+    for path in paths:
+        try:
+            return Path(path).read_text().strip()
+        except OSError:
+            continue
+    return None
+
+
+def get_host_memory() -> int:
+    # Bytes available to the process, the cgroup limit of containers (i.e. Azure
+    # Functions) when lower than the memory of the host
+    memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    limit = read_cgroup_value(
+        "/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"
+    )
+    if limit and limit.isdigit():
+        memory = min(memory, int(limit))
+    return memory
+
+
+def get_host_cores() -> int:
+    # Cores the process can run on, limited by the cgroup CPU quota
+    cores = (
+        len(os.sched_getaffinity(0))
+        if hasattr(os, "sched_getaffinity")
+        else os.cpu_count() or 1
+    )
+    quota = read_cgroup_value("/sys/fs/cgroup/cpu.max")
+    if quota is None:
+        v1_quota = read_cgroup_value("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+        v1_period = read_cgroup_value("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        quota = f"{v1_quota} {v1_period}" if v1_quota and v1_period else None
+    if quota:
+        limit, _, period = quota.partition(" ")
+        if limit.lstrip("-").isdigit() and int(limit) > 0 and period.isdigit():
+            cores = min(cores, max(1, int(limit) // int(period)))
+    return cores
+
+
+@dataclass(frozen=True)
+class DuckDBProfile:
+    # Resources of the DuckDB connection of the transformations. Once operators
+    # reach the memory limit they spill to the temp directory, so large full
+    # refreshes run out of core instead of getting the function killed. None keeps
+    # the DuckDB default
+    memory_limit_mb: int | None = None
+    threads: int | None = None
+    temp_directory: str | None = None
+    max_temp_directory_size_mb: int | None = None
+    # Results of queries without an `order by` may come in any order, which lets
+    # inserts and copies stream instead of buffering. Safe for the models, as their
+    # files are sorted when written (see `ParquetProfile`)
+    preserve_insertion_order: bool = False
+
+    @classmethod
+    def from_host(
+        cls,
+        memory_fraction: float = 0.6,
+        min_memory_per_thread_mb: int = 256,
+        temp_directory: str | None = None,
+    ) -> "DuckDBProfile":
+        # Sized from the cores and memory of the host. Part of the memory is left to
+        # Python and the arrow buffers of the writes, which DuckDB does not account
+        # for, and threads are capped so each one gets `min_memory_per_thread_mb`
+        memory_limit_mb = int(get_host_memory() * memory_fraction) // MIB
+        threads = max(
+            1, min(get_host_cores(), memory_limit_mb // min_memory_per_thread_mb)
+        )
+        # The default `.tmp` of in-memory databases is relative to the app
+        # directory, read only when running from a package
+        temp_directory = temp_directory or os.path.join(
+            tempfile.gettempdir(), "duckdb_spill"
+        )
+        return cls(
+            memory_limit_mb=memory_limit_mb,
+            threads=threads,
+            temp_directory=temp_directory,
+        )
+
+    def apply(self, con: DuckDBPyConnection):
+        settings = {
+            "memory_limit": (
+                f"{self.memory_limit_mb}MB" if self.memory_limit_mb else None
+            ),
+            "threads": self.threads,
+            "temp_directory": self.temp_directory,
+            "max_temp_directory_size": (
+                f"{self.max_temp_directory_size_mb}MB"
+                if self.max_temp_directory_size_mb
+                else None
+            ),
+            "preserve_insertion_order": self.preserve_insertion_order,
+        }
+        for name, value in settings.items():
+            if value is not None:
+                con.execute(f"set {name} = ?", [value])
@@ -0,0 +1,345 @@
+import datetime
+import functools
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Callable, ContextManager, Generator
+
+if TYPE_CHECKING:
+    import cProfile
+    import tracemalloc
+
+    from src.destinations.base_destination import BaseDestination
+
+try:
+    import resource
+except ImportError:  # Not available in Windows
+    resource = None
+
+
+def get_peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes while macOS reports bytes
+    if sys.platform == "darwin":
+        return peak_rss / 1024**2
+    return peak_rss / 1024
+
+
+@dataclass
+class Span:
+    name: str
+    parent: str | None
+    started_at: str
+    attributes: dict[str, Any] = field(default_factory=dict)
+    duration_s: float = 0.0
+    peak_rss_mb: float | None = None
+    error: str | None = None
+
+    def set(self, **attributes: Any):
+        self.attributes.update(attributes)
+
+
+# cProfile and tracemalloc are process wide, so a single step of all the running
+# invocations is profiled at a time
+profiler_lock = Lock()
+
+
+class RunReport:
+    # Spans are exported by a tracer shared by the reports of the process
+    tracer: Any = None
+    tracer_provider: Any = None
+
+    def __init__(
+        self, run_name: str = "run", run_id: str | None = None, profile: bool = False
+    ) -> None:
+        self.logger = logging.getLogger()
+        self.lock = Lock()
+        self.current_span: ContextVar[Span | None] = ContextVar(
+            "current_span", default=None
+        )
+        self.run_name = run_name
+        self.run_id = run_id or datetime.datetime.now().isoformat()
+        self.started_at = datetime.datetime.now().isoformat()
+        self.start_time = time.perf_counter()
+        self.status = "running"
+        self.error: str | None = None
+        self.spans: list[Span] = []
+
+        # Profiles of the `profiled` steps, by artifact file name
+        profile_env = os.environ.get("OPENWEATHER_PROFILE", "").lower()
+        self.profiling = profile or profile_env in ("1", "true")
+        self.profiles: dict[str, bytes] = {}
+
+        if "OTEL_EXPORTER_OTLP_ENDPOINT" in os.environ and self.tracer is None:
+            try:
+                self.enable_opentelemetry()
+            except ImportError as e:
+                self.logger.warning("Spans will not be exported: %s", e)
+
+    @classmethod
+    def enable_opentelemetry(cls, endpoint: str | None = None):
+        # Optional dependencies, only needed when exporting to a collector
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+                OTLPSpanExporter,
+            )
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        except ImportError as e:
+            raise ImportError(
+                "OpenTelemetry export requires the `opentelemetry-sdk` and "
+                "`opentelemetry-exporter-otlp-proto-http` packages"
+            ) from e
+
+        cls.tracer_provider = TracerProvider(
+            resource=Resource.create({"service.name": "openweather-pipeline"})
+        )
+        cls.tracer_provider.add_span_processor(
+            BatchSpanProcessor(
+                OTLPSpanExporter(endpoint=endpoint) if endpoint else OTLPSpanExporter()
+            )
+        )
+        cls.tracer = cls.tracer_provider.get_tracer(__name__)
+        logging.getLogger().info("Exporting run spans with OpenTelemetry")
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Generator[Span, None, None]:
+        parent = self.current_span.get()
+        span = Span(
+            name=name,
+            parent=parent.name if parent else None,
+            started_at=datetime.datetime.now().isoformat(),
+            attributes=attributes,
+        )
+        token = self.current_span.set(span)
+        start = time.perf_counter()
+
+        otel_context = (
+            self.tracer.start_as_current_span(name)
+            if self.tracer is not None
+            else nullcontext()
+        )
+        with otel_context as otel_span:
+            try:
+                yield span
+            except Exception as e:
+                span.error = repr(e)
+                raise
+            finally:
+                span.duration_s = time.perf_counter() - start
+                span.peak_rss_mb = get_peak_rss_mb()
+                self.current_span.reset(token)
+                with self.lock:
+                    self.spans.append(span)
+
+                if otel_span is not None:
+                    otel_span.set_attributes(
+                        {
+                            key: value
+                            for key, value in span.attributes.items()
+                            if isinstance(value, (str, bool, int, float))
+                        }
+                    )
+
+    @contextmanager
+    def profile(self, name: str) -> Generator[None, None, None]:
+        # Deterministic CPU profile of the thread running the block and a snapshot of
+        # the memory allocated meanwhile, if profiling is enabled. Blocks nested in
+        # a profiled one are part of its profile. Blocks run while a step of another
+        # run is profiled are not profiled
+        if not self.profiling:
+            yield
+            return
+        if not profiler_lock.acquire(blocking=False):
+            self.logger.debug("Not profiling %s, a step is already profiled", name)
+            yield
+            return
+
+        import cProfile
+        import tracemalloc
+
+        self.logger.info("Profiling %s", name)
+        profiler = cProfile.Profile()
+        started_tracing = not tracemalloc.is_tracing()
+        try:
+            if started_tracing:
+                tracemalloc.start(1)
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                snapshot = tracemalloc.take_snapshot()
+                peak_mb = tracemalloc.get_traced_memory()[1] / 1024**2
+                if started_tracing:
+                    tracemalloc.stop()
+                self.add_profile(name, profiler, snapshot, peak_mb)
+        finally:
+            profiler_lock.release()
+
+    def add_profile(
+        self,
+        name: str,
+        profiler: "cProfile.Profile",
+        snapshot: "tracemalloc.Snapshot",
+        peak_mb: float,
+    ):
+        import io
+        import marshal
+        import pickle
+        import pstats
+        import tracemalloc
+
+        with self.lock:
+            # Steps run more than once, i.e. by the workers, get a numbered profile
+            key, number = name, 1
+            while f"{key}.prof" in self.profiles:
+                number += 1
+                key = f"{name}-{number}"
+
+            with io.StringIO() as stream:
+                stats = pstats.Stats(profiler, stream=stream)
+                # Readable with `pstats` or `snakeviz`, as written by `dump_stats`
+                self.profiles[f"{key}.prof"] = marshal.dumps(stats.stats)
+                stats.sort_stats("cumulative").print_stats(50)
+                self.profiles[f"{key}.cpu.txt"] = stream.getvalue().encode()
+
+            # Readable with `tracemalloc.Snapshot.load`
+            snapshot = snapshot.filter_traces(
+                [tracemalloc.Filter(False, tracemalloc.__file__)]
+            )
+            self.profiles[f"{key}.tracemalloc"] = pickle.dumps(snapshot)
+            lines = [f"Peak traced memory: {peak_mb:.1f} MB", "Top allocations:"]
+            lines.extend(str(stat) for stat in snapshot.statistics("lineno")[:50])
+            self.profiles[f"{key}.memory.txt"] = "\n".join(lines).encode()
+
+    def fail(self, error: Exception):
+        self.status = "failed"
+        self.error = repr(error)
+
+    def get_summary(self) -> dict[str, dict[str, Any]]:
+        summary: dict[str, dict[str, Any]] = {}
+        for span in self.spans:
+            totals = summary.setdefault(
+                span.name, {"count": 0, "duration_s": 0.0, "bytes": 0, "rows": 0}
+            )
+            totals["count"] += 1
+            totals["duration_s"] += span.duration_s
+            totals["bytes"] += span.attributes.get("bytes", 0)
+            totals["rows"] += span.attributes.get("rows", 0)
+        return summary
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "run_name": self.run_name,
+            "run_id": self.run_id,
+            "status": "success" if self.status == "running" else self.status,
+            "error": self.error,
+            "started_at": self.started_at,
+            "duration_s": time.perf_counter() - self.start_time,
+            "peak_rss_mb": get_peak_rss_mb(),
+            "summary": self.get_summary(),
+            "profiles": sorted(self.profiles),
+            "spans": [asdict(span) for span in self.spans],
+        }
+
+    def save(self, destination: "BaseDestination", dir: str | Path = ""):
+        # Reports are saved in a destination of their own, outside of the data layers
+        # listed by the pipeline steps
+        report = self.to_dict()
+        file_name = Path(dir) / self.run_name / (self.run_id + ".json")
+
+        self.logger.info(
+            "Saving run report of %s to %s", self.run_name, destination.name
+        )
+        destination.save_json(report, file_name)
+
+        # Profiles are saved next to the report, in a directory named after the run
+        for profile_name, content in self.profiles.items():
+            destination.save_bytes(
+                content, Path(dir) / self.run_name / self.run_id / profile_name
+            )
+
+        if self.tracer_provider is not None:
+            self.tracer_provider.force_flush()
+
+
+# Report of the running invocation. Azure Functions runs concurrent invocations in
+# threads of the same worker process, so each of them starts a report of its own.
+# Code run outside of any invocation reports to the default one
+current_run_report: ContextVar[RunReport] = ContextVar(
+    "run_report", default=RunReport()
+)
+
+
+class CurrentRunReport:
+    # Shared by all the pipeline steps, as the root logger is, and forwarding to the
+    # report of the invocation running them
+
+    def get(self) -> RunReport:
+        return current_run_report.get()
+
+    def start(
+        self, run_name: str, run_id: str | None = None, profile: bool = False
+    ) -> RunReport:
+        report = RunReport(run_name, run_id, profile)
+        current_run_report.set(report)
+        return report
+
+    def enable_opentelemetry(self, endpoint: str | None = None):
+        RunReport.enable_opentelemetry(endpoint)
+
+    def span(self, name: str, **attributes: Any) -> ContextManager[Span]:
+        return self.get().span(name, **attributes)
+
+    def profile(self, name: str) -> ContextManager[None]:
+        return self.get().profile(name)
+
+    def fail(self, error: Exception):
+        self.get().fail(error)
+
+    def save(self, destination: "BaseDestination", dir: str | Path = ""):
+        self.get().save(destination, dir)
+
+
+run_report = CurrentRunReport()
+
+
+def in_run_context[**P, R](function: Callable[P, R]) -> Callable[P, R]:
+    # Binds the function to the report of the calling run, for the threads started
+    # by it, as threads do not inherit the context variables of their parent
+    report = current_run_report.get()
+
+    @functools.wraps(function)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        token = current_run_report.set(report)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            current_run_report.reset(token)
+
+    return wrapper
+
+
+def profiled[**P, R](name: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    # Profiles the decorated step when profiling is enabled for the run
+    def decorator(function: Callable[P, R]) -> Callable[P, R]:
+        @functools.wraps(function)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            with run_report.profile(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
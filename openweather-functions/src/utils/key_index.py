@@ -0,0 +1,125 @@
+import json
+from collections import defaultdict
+from typing import Iterable
+
+from src.utils.timestamp import SECONDS_PER_DAY
+
+SECONDS_PER_HOUR = 3_600
+
+
+class KeyIndex:
+    # Keys of the readings as `(endpoint, location, dt)`. Readings are hourly, so each
+    # endpoint and location holds a bitset of the 24 hours of every day (a year of a
+    # location is 365 integers). Readings off the hour are kept in a set
+
+    def __init__(self) -> None:
+        self.days: dict[tuple[str, str], dict[int, int]] = defaultdict(dict)
+        self.other: set[tuple[str, str, int]] = set()
+
+    def __len__(self) -> int:
+        hours = sum(
+            mask.bit_count() for masks in self.days.values() for mask in masks.values()
+        )
+        return hours + len(self.other)
+
+    def add(self, endpoint: str, location: str, dt: int) -> bool:
+        # Returns whether the key is new
+        if dt % SECONDS_PER_HOUR:
+            if (endpoint, location, dt) in self.other:
+                return False
+            self.other.add((endpoint, location, dt))
+            return True
+
+        masks = self.days[(endpoint, location)]
+        day = dt // SECONDS_PER_DAY
+        bit = 1 << (dt % SECONDS_PER_DAY // SECONDS_PER_HOUR)
+        mask = masks.get(day, 0)
+        if mask & bit:
+            return False
+        masks[day] = mask | bit
+        return True
+
+    def locations(self) -> set[str]:
+        return {location for _, location in self.days} | {
+            location for _, location, _ in self.other
+        }
+
+    def contains(self, endpoint: str, location: str, dt: int) -> bool:
+        if dt % SECONDS_PER_HOUR:
+            return (endpoint, location, dt) in self.other
+        masks = self.days.get((endpoint, location))
+        if not masks:
+            return False
+        bit = 1 << (dt % SECONDS_PER_DAY // SECONDS_PER_HOUR)
+        return bool(masks.get(dt // SECONDS_PER_DAY, 0) & bit)
+
+    def replace(
+        self,
+        other: "KeyIndex",
+        start_day: int | None = None,
+        end_day: int | None = None,
+        locations: Iterable[str] | None = None,
+    ):
+        # Replaces the keys of the days and locations given, all by default, with the
+        # keys of `other`
+        replaced_locations = set(locations) if locations is not None else None
+
+        def is_replaced(location: str, day: int) -> bool:
+            return (
+                (start_day is None or day >= start_day)
+                and (end_day is None or day <= end_day)
+                and (replaced_locations is None or location in replaced_locations)
+            )
+
+        for (_, location), masks in self.days.items():
+            for day in [day for day in masks if is_replaced(location, day)]:
+                del masks[day]
+        self.other = {
+            key
+            for key in self.other
+            if not is_replaced(key[1], key[2] // SECONDS_PER_DAY)
+        }
+
+        self.update(other)
+
+    def update(self, other: "KeyIndex"):
+        # Adds the keys of `other`
+        for key, masks in other.days.items():
+            own_masks = self.days[key]
+            for day, mask in masks.items():
+                own_masks[day] = own_masks.get(day, 0) | mask
+        self.other.update(other.other)
+
+    def to_bytes(self) -> bytes:
+        # Consecutive days with the same hours are stored as one `[first day, days,
+        # hours]` run, so complete days take a single run per location
+        runs: dict[str, dict[str, list[list[int]]]] = defaultdict(dict)
+        for (endpoint, location), masks in sorted(self.days.items()):
+            location_runs: list[list[int]] = []
+            for day in sorted(masks):
+                last = location_runs[-1] if location_runs else None
+                if last and last[0] + last[1] == day and last[2] == masks[day]:
+                    last[1] += 1
+                else:
+                    location_runs.append([day, 1, masks[day]])
+            if location_runs:
+                runs[endpoint][location] = location_runs
+
+        return json.dumps(
+            {"days": runs, "other": sorted(list(key) for key in self.other)}
+        ).encode()
+
+    @classmethod
+    def from_bytes(cls, content: bytes) -> "KeyIndex":
+        index = cls()
+        data = json.loads(content)
+        for endpoint, locations in data["days"].items():
+            for location, runs in locations.items():
+                masks = index.days[(endpoint, location)]
+                for first_day, days, mask in runs:
+                    for day in range(first_day, first_day + days):
+                        masks[day] = mask
+        index.other = {
+            (endpoint, location, dt) for endpoint, location, dt in data["other"]
+        }
+        return index
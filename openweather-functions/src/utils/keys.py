@@ -0,0 +1,60 @@
+import datetime
+import zlib
+from pathlib import Path
+from typing import Iterable
+
+from src.utils.timestamp import EPOCH_ORDINAL
+from src.utils.types import ColumnName, ColumnType
+
+
+def get_key_column_types(root: bool = True) -> dict[ColumnName, ColumnType]:
+    # Typed key columns stamped by the staging layer on root tables and nested
+    # tables. Polars is imported here so ingestion does not need to load it
+    import polars as pl
+
+    if root:
+        return {"location": pl.String(), "dt": pl.Int64(), "record_id": pl.Int64()}
+    return {"parent_id": pl.Int64()}
+
+
+def location_from_path(path: str | Path) -> str:
+    # Raw files follow the `endpoint/date/city.json` layout
+    return Path(path).stem
+
+
+def partition_day_from_path(path: str | Path) -> int | None:
+    # Days since the epoch of the date partition of a raw file, None if it has none
+    try:
+        date = datetime.date.fromisoformat(Path(path).parent.name)
+    except ValueError:
+        return None
+    return date.toordinal() - EPOCH_ORDINAL
+
+
+def location_hash(location: str) -> int:
+    return zlib.crc32(location.encode()) & 0x7FFFFFFF
+
+
+def record_key(location: str, dt: int) -> int:
+    # Stable across runs and endpoints: the upper 31 bits hash the location and the
+    # lower 32 bits hold the unix time of the recording. Locations are checked with
+    # `LocationHashes`, as two locations with the same hash share their keys
+    return (location_hash(location) << 32) | dt
+
+
+class LocationHashes:
+    # Location of every hash seen, fails fast when two locations share one
+
+    def __init__(self, locations: Iterable[str] = ()) -> None:
+        self.locations: dict[int, str] = {}
+        for location in locations:
+            self.add(location)
+
+    def add(self, location: str):
+        hashed = location_hash(location)
+        seen = self.locations.setdefault(hashed, location)
+        if seen != location:
+            raise ValueError(
+                f"Locations '{seen}' and '{location}' have the same hash {hashed}, "
+                "so their record keys collide. Rename one of them"
+            )
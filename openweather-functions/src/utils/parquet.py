@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from typing import IO, TYPE_CHECKING
+
+from src.utils.types import Relation
+
+# Only loaded when writing parquet files, see `function_app.py`
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+
+@dataclass(frozen=True)
+class ParquetProfile:
+    # Layout of the parquet files written by destinations. Rows are sorted by the
+    # `sort_by` columns present in the table (i.e. `location, dt` for readings and
+    # `parent_id` for nested tables), so the min/max statistics of each row group are
+    # tight and readers filtering on them can skip row groups
+    sort_by: tuple[str, ...] = ("location", "dt", "recorded_day", "parent_id")
+    row_group_size: int = 64 * 1024  # Rows
+    compression: str = "zstd"
+    compression_level: int = 6
+    # Dictionary encoded columns, by default all the string columns. Constants of a
+    # run (i.e. `staged_id`) are then stored once per row group instead of per row
+    dictionary_columns: tuple[str, ...] | None = None
+
+
+def to_sorted_arrow(
+    df: Relation, profile: ParquetProfile
+) -> "pa.Table | pa.RecordBatchReader":
+    import pyarrow as pa
+    import polars as pl
+    from duckdb import DuckDBPyRelation
+
+    if isinstance(df, pl.DataFrame):
+        sort_by = [column for column in profile.sort_by if column in df.columns]
+        return (df.sort(sort_by) if sort_by else df).to_arrow()
+
+    if isinstance(df, DuckDBPyRelation):
+        sort_by = [column for column in profile.sort_by if column in df.columns]
+        if sort_by:
+            df = df.order(", ".join(f'"{column}"' for column in sort_by))
+        return df.to_arrow_reader(profile.row_group_size)
+
+    sort_by = [column for column in profile.sort_by if column in df.schema.names]
+    if not sort_by:
+        return df
+    if isinstance(df, pa.RecordBatchReader):
+        # Sorting needs all the batches
+        df = df.read_all()
+    return df.sort_by([(column, "ascending") for column in sort_by])
+
+
+def write_parquet(
+    df: Relation, where: "str | pa.NativeFile | IO[bytes]", profile: ParquetProfile
+) -> int:
+    # Writes row groups of `row_group_size` rows, returns the rows written
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    data = to_sorted_arrow(df, profile)
+    dictionary_columns = (
+        list(profile.dictionary_columns)
+        if profile.dictionary_columns is not None
+        else [
+            field.name
+            for field in data.schema
+            if pa.types.is_string(field.type)
+            or pa.types.is_large_string(field.type)
+            or pa.types.is_string_view(field.type)
+        ]
+    )
+
+    rows = 0
+    buffered: list[pa.RecordBatch] = []
+    buffered_rows = 0
+    with pq.ParquetWriter(
+        where,
+        data.schema,
+        compression=profile.compression,
+        compression_level=profile.compression_level,
+        use_dictionary=dictionary_columns,
+    ) as writer:
+        # Batches are buffered until they fill a row group
+        for batch in data.to_batches() if isinstance(data, pa.Table) else data:
+            buffered.append(batch)
+            buffered_rows += batch.num_rows
+            if buffered_rows >= profile.row_group_size:
+                table = pa.Table.from_batches(buffered, data.schema)
+                full_rows = buffered_rows - buffered_rows % profile.row_group_size
+                writer.write_table(table.slice(0, full_rows), profile.row_group_size)
+                buffered = table.slice(full_rows).to_batches()
+                buffered_rows -= full_rows
+                rows += full_rows
+
+        if buffered_rows:
+            writer.write_table(
+                pa.Table.from_batches(buffered, data.schema), profile.row_group_size
+            )
+            rows += buffered_rows
+    return rows
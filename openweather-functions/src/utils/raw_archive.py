@@ -0,0 +1,53 @@
+import io
+import zipfile
+from datetime import date
+from pathlib import PurePosixPath
+from typing import Generator
+
+# Compacted raw files are stored in zip archives next to the date directories of an
+# endpoint. The central directory of the zip is the index of the offset of every
+# member, which keep their `date/location.json` path:
+# - `weather/2025-12-01.zip` holds the files of a day
+# - `weather/2025-12-01_2025-12-15.zip` holds the files of a month, named after the
+#   first and last dates it holds
+ARCHIVE_SUFFIX = ".zip"
+
+
+def is_archive(path: str | PurePosixPath) -> bool:
+    return str(path).endswith(ARCHIVE_SUFFIX)
+
+
+def get_archive_dates(path: str | PurePosixPath) -> tuple[date, date] | None:
+    # First and last dates held by an archive, None if it is not an archive
+    if not is_archive(path):
+        return None
+    try:
+        dates = [date.fromisoformat(x) for x in PurePosixPath(path).stem.split("_")]
+    except ValueError:
+        return None
+    return dates[0], dates[-1]
+
+
+def get_archive_name(first_date: date, last_date: date, monthly: bool) -> str:
+    if monthly:
+        return f"{first_date.isoformat()}_{last_date.isoformat()}{ARCHIVE_SUFFIX}"
+    return first_date.isoformat() + ARCHIVE_SUFFIX
+
+
+def is_monthly_archive(path: str | PurePosixPath) -> bool:
+    return "_" in PurePosixPath(path).stem
+
+
+def pack_archive(members: dict[str, bytes]) -> bytes:
+    with io.BytesIO() as buffer:
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+            for name in sorted(members):
+                zf.writestr(name, members[name])
+        return buffer.getvalue()
+
+
+def read_archive(content: bytes) -> Generator[tuple[str, bytes], None, None]:
+    # Members in path order, as `date/location.json` relative to the endpoint
+    with zipfile.ZipFile(io.BytesIO(content)) as zf:
+        for name in sorted(zf.namelist()):
+            yield name, zf.read(name)
@@ -1,37 +1,57 @@
 import datetime
 import functools
+from typing import Any
+
+SECONDS_PER_DAY = 86_400
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+UTC = datetime.timezone.utc
+
+
+@functools.lru_cache(maxsize=4096)
+def epoch_day_to_date(epoch_day: int) -> str:
+    # Days since 1970-01-01 (UTC) as an ISO date
+    return datetime.date.fromordinal(EPOCH_ORDINAL + epoch_day).isoformat()
 
 
-@functools.total_ordering
 class Timestamp:
+    # Seconds since the epoch, in UTC. Naive datetimes and strings are read as UTC
+    __slots__ = ("unix",)
+
+    date_format = "%Y-%m-%d"
+    time_format = "%H:%M:%S"
+    format = f"{date_format} {time_format}"
 
     def __init__(
-        self,
-        value: str | float | int | datetime.datetime | datetime.date,
-        date_format: str = "%Y-%m-%d",
-        time_format: str = "%H:%M:%S",
+        self, value: "str | float | int | datetime.datetime | datetime.date | Timestamp"
     ) -> None:
-        self.format = f"{date_format} {time_format}"
-        self.date_format = date_format
-        self.time_format = time_format
-        if isinstance(value, str):
-            self.datetime = datetime.datetime.strptime(value, self.format)
-        elif isinstance(value, int):
-            self.datetime = datetime.datetime.fromtimestamp(value)
+        if isinstance(value, Timestamp):
+            self.unix = value.unix
+        elif isinstance(value, (int, float)):
+            self.unix = int(value)
+        elif isinstance(value, str):
+            self.unix = self.from_datetime(datetime.datetime.fromisoformat(value))
         elif isinstance(value, datetime.datetime):
-            self.datetime = value
+            self.unix = self.from_datetime(value)
         elif isinstance(value, datetime.date):
-            self.datetime = datetime.datetime(
-                value.year, value.month, value.day, 0, 0, 0
-            )
+            self.unix = (value.toordinal() - EPOCH_ORDINAL) * SECONDS_PER_DAY
         else:
             raise ValueError(
                 f"Cannot parse {value} of type {type(value)} as Timestamp."
             )
 
+    @staticmethod
+    def from_datetime(value: datetime.datetime) -> int:
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=UTC)
+        return int(value.timestamp())
+
+    @property
+    def epoch_day(self) -> int:
+        return self.unix // SECONDS_PER_DAY
+
     @property
-    def unix(self) -> int:
-        return int(self.datetime.timestamp())
+    def datetime(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.unix, UTC)
 
     @property
     def value(self) -> str:
@@ -39,30 +59,36 @@ class Timestamp:
 
     @property
     def date(self) -> str:
-        return self.datetime.date().strftime(self.date_format)
+        return epoch_day_to_date(self.epoch_day)
 
     def __hash__(self) -> int:
-        return hash(self.datetime)
+        return hash(self.unix)
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Timestamp):
+            return NotImplemented
+        return self.unix == other.unix
+
+    def __lt__(self, other: "Timestamp") -> bool:
+        return self.unix < other.unix
+
+    def __le__(self, other: "Timestamp") -> bool:
+        return self.unix <= other.unix
 
-    def __lt__(self, other: "Timestamp"):
-        return self.datetime.__lt__(other.datetime)
+    def __gt__(self, other: "Timestamp") -> bool:
+        return self.unix > other.unix
+
+    def __ge__(self, other: "Timestamp") -> bool:
+        return self.unix >= other.unix
 
     def __repr__(self) -> str:
-        return self.datetime.isoformat(sep=" ")
+        return self.value
 
-    def __add__(self, other: datetime.timedelta):
-        return Timestamp(self.datetime + other)
+    def __add__(self, other: "datetime.timedelta") -> "Timestamp":
+        return Timestamp(self.unix + int(other.total_seconds()))
 
-    def get_as_start(self):
-        return Timestamp(
-            datetime.datetime(
-                self.datetime.year, self.datetime.month, self.datetime.day, 0, 0, 0
-            )
-        )
+    def get_as_start(self) -> "Timestamp":
+        return Timestamp(self.epoch_day * SECONDS_PER_DAY)
 
-    def get_as_end(self):
-        return Timestamp(
-            datetime.datetime(
-                self.datetime.year, self.datetime.month, self.datetime.day, 23, 59, 59
-            )
-        )
+    def get_as_end(self) -> "Timestamp":
+        return Timestamp(self.epoch_day * SECONDS_PER_DAY + SECONDS_PER_DAY - 1)
@@ -1,5 +1,10 @@
-from polars import DataType
-from typing import TypedDict, Literal, Any
+from typing import TYPE_CHECKING, TypedDict, Literal, Any
+
+# Type aliases are evaluated lazily, so these libraries are not loaded at import time
+if TYPE_CHECKING:
+    import pyarrow as pa
+    from duckdb import DuckDBPyRelation
+    from polars import DataFrame, DataType
 
 
 class Location(TypedDict):
@@ -18,6 +23,16 @@ class EndpointConfig(TypedDict):
 type AvailableEndpoints = Literal["weather", "air_pollution"]
 
 
+class WorkItem(TypedDict):
+    # Part of an ingestion fetched by a single worker, see `src/ingest/sharding.py`
+    item_id: str
+    ingestion_id: str
+    endpoint: AvailableEndpoints
+    location: Location
+    start_date: int  # Unix seconds
+    end_date: int
+
+
 type NestedKeyPath = list[str]
 
 type DictRow = dict[str, Any]
@@ -27,6 +42,15 @@ type Batch = list[DictRow]
 type ColumnName = str
 type ColumnType = DataType
 
+# Tabular data that destinations can save as parquet
+type Relation = DataFrame | DuckDBPyRelation | pa.Table | pa.RecordBatchReader
+
+
+class StoredPath(TypedDict):
+    name: str  # Relative to the directory of the destination
+    is_directory: bool
+    size: int
+
 
 class ColumnDefinition(TypedDict):
     name: ColumnName
@@ -0,0 +1,19 @@
+import pytest
+
+from src.utils.keys import LocationHashes, record_key
+
+# Locations whose record keys collide
+COLLIDING = ("city_ke133xuc", "city_fggzfwzq")
+
+
+def test_colliding_locations_share_record_keys():
+    assert record_key(COLLIDING[0], 0) == record_key(COLLIDING[1], 0)
+
+
+def test_location_hashes_fail_on_collision():
+    with pytest.raises(ValueError, match="same hash"):
+        LocationHashes(COLLIDING)
+
+
+def test_location_hashes_accept_repeated_location():
+    LocationHashes([COLLIDING[0], COLLIDING[0], "bilbao"])
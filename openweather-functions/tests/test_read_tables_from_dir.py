@@ -0,0 +1,69 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from src.destinations.local_directory import LocalDirectory
+from src.utils.key_index import KeyIndex
+from src.utils.types import StoredPath
+
+# 2024-01-02T00:00:00Z, in the 2024-01-01 local day partition of legacy files
+DT = 1704153600
+
+
+class ListedInOrder(LocalDirectory):
+    # Reads the data files one at a time, in the order given by `reverse`
+    def __init__(self, dir: Path, reverse: bool) -> None:
+        super().__init__(dir)
+        self.reverse = reverse
+        self.set_read_concurrency(1)
+
+    def list_data_files(self, *args, **kwargs) -> list[StoredPath]:
+        files = super().list_data_files(*args, **kwargs)
+        return sorted(files, key=lambda path: path["name"], reverse=self.reverse)
+
+
+def write_raw(raw: Path, day: str, temp: float):
+    path = raw / "weather" / day / "bilbao.json"
+    path.parent.mkdir(parents=True)
+    path.write_text(json.dumps([{"dt": DT, "main": {"temp": temp}}]))
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_canonical_copy_is_staged(tmp_path: Path, reverse: bool):
+    write_raw(tmp_path, "2024-01-01", 1.0)
+    write_raw(tmp_path, "2024-01-02", 2.0)
+
+    staged_keys = KeyIndex()
+    tables = ListedInOrder(tmp_path, reverse).read_tables_from_dir(
+        "weather", "weather", staged_keys=staged_keys
+    )
+
+    rows = tables["weather"].to_polars().to_dicts()
+    assert len(rows) == 1
+    assert rows[0]["main__temp"] == "2.0"
+    assert rows[0]["path"] == str(Path("weather/2024-01-02/bilbao.json"))
+    assert staged_keys.contains("weather", "bilbao", DT)
+
+
+def test_legacy_copy_is_staged_without_canonical(tmp_path: Path):
+    write_raw(tmp_path, "2024-01-01", 1.0)
+
+    staged_keys = KeyIndex()
+    tables = ListedInOrder(tmp_path, False).read_tables_from_dir(
+        "weather", "weather", staged_keys=staged_keys
+    )
+
+    rows = tables["weather"].to_polars().to_dicts()
+    assert [row["main__temp"] for row in rows] == ["1.0"]
+    assert not staged_keys.contains("weather", "bilbao", DT)
+
+
+def test_colliding_locations_fail_staging(tmp_path: Path):
+    for location in ("city_ke133xuc", "city_fggzfwzq"):
+        path = tmp_path / "weather" / "2024-01-02" / f"{location}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps([{"dt": DT, "main": {"temp": 1.0}}]))
+
+    with pytest.raises(ValueError, match="same hash"):
+        LocalDirectory(tmp_path).read_tables_from_dir("weather", "weather")